@@ -0,0 +1 @@
+"""Componentes reutilizáveis do Analisador de Laudo AIH."""
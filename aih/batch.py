@@ -0,0 +1,237 @@
+"""
+Processamento em lote de laudos AIH (sem interface).
+
+Uso:
+    python -m aih.batch PASTA_DE_LAUDOS -o resultados.jsonl
+    python -m aih.batch PASTA_DE_LAUDOS -o resultados.csv --workers 8
+    python -m aih.batch PASTA_DE_LAUDOS -o resultados.jsonl --exportar /var/lib/aih/exportacao
+
+A saída é gravada à medida que cada documento termina. Rodar de novo com o
+mesmo arquivo de saída retoma o trabalho, pulando arquivos já processados. O
+arquivo é identificado pelo caminho absoluto (a coluna "arquivo"), então a
+pasta pode ser passada de outro jeito (./laudos, laudos, /caminho/laudos).
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+EXTENSOES_PDF = {".pdf"}
+EXTENSOES_IMAGEM = {".png", ".jpg", ".jpeg"}
+
+# Colunas fixas da saída CSV, além dos campos do laudo
+COLUNAS_META = ["arquivo", "doc_hash", "tempo_s", "nivel_ocr", "motivos_escalonamento", "erro"]
+COLUNAS_VALIDACAO = ["valido_cpf", "valido_cns", "valido_cep"]
+
+
+def listar_arquivos(pasta: Path) -> list:
+    """Lista recursivamente os PDFs e imagens da pasta, em ordem estável."""
+    extensoes = EXTENSOES_PDF | EXTENSOES_IMAGEM
+    return sorted(p for p in pasta.rglob("*") if p.is_file() and p.suffix.lower() in extensoes)
+
+
+def arquivos_ja_processados(saida: Path, log=sys.stderr) -> set:
+    """
+    Lê a saída existente e retorna os arquivos processados sem erro, como
+    caminhos absolutos. Linhas cortadas (processo morto no meio da escrita) são
+    puladas e avisadas em `log`: esses arquivos voltam a ser processados.
+    """
+    processados = set()
+    if not saida.exists():
+        return processados
+    invalidas = []
+    with open(saida, encoding="utf-8", newline="") as f:
+        if saida.suffix.lower() == ".csv":
+            # Linha cortada no CSV: as colunas que faltam vêm como None
+            linhas = ((n, linha if None not in linha.values() and None not in linha else None)
+                      for n, linha in enumerate(csv.DictReader(f), 2))
+        else:
+            linhas = ((n, _ler_linha_json(linha)) for n, linha in enumerate(f, 1) if linha.strip())
+        for n, linha in linhas:
+            if linha is None or not linha.get("arquivo"):
+                invalidas.append(n)
+            elif not linha.get("erro"):
+                # Saídas antigas podem ter caminhos relativos ao diretório atual
+                processados.add(str(Path(linha["arquivo"]).resolve()))
+    if invalidas:
+        print(f"⚠️ {saida}: {len(invalidas)} linha(s) incompleta(s) ignorada(s) "
+              f"({', '.join(map(str, invalidas[:5]))}{'...' if len(invalidas) > 5 else ''}); "
+              f"esses arquivos serão processados de novo", file=log)
+    return processados
+
+
+def _ler_linha_json(linha: str):
+    try:
+        registro = json.loads(linha)
+    except json.JSONDecodeError:
+        return None
+    return registro if isinstance(registro, dict) else None
+
+
+def processar_arquivo(caminho: str) -> dict:
+    """
+    Processa um único arquivo no worker. Nunca levanta exceção: erros são
+    devolvidos na própria linha para não derrubar o lote inteiro.
+    """
+    # Importado aqui para que cada worker carregue o próprio modelo de OCR
+    from aih.cache import hash_documento
+    from aih.pipeline import processar_documento
+
+    inicio = time.perf_counter()
+    linha = {"arquivo": caminho}
+    try:
+        file_bytes = Path(caminho).read_bytes()
+        linha["doc_hash"] = hash_documento(file_bytes)
+        is_pdf = Path(caminho).suffix.lower() in EXTENSOES_PDF
+        resultado = processar_documento(file_bytes, is_pdf)
+        linha["dados"] = resultado["dados"]
+        linha["validacoes"] = resultado["validacoes"]
+        linha["nivel_ocr"] = resultado["nivel_ocr"]
+        linha["motivos_escalonamento"] = resultado["motivos_escalonamento"]
+        linha["etapas"] = resultado["etapas"]
+    except Exception:
+        linha["erro"] = traceback.format_exc(limit=3).strip().splitlines()[-1]
+    linha["tempo_s"] = round(time.perf_counter() - inicio, 3)
+    return linha
+
+
+def configurar_worker(threads_ocr: int) -> None:
+    """
+    Cada processo tem o próprio pool de OCR: um modelo, com os núcleos divididos
+    entre os processos, para que os workers não disputem as mesmas CPUs.
+    """
+    os.environ.setdefault("AIH_OCR_MODELOS", "1")
+    os.environ.setdefault("AIH_OCR_THREADS", str(threads_ocr))
+
+
+def _termina_sem_quebra(caminho: Path) -> bool:
+    with open(caminho, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+class EscritorResultados:
+    """Grava linhas em JSONL ou CSV (conforme a extensão), com flush imediato."""
+
+    def __init__(self, saida: Path):
+        from aih.pipeline import CAMPOS_LAUDO
+
+        self.csv = saida.suffix.lower() == ".csv"
+        novo = not saida.exists() or saida.stat().st_size == 0
+        # Uma linha cortada no fim do arquivo não pode emendar na próxima
+        cortada = not novo and _termina_sem_quebra(saida)
+        self._f = open(saida, "a", encoding="utf-8", newline="")
+        if cortada:
+            self._f.write("\n" if not self.csv else "\r\n")
+        if self.csv:
+            colunas = COLUNAS_META + CAMPOS_LAUDO + COLUNAS_VALIDACAO
+            self._writer = csv.DictWriter(self._f, fieldnames=colunas, extrasaction="ignore")
+            if novo:
+                self._writer.writeheader()
+
+    def escrever(self, linha: dict) -> None:
+        if self.csv:
+            plana = {k: v for k, v in linha.items() if k not in ("dados", "validacoes")}
+            plana["motivos_escalonamento"] = ";".join(linha.get("motivos_escalonamento", []))
+            plana.update(linha.get("dados", {}))
+            for campo, valido in linha.get("validacoes", {}).items():
+                plana[f"valido_{campo}"] = valido
+            self._writer.writerow(plana)
+        else:
+            self._f.write(json.dumps(linha, ensure_ascii=False) + "\n")
+        self._f.flush()
+
+    def close(self) -> None:
+        self._f.close()
+
+
+def executar_lote(pasta: Path, saida: Path, workers: int = None, metricas: Path = None,
+                  log=sys.stderr, exportacao: Path = None) -> dict:
+    """
+    Processa todos os laudos da pasta em paralelo e grava os resultados
+    conforme terminam. Retorna um resumo com contagens e docs/s.
+    Se `metricas` for informado, grava ali os tempos por etapa (formato Prometheus).
+    Se `exportacao` for informada, os laudos também entram na exportação contínua
+    dessa pasta (aih.exportacao), sem duplicar os já exportados.
+    """
+    from aih import metrics
+    from aih.exportacao import ExportadorResultados
+
+    arquivos = [str(p) for p in listar_arquivos(pasta.resolve())]
+    feitos = arquivos_ja_processados(saida, log)
+    pendentes = [a for a in arquivos if a not in feitos]
+    print(f"📂 {len(arquivos)} arquivos, {len(arquivos) - len(pendentes)} já processados, "
+          f"{len(pendentes)} pendentes", file=log)
+
+    resumo = {"total": len(pendentes), "ok": 0, "erros": 0, "docs_por_s": 0.0}
+    if not pendentes:
+        return resumo
+
+    escritor = EscritorResultados(saida)
+    exportador = ExportadorResultados(exportacao) if exportacao else None
+    inicio = time.perf_counter()
+    try:
+        processos = workers or os.cpu_count() or 1
+        threads_ocr = max(1, (os.cpu_count() or 1) // processos)
+        with ProcessPoolExecutor(max_workers=workers, initializer=configurar_worker,
+                                 initargs=(threads_ocr,)) as executor:
+            futuros = [executor.submit(processar_arquivo, a) for a in pendentes]
+            for i, futuro in enumerate(as_completed(futuros), 1):
+                linha = futuro.result()
+                # Os tempos medidos no worker são agregados neste processo
+                etapas = linha.pop("etapas", [])
+                metrics.registrar_rastro(etapas)
+                escritor.escrever(linha)
+                if exportador and not linha.get("erro"):
+                    try:
+                        exportador.adicionar(linha["doc_hash"], {**linha, "etapas": etapas}, linha["arquivo"])
+                    except Exception as e:
+                        # Uma falha na exportação não pode interromper o lote
+                        print(f"⚠️ Exportação de {linha['arquivo']}: {type(e).__name__}: {e}", file=log)
+                resumo["erros" if linha.get("erro") else "ok"] += 1
+                decorrido = time.perf_counter() - inicio
+                print(f"[{i}/{len(pendentes)}] {linha['arquivo']} "
+                      f"({linha['tempo_s']:.2f}s) - {i / decorrido:.2f} docs/s", file=log)
+    finally:
+        escritor.close()
+        if exportador:
+            try:
+                exportador.close()
+            except Exception as e:
+                # Não esconde a exceção do lote nem o resumo
+                print(f"⚠️ Exportação: falha ao gravar a última parte ({type(e).__name__}: {e})", file=log)
+        if metricas:
+            metrics.escrever_arquivo(str(metricas))
+
+    resumo["docs_por_s"] = round(len(pendentes) / (time.perf_counter() - inicio), 3)
+    print(f"✅ {resumo['ok']} ok, {resumo['erros']} com erro - {resumo['docs_por_s']} docs/s", file=log)
+    return resumo
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Processa uma pasta de laudos AIH em lote.")
+    parser.add_argument("pasta", type=Path, help="pasta com PDFs e imagens (busca recursiva)")
+    parser.add_argument("-o", "--saida", type=Path, required=True,
+                        help="arquivo de saída .jsonl ou .csv (retomável)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="número de processos (padrão: número de CPUs)")
+    parser.add_argument("--metricas", type=Path,
+                        help="grava os tempos por etapa neste arquivo (formato Prometheus)")
+    parser.add_argument("--exportar", type=Path,
+                        help="pasta da exportação contínua em Parquet/CSV (aih.exportacao)")
+    args = parser.parse_args(argv)
+
+    if not args.pasta.is_dir():
+        parser.error(f"pasta não encontrada: {args.pasta}")
+
+    resumo = executar_lote(args.pasta, args.saida, args.workers, args.metricas, exportacao=args.exportar)
+    return 1 if resumo["erros"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
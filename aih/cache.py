@@ -0,0 +1,90 @@
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Versão do pipeline de extração. Altere sempre que uma mudança no
+# pré-processamento, OCR ou parsers alterar o resultado de um documento,
+# para que resultados antigos em cache não sejam reaproveitados.
+PIPELINE_VERSION = "2.12"
+
+# Limite padrão de memória do cache (64 MB)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def hash_documento(file_bytes: bytes) -> str:
+    """SHA-256 do conteúdo do arquivo."""
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+def chave_documento(doc_hash: str, versao: str = PIPELINE_VERSION) -> str:
+    """Gera a chave do cache: SHA-256 do conteúdo + versão do pipeline."""
+    return f"{doc_hash}:{versao}"
+
+
+def estimar_tamanho(obj) -> int:
+    """
+    Estima o tamanho em bytes de um resultado de extração.
+    Considera apenas o conteúdo (strings, números, coleções), o que é
+    suficiente para limitar o cache pelo volume de texto armazenado.
+    """
+    if isinstance(obj, (str, bytes)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(estimar_tamanho(k) + estimar_tamanho(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set)):
+        return sum(estimar_tamanho(item) for item in obj)
+    return 8
+
+
+class ResultCache:
+    """
+    Cache LRU em memória para resultados de extração, limitado por tamanho.
+    É thread-safe para ser compartilhado entre todas as sessões do processo.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave: str):
+        """Retorna uma cópia do resultado em cache ou None."""
+        with self._lock:
+            entry = self._entries.get(chave)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(chave)
+            self.hits += 1
+            # Cópia para que alterações na sessão não contaminem o cache
+            return copy.deepcopy(entry[0])
+
+    def put(self, chave: str, resultado: dict) -> None:
+        """Armazena um resultado, removendo os menos usados se necessário."""
+        tamanho = estimar_tamanho(resultado)
+        if tamanho > self.max_bytes:
+            return
+        with self._lock:
+            antigo = self._entries.pop(chave, None)
+            if antigo is not None:
+                self.total_bytes -= antigo[1]
+            self._entries[chave] = (copy.deepcopy(resultado), tamanho)
+            self.total_bytes += tamanho
+            while self.total_bytes > self.max_bytes:
+                _, (_, tamanho_removido) = self._entries.popitem(last=False)
+                self.total_bytes -= tamanho_removido
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, chave: str) -> bool:
+        return chave in self._entries
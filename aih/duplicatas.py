@@ -0,0 +1,315 @@
+"""
+Reaproveitamento de laudos fotografados de novo (quase-duplicatas).
+
+É comum a mesma folha ser fotografada duas ou três vezes (foto tremida, outro
+ângulo, outra sessão). O SHA-256 do arquivo (aih.cache) não reconhece essas
+repetições, e cada foto pagaria o OCR inteiro outra vez. Aqui cada foto ganha
+uma impressão digital da página já localizada e retificada, e um índice em
+memória encontra a foto anterior da mesma folha antes do OCR.
+
+O hash perceptual da página inteira (pHash/dHash) não serve: o formulário
+impresso é o mesmo em todos os laudos e domina a imagem, então laudos de
+pacientes diferentes dão distância zero. A impressão usa só as caixas de valor
+dos campos de identificação medidas no formulário (layout.caixas_campos), em
+duas partes:
+
+- bits: a caixa binarizada é dividida em células de CELULA_PT pontos na
+  horizontal, e cada célula vira 1 bit (tem tinta ou não). ~560 bits por laudo,
+  comparados pela distância de Hamming numa árvore BK, que só visita os ramos
+  que podem estar dentro do raio;
+- recortes: as caixas em cinza, pequenas, para conferir os candidatos da
+  árvore por correlação (cv2.matchTemplate, com folga para o desalinhamento).
+  Os bits não distinguem dois nomes do mesmo tamanho; a correlação distingue.
+
+Só é duplicata o candidato com distância até AIH_DUPLICATAS_DISTANCIA bits e
+correlação mínima (pior campo) de AIH_DUPLICATAS_SEMELHANCA. Mesmo assim, a
+impressão sozinha não basta para dizer que é o mesmo paciente: antes de
+reaproveitar ou mesclar qualquer campo, o CNS (ou CPF) é lido da caixa dele na
+página nova, só com o reconhecedor (sem detecção), e tem de ser igual ao do
+resultado guardado (mesmo_paciente). Ativado por AIH_DUPLICATAS=1.
+"""
+from __future__ import annotations
+
+import copy
+import os
+import threading
+from collections import OrderedDict
+
+from aih import layout
+from aih.sob_demanda import sob_demanda
+
+cv2 = sob_demanda("cv2")
+np = sob_demanda("numpy")
+
+# Ativado por AIH_DUPLICATAS=1
+DUPLICATAS = os.environ.get("AIH_DUPLICATAS") == "1"
+# Raio da busca na árvore (bits diferentes). Fotos da mesma folha ficam até ~37 (as
+# borradas); as faixas se sobrepõem com as de outros pacientes, daí a correlação e o CNS
+DISTANCIA_MAXIMA = int(os.environ.get("AIH_DUPLICATAS_DISTANCIA") or 40)
+# Correlação mínima, no pior campo, para aceitar o candidato (mesma folha ≥ 0,84;
+# outro paciente chega a ~0,80, e quem separa de vez é o CNS)
+SEMELHANCA_MINIMA = float(os.environ.get("AIH_DUPLICATAS_SEMELHANCA") or 0.80)
+# Laudos guardados no índice; os mais antigos saem primeiro (~40 KB de recortes por foto)
+MAX_ENTRADAS = int(os.environ.get("AIH_DUPLICATAS_MAX") or 500)
+# Impressões guardadas por laudo (as últimas fotos confirmadas da mesma folha): uma
+# folha fotografada de novo muitas vezes não cresce a árvore nem a memória sem limite
+MAX_IMPRESSOES = int(os.environ.get("AIH_DUPLICATAS_IMPRESSOES") or 4)
+# Completar os campos que faltam numa nova extração com os da foto anterior
+MESCLAR = os.environ.get("AIH_DUPLICATAS_MESCLAR") != "0"
+
+# Campos que identificam o laudo (os do procedimento se repetem entre pacientes)
+CAMPOS_IMPRESSAO = ["nome_paciente", "cartao_sus", "data_nascimento", "nome_genitora", "prontuario",
+                    "endereco_completo"]
+# Identificadores que confirmam o paciente antes do reaproveitamento (os que o modelo tiver)
+IDENTIFICADORES = ["cartao_sus", "cpf"]
+# Folga dos recortes dos identificadores, em pontos (à esquerda fica o rótulo)
+FOLGA_IDENTIFICADOR_PT = 2.0
+# Os 15 dígitos do CNS ficam apertados na caixa: o reconhecedor reduz o recorte à
+# altura de entrada dele e perde dígitos repetidos. Esticado na horizontal, não perde
+ESTICAR_IDENTIFICADOR = 2.0
+# Largura da célula de cada bit, em pontos PDF, e fração de tinta para o bit valer 1
+CELULA_PT = 2.0
+LIMIAR_TINTA = 0.03
+# Resolução dos recortes guardados (pixels por ponto PDF) e folga da comparação
+ESCALA_RECORTE = 1.5
+FOLGA_PT = 4
+
+
+def distancia(a: int, b: int) -> int:
+    """Distância de Hamming entre duas impressões (bits num int)."""
+    return bin(a ^ b).count("1")
+
+
+class Impressao:
+    """Impressão digital de um laudo: bits para a árvore e recortes para conferir."""
+    __slots__ = ("bits", "n_bits", "recortes")
+
+    def __init__(self, bits: int, n_bits: int, recortes: dict):
+        self.bits = bits
+        self.n_bits = n_bits
+        self.recortes = recortes
+
+
+def _caixas_em_pixels(pagina, folga: float = 0.0, campos=None, folga_esquerda: float = None):
+    """(campo, recorte da caixa, largura e altura da caixa em pontos) para cada campo."""
+    h, w = pagina.shape[:2]
+    sx, sy = w / layout.LARGURA_MODELO, h / layout.ALTURA_MODELO
+    esquerda = folga if folga_esquerda is None else folga_esquerda
+    for campo, (x0, y0, x1, y1) in layout.caixas_campos(campos or CAMPOS_IMPRESSAO).items():
+        x0, y0, x1, y1 = x0 - esquerda, y0 - folga, x1 + folga, y1 + folga
+        recorte = pagina[max(0, int(y0 * sy)):int(y1 * sy), max(0, int(x0 * sx)):int(x1 * sx)]
+        yield campo, recorte, x1 - x0, y1 - y0
+
+
+def _redimensionar(recorte, largura_pt: float, altura_pt: float):
+    tamanho = (max(1, round(largura_pt * ESCALA_RECORTE)), max(1, round(altura_pt * ESCALA_RECORTE)))
+    return cv2.resize(recorte, tamanho, interpolation=cv2.INTER_AREA)
+
+
+def calcular_impressao(pagina) -> Impressao:
+    """
+    Impressão da página em cinza já recortada e retificada para a proporção do
+    modelo (veja pipeline.pagina_normalizada).
+    """
+    tinta = cv2.adaptiveThreshold(pagina, 1, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 31, 15)
+    bits = []
+    for _, recorte, largura_pt, _ in _caixas_em_pixels(tinta):
+        celulas = max(2, int(largura_pt / CELULA_PT))
+        ocupacao = cv2.resize(recorte.astype(np.float32), (celulas, 1), interpolation=cv2.INTER_AREA)
+        bits.append(ocupacao.ravel() > LIMIAR_TINTA)
+    bits = np.concatenate(bits)
+    recortes = {campo: _redimensionar(recorte, largura_pt, altura_pt)
+                for campo, recorte, largura_pt, altura_pt in _caixas_em_pixels(pagina)}
+    return Impressao(int.from_bytes(np.packbits(bits).tobytes(), "big"), bits.size, recortes)
+
+
+def semelhanca(pagina_nova, anterior: Impressao) -> float:
+    """
+    Correlação normalizada do pior campo entre os recortes da impressão anterior
+    e as caixas da página nova, procuradas com FOLGA_PT pontos de folga.
+    """
+    pior = 1.0
+    for campo, recorte, largura_pt, altura_pt in _caixas_em_pixels(pagina_nova, FOLGA_PT):
+        modelo = anterior.recortes.get(campo)
+        if modelo is None:
+            return 0.0
+        area = _redimensionar(recorte, largura_pt, altura_pt)
+        if area.shape[0] < modelo.shape[0] or area.shape[1] < modelo.shape[1]:
+            return 0.0
+        pior = min(pior, float(cv2.matchTemplate(area, modelo, cv2.TM_CCOEFF_NORMED).max()))
+    return pior
+
+
+def ler_identificadores(pagina, reconhecer) -> dict:
+    """
+    CNS/CPF lidos das caixas deles na página normalizada: campo → dígitos, só os
+    que saírem com o tamanho certo. `reconhecer(recortes) -> [texto]` roda só o
+    reconhecedor do OCR, sem detecção.
+    """
+    caixas = list(_caixas_em_pixels(pagina, FOLGA_IDENTIFICADOR_PT, IDENTIFICADORES, folga_esquerda=0.0))
+    if not caixas:
+        return {}
+    textos = reconhecer([cv2.resize(recorte, None, fx=ESTICAR_IDENTIFICADOR, fy=1.0,
+                                    interpolation=cv2.INTER_CUBIC) for _, recorte, _, _ in caixas])
+    lidos = {}
+    for (campo, *_), texto in zip(caixas, textos):
+        valor = layout.pos_processar_campo(campo, texto or "")
+        if valor:
+            lidos[campo] = valor
+    return lidos
+
+
+def mesmo_paciente(lidos: dict, dados: dict) -> bool:
+    """
+    Se os identificadores lidos da foto nova confirmam o paciente do resultado
+    guardado: pelo menos um igual e nenhum diferente. Sem nenhum para comparar
+    (ilegível na foto ou ausente no resultado), não confirma.
+    """
+    iguais = False
+    for campo, valor in lidos.items():
+        guardado = "".join(c for c in str(dados.get(campo) or "") if c.isdigit())
+        if not guardado:
+            continue
+        if guardado != valor:
+            return False
+        iguais = True
+    return iguais
+
+
+class ArvoreBK:
+    """
+    Árvore BK pela distância de Hamming. Cada nó guarda (bits, valor) e os filhos
+    pela distância até ele; na busca, a desigualdade triangular descarta os
+    filhos fora de [d - raio, d + raio]. Não é thread-safe (o índice protege).
+    """
+
+    def __init__(self):
+        self._raiz = None
+        self._tamanho = 0
+
+    def __len__(self) -> int:
+        return self._tamanho
+
+    def inserir(self, bits: int, valor) -> None:
+        self._tamanho += 1
+        if self._raiz is None:
+            self._raiz = (bits, valor, {})
+            return
+        no = self._raiz
+        while True:
+            d = distancia(bits, no[0])
+            filho = no[2].get(d)
+            if filho is None:
+                no[2][d] = (bits, valor, {})
+                return
+            no = filho
+
+    def buscar(self, bits: int, raio: int) -> list:
+        """[(distância, valor)] dos nós a até `raio` bits, do mais próximo ao mais distante."""
+        encontrados = []
+        pilha = [self._raiz] if self._raiz is not None else []
+        while pilha:
+            no_bits, valor, filhos = pilha.pop()
+            d = distancia(bits, no_bits)
+            if d <= raio:
+                encontrados.append((d, valor))
+            pilha.extend(filho for dist, filho in filhos.items() if d - raio <= dist <= d + raio)
+        encontrados.sort(key=lambda item: item[0])
+        return encontrados
+
+
+class _Entrada:
+    __slots__ = ("impressoes", "resultado")
+
+    def __init__(self, impressao: Impressao, resultado: dict):
+        self.impressoes = [impressao]
+        self.resultado = resultado
+
+
+class IndiceDuplicatas:
+    """
+    Índice das impressões de laudos já extraídos, compartilhado entre as sessões.
+    Guarda no máximo `max_entradas` laudos, cada um com as últimas
+    `max_impressoes` impressões; quando passa de um dos limites, descarta as
+    mais antigas e reconstrói a árvore (a árvore BK não tem remoção).
+    """
+
+    def __init__(self, distancia_maxima: int = None, semelhanca_minima: float = None,
+                 max_entradas: int = None, max_impressoes: int = None):
+        self.distancia_maxima = DISTANCIA_MAXIMA if distancia_maxima is None else distancia_maxima
+        self.semelhanca_minima = SEMELHANCA_MINIMA if semelhanca_minima is None else semelhanca_minima
+        self.max_entradas = max_entradas or MAX_ENTRADAS
+        self.max_impressoes = max_impressoes or MAX_IMPRESSOES
+        self.encontradas = 0
+        self.novas = 0
+        self._entradas = OrderedDict()
+        self._arvore = ArvoreBK()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    def procurar(self, impressao: Impressao, pagina):
+        """
+        Laudo já extraído da mesma folha, ou None. Retorna (entrada, distância,
+        semelhança); o resultado da entrada sai com resultado(entrada).
+        """
+        with self._lock:
+            candidatos = self._arvore.buscar(impressao.bits, self.distancia_maxima)
+        for d, (entrada, anterior) in candidatos:
+            s = semelhanca(pagina, anterior)
+            if s >= self.semelhanca_minima:
+                with self._lock:
+                    self.encontradas += 1
+                    if id(entrada) in self._entradas:
+                        self._entradas.move_to_end(id(entrada))
+                return entrada, d, s
+        return None
+
+    def resultado(self, entrada) -> dict:
+        """Cópia do resultado guardado, para a sessão não alterar o índice."""
+        with self._lock:
+            return copy.deepcopy(entrada.resultado)
+
+    def registrar(self, impressao: Impressao, resultado: dict, entrada=None) -> None:
+        """
+        Guarda o resultado de uma extração. Com `entrada` (a foto anterior da
+        mesma folha), a impressão nova passa a apontar para ela e o resultado
+        dela é substituído pelo novo; se ela já tinha `max_impressoes`
+        impressões, a mais antiga sai.
+        """
+        resultado = copy.deepcopy(resultado)
+        with self._lock:
+            if entrada is None or id(entrada) not in self._entradas:
+                entrada = _Entrada(impressao, resultado)
+                self._entradas[id(entrada)] = entrada
+                self.novas += 1
+            else:
+                entrada.impressoes.append(impressao)
+                entrada.resultado = resultado
+                self._entradas.move_to_end(id(entrada))
+                if len(entrada.impressoes) > self.max_impressoes:
+                    del entrada.impressoes[:-self.max_impressoes]
+                    self._reconstruir()
+                    return
+            self._arvore.inserir(impressao.bits, (entrada, impressao))
+            if len(self._entradas) > self.max_entradas:
+                self._descartar_antigas()
+
+    def _descartar_antigas(self) -> None:
+        """Remove o quarto mais antigo das entradas e reconstrói a árvore. Chamar com o lock."""
+        for _ in range(max(1, len(self._entradas) // 4)):
+            self._entradas.popitem(last=False)
+        self._reconstruir()
+
+    def _reconstruir(self) -> None:
+        """Refaz a árvore com as impressões guardadas nas entradas. Chamar com o lock."""
+        self._arvore = ArvoreBK()
+        for entrada in self._entradas.values():
+            for impressao in entrada.impressoes:
+                self._arvore.inserir(impressao.bits, (entrada, impressao))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+            self._arvore = ArvoreBK()
@@ -0,0 +1,395 @@
+"""
+Exportação contínua dos laudos processados, em colunas (Parquet ou CSV).
+
+Uso:
+    exportador = ExportadorResultados("/var/lib/aih/exportacao")
+    exportador.adicionar(doc_hash, resultado, arquivo="laudo.pdf")
+    ...
+    exportador.close()
+
+    python -m aih.exportacao /var/lib/aih/exportacao -o faturamento.csv
+
+Cada laudo vira uma linha com os campos extraídos, os códigos, as validações e
+os tempos. As linhas ficam num buffer de até AIH_EXPORT_LINHAS linhas e são
+gravadas juntas numa "parte" nova da pasta: um arquivo Parquet com um row group
+(ou um CSV, sem o pyarrow instalado ou com AIH_EXPORT_FORMATO=csv). Uma parte
+gravada nunca é reescrita; o arquivo só aparece com o nome final depois de
+completo, então um processo interrompido não deixa parte corrompida.
+
+Um índice SQLite na pasta (indice.sqlite) identifica o laudo pelo hash do
+documento: reenviar o mesmo arquivo grava uma nova versão da linha. Um
+documento novo só é tratado como revisão de um laudo já exportado quando o
+paciente (CNS válido, senão CPF válido), o código do procedimento e a data do
+laudo são todos conhecidos e iguais; sem procedimento ou sem data, cada
+documento é um laudo próprio (dois laudos do mesmo paciente nunca se
+sobrescrevem). ler_exportacao() devolve só a versão atual de cada laudo, parte
+por parte. A memória fica limitada ao buffer e a uma parte, qualquer que seja
+o tamanho da exportação. Várias réplicas podem gravar na mesma pasta (o índice
+usa WAL, como o ExtractionStore).
+"""
+from __future__ import annotations
+
+import argparse
+import atexit
+import csv
+import importlib.util
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+from aih.cache import PIPELINE_VERSION
+from aih.pipeline import CAMPOS_LAUDO
+from aih.sob_demanda import sob_demanda
+
+pa = sob_demanda("pyarrow")
+pq = sob_demanda("pyarrow.parquet")
+
+# "parquet" ou "csv"; sem valor, Parquet se o pyarrow estiver instalado
+FORMATO = os.environ.get("AIH_EXPORT_FORMATO") or (
+    "parquet" if importlib.util.find_spec("pyarrow") else "csv")
+# Linhas por parte (row group); o buffer em memória nunca passa disso
+LINHAS_POR_GRUPO = int(os.environ.get("AIH_EXPORT_LINHAS") or 256)
+# Prazo máximo de uma linha no buffer antes de gravar a parte, em segundos
+# (uma thread do exportador grava a parte no prazo, mesmo sem novos resultados)
+INTERVALO_S = float(os.environ.get("AIH_EXPORT_INTERVALO_S") or 60)
+
+COLUNAS_META = ["registro", "versao_registro", "doc_hash", "arquivo", "exportado_em",
+                "versao_pipeline", "nivel_ocr", "motivos_escalonamento", "tempo_s", "tempo_ocr_s",
+                "data_laudo"]
+COLUNAS_VALIDACAO = ["valido_cpf", "valido_cns", "valido_cep"]
+COLUNAS = COLUNAS_META + CAMPOS_LAUDO + COLUNAS_VALIDACAO
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS registros (
+    registro TEXT PRIMARY KEY,
+    paciente TEXT,
+    procedimento TEXT NOT NULL,
+    data_laudo TEXT,
+    versao INTEGER NOT NULL,
+    parte TEXT NOT NULL,
+    linha INTEGER NOT NULL,
+    atualizado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_registros_parte ON registros (parte);
+CREATE TABLE IF NOT EXISTS documentos (
+    doc_hash TEXT PRIMARY KEY,
+    registro TEXT NOT NULL
+);
+"""
+
+# Índices que dependem de colunas acrescentadas depois da primeira versão do
+# esquema: criados só depois de migrar um indice.sqlite antigo
+INDICES = """
+CREATE INDEX IF NOT EXISTS idx_registros_revisao ON registros (paciente, procedimento, data_laudo);
+"""
+
+
+def _tipo_coluna(coluna: str):
+    if coluna in COLUNAS_VALIDACAO:
+        return pa.bool_()
+    if coluna in ("tempo_s", "tempo_ocr_s", "exportado_em"):
+        return pa.float64()
+    if coluna == "versao_registro":
+        return pa.int64()
+    return pa.string()
+
+
+def schema_parquet():
+    return pa.schema([(coluna, _tipo_coluna(coluna)) for coluna in COLUNAS])
+
+
+def identificador_paciente(dados: dict, validacoes: dict) -> str | None:
+    """CNS válido, senão CPF válido, só com dígitos; None se nenhum validou."""
+    for campo, validacao in (("cartao_sus", "cns"), ("cpf", "cpf")):
+        if validacoes.get(validacao) and dados.get(campo):
+            return f"{validacao}:{''.join(c for c in dados[campo] if c.isdigit())}"
+    return None
+
+
+def chave_revisao(paciente: str | None, procedimento: str | None, data_laudo: str | None):
+    """
+    (paciente, procedimento, data do laudo) quando os três são conhecidos; None
+    se falta algum, e aí o documento nunca é tomado por revisão de outro.
+    """
+    if paciente and procedimento and data_laudo:
+        return paciente, procedimento, data_laudo
+    return None
+
+
+def linha_exportacao(doc_hash: str, resultado: dict, arquivo: str = None) -> dict:
+    """Linha plana de um resultado de processar_documento (sem registro e versão)."""
+    dados, validacoes = resultado.get("dados", {}), resultado.get("validacoes", {})
+    etapas = resultado.get("etapas", [])
+    linha = {
+        "doc_hash": doc_hash,
+        "arquivo": arquivo,
+        "exportado_em": time.time(),
+        "versao_pipeline": PIPELINE_VERSION,
+        "nivel_ocr": resultado.get("nivel_ocr"),
+        "motivos_escalonamento": ";".join(resultado.get("motivos_escalonamento", [])),
+        "tempo_s": next((e["wall_s"] for e in etapas if e["etapa"] == "documento"), None),
+        "tempo_ocr_s": sum(e["wall_s"] for e in etapas if e["etapa"] == "ocr") if etapas else None,
+        "data_laudo": dados.get("data_laudo") or None,
+    }
+    for campo in CAMPOS_LAUDO:
+        valor = dados.get(campo)
+        linha[campo] = None if valor in (None, "") else str(valor)
+    for campo in ("cpf", "cns", "cep"):
+        linha[f"valido_{campo}"] = validacoes.get(campo)
+    return linha
+
+
+class _Pendente:
+    __slots__ = ("linha", "paciente", "procedimento", "revisao", "hashes")
+
+    def __init__(self, linha: dict, paciente: str | None):
+        self.linha = linha
+        self.paciente = paciente
+        self.procedimento = linha.get("codigo_procedimento") or ""
+        self.revisao = chave_revisao(paciente, self.procedimento, linha.get("data_laudo"))
+        # Hashes dos documentos que esta linha substituiu no buffer, para o índice
+        self.hashes = {linha["doc_hash"]}
+
+
+class ExportadorResultados:
+    """
+    Grava os resultados numa pasta de partes Parquet/CSV, sem duplicar laudos.
+    Thread-safe; o buffer é gravado ao chegar a `linhas_por_grupo` linhas, em
+    flush(), no close() (também chamado na saída do processo) e, por uma thread
+    daemon, quando a linha mais antiga passa de `intervalo_s` segundos (com
+    intervalo_s infinito, a thread não é criada).
+    """
+
+    def __init__(self, pasta, formato: str = None, linhas_por_grupo: int = None,
+                 intervalo_s: float = None):
+        self.pasta = Path(pasta)
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        self.formato = formato or FORMATO
+        if self.formato not in ("parquet", "csv"):
+            raise ValueError(f"formato de exportação desconhecido: {self.formato}")
+        self.linhas_por_grupo = linhas_por_grupo or LINHAS_POR_GRUPO
+        self.intervalo_s = INTERVALO_S if intervalo_s is None else intervalo_s
+        self.partes = 0
+        self.linhas = 0
+        self._pendentes = {}
+        self._primeira_pendente = None
+        self._lock = threading.Lock()
+        # Acorda a thread do prazo quando o buffer recebe a primeira linha ou no close()
+        self._mudou = threading.Condition(self._lock)
+        self._conn = sqlite3.connect(self.pasta / "indice.sqlite", timeout=30,
+                                     check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrar()
+        self._prazo = None
+        if self.intervalo_s != float("inf"):
+            self._prazo = threading.Thread(target=self._vigiar_prazo, name="aih-exportacao-prazo",
+                                           daemon=True)
+            self._prazo.start()
+        atexit.register(self.close)
+
+    def _migrar(self) -> None:
+        """Acrescenta ao índice de uma versão anterior as colunas que faltam."""
+        colunas = {linha[1] for linha in self._conn.execute("PRAGMA table_info(registros)")}
+        if "data_laudo" not in colunas:
+            try:
+                self._conn.execute("ALTER TABLE registros ADD COLUMN data_laudo TEXT")
+            except sqlite3.OperationalError:
+                # Outra réplica migrou entre a consulta e o ALTER
+                pass
+        self._conn.executescript(INDICES)
+
+    def _vigiar_prazo(self) -> None:
+        """Grava a parte quando a linha mais antiga do buffer vence o prazo."""
+        with self._lock:
+            while self._conn is not None:
+                if self._primeira_pendente is None:
+                    self._mudou.wait()
+                    continue
+                restante = self._primeira_pendente + self.intervalo_s - time.monotonic()
+                if restante > 0:
+                    self._mudou.wait(restante)
+                    continue
+                try:
+                    self._gravar_parte()
+                except Exception as e:
+                    # As linhas continuam no buffer; tenta de novo no próximo prazo
+                    print(f"⚠️ Exportação: falha ao gravar a parte ({type(e).__name__}: {e})",
+                          file=sys.stderr)
+                    self._primeira_pendente = time.monotonic()
+
+    def adicionar(self, doc_hash: str, resultado: dict, arquivo: str = None) -> None:
+        """Enfileira o resultado de um documento para a próxima parte."""
+        linha = linha_exportacao(doc_hash, resultado, arquivo)
+        paciente = identificador_paciente(resultado.get("dados", {}), resultado.get("validacoes", {}))
+        pendente = _Pendente(linha, paciente)
+        with self._lock:
+            # Mesmo documento, ou revisão do mesmo laudo, no buffer: a linha nova substitui a pendente
+            chave = next((c for c, p in self._pendentes.items()
+                          if doc_hash in p.hashes
+                          or (pendente.revisao is not None and p.revisao == pendente.revisao)),
+                         doc_hash)
+            substituida = self._pendentes.pop(chave, None)
+            if substituida is not None:
+                pendente.hashes |= substituida.hashes
+            self._pendentes[chave] = pendente
+            if self._primeira_pendente is None:
+                self._primeira_pendente = time.monotonic()
+                self._mudou.notify_all()
+            if len(self._pendentes) >= self.linhas_por_grupo:
+                self._gravar_parte()
+
+    def flush(self) -> int:
+        """Grava as linhas pendentes numa parte; retorna quantas foram gravadas."""
+        with self._lock:
+            return self._gravar_parte()
+
+    def _resolver_registro(self, pendente: _Pendente) -> tuple:
+        """(registro, versão) da linha: o laudo já exportado, ou um registro novo."""
+        doc_hash = pendente.linha["doc_hash"]
+        row = self._conn.execute(
+            "SELECT r.registro, r.versao FROM documentos d JOIN registros r USING (registro) "
+            "WHERE d.doc_hash = ?", (doc_hash,)).fetchone()
+        if row is None and pendente.revisao is not None:
+            row = self._conn.execute(
+                "SELECT registro, versao FROM registros "
+                "WHERE paciente = ? AND procedimento = ? AND data_laudo = ?",
+                pendente.revisao).fetchone()
+        if row is None:
+            return doc_hash, 1
+        return row[0], row[1] + 1
+
+    def _gravar_parte(self) -> int:
+        """Grava o buffer numa parte e atualiza o índice. Chamar com o lock."""
+        pendentes = list(self._pendentes.values())
+        if not pendentes:
+            return 0
+        nome = f"parte-{time.time_ns()}-{os.getpid()}.{self.formato}"
+        # BEGIN IMMEDIATE: outra réplica não resolve os mesmos laudos ao mesmo tempo
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            agora = time.time()
+            linhas = []
+            for posicao, pendente in enumerate(pendentes):
+                registro, versao = self._resolver_registro(pendente)
+                linhas.append({**pendente.linha, "registro": registro, "versao_registro": versao})
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO registros "
+                    "(registro, paciente, procedimento, data_laudo, versao, parte, linha, atualizado_em) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (registro, pendente.paciente, pendente.procedimento, pendente.linha["data_laudo"],
+                     versao, nome, posicao, agora))
+                self._conn.executemany("INSERT OR REPLACE INTO documentos (doc_hash, registro) VALUES (?, ?)",
+                                       [(doc_hash, registro) for doc_hash in pendente.hashes])
+            self._escrever(self.pasta / nome, linhas)
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._pendentes.clear()
+        self._primeira_pendente = None
+        self.partes += 1
+        self.linhas += len(linhas)
+        return len(linhas)
+
+    def _escrever(self, caminho: Path, linhas: list) -> None:
+        tmp = caminho.with_name(f".{caminho.name}.tmp")
+        if self.formato == "parquet":
+            tabela = pa.Table.from_pylist(linhas, schema=schema_parquet())
+            pq.write_table(tabela, tmp, row_group_size=len(linhas))
+        else:
+            with open(tmp, "w", encoding="utf-8", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=COLUNAS, extrasaction="ignore")
+                writer.writeheader()
+                writer.writerows(linhas)
+        os.replace(tmp, caminho)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is None:
+                return
+            self._gravar_parte()
+            self._conn.close()
+            self._conn = None
+            self._mudou.notify_all()
+        if self._prazo is not None and self._prazo is not threading.current_thread():
+            self._prazo.join(timeout=5)
+        atexit.unregister(self.close)
+
+
+# O CSV guarda tudo como texto; na leitura, os tipos voltam a ser os do Parquet
+CONVERSOES_CSV = {
+    "versao_registro": int, "exportado_em": float, "tempo_s": float, "tempo_ocr_s": float,
+    **{coluna: lambda valor: valor == "True" for coluna in COLUNAS_VALIDACAO},
+}
+
+
+def _ler_parte(caminho: Path):
+    if caminho.suffix == ".parquet":
+        for lote in pq.ParquetFile(caminho).iter_batches():
+            yield from lote.to_pylist()
+    else:
+        with open(caminho, encoding="utf-8", newline="") as f:
+            for linha in csv.DictReader(f):
+                linha = {coluna: (None if valor == "" else valor) for coluna, valor in linha.items()}
+                for coluna, valor in linha.items():
+                    if valor is not None and coluna in CONVERSOES_CSV:
+                        linha[coluna] = CONVERSOES_CSV[coluna](valor)
+                yield linha
+
+
+def ler_exportacao(pasta):
+    """
+    Gera as linhas atuais da exportação (a última versão de cada laudo), parte
+    por parte, na ordem em que foram gravadas.
+    """
+    pasta = Path(pasta)
+    conn = sqlite3.connect(pasta / "indice.sqlite", timeout=30)
+    try:
+        for caminho in sorted(pasta.glob("parte-*")):
+            atuais = {linha for (linha,) in conn.execute(
+                "SELECT linha FROM registros WHERE parte = ?", (caminho.name,))}
+            if not atuais:
+                continue
+            for posicao, linha in enumerate(_ler_parte(caminho)):
+                if posicao in atuais:
+                    yield linha
+    finally:
+        conn.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Consolida a exportação contínua num único arquivo.")
+    parser.add_argument("pasta", type=Path, help="pasta da exportação (AIH_EXPORT_PATH)")
+    parser.add_argument("-o", "--saida", type=Path, help="arquivo .csv ou .jsonl (padrão: só contar)")
+    args = parser.parse_args(argv)
+
+    if not (args.pasta / "indice.sqlite").exists():
+        parser.error(f"exportação não encontrada: {args.pasta}")
+    total = 0
+    saida = open(args.saida, "w", encoding="utf-8", newline="") if args.saida else None
+    try:
+        writer = None
+        if saida and args.saida.suffix.lower() == ".csv":
+            writer = csv.DictWriter(saida, fieldnames=COLUNAS, extrasaction="ignore")
+            writer.writeheader()
+        for linha in ler_exportacao(args.pasta):
+            if writer:
+                writer.writerow(linha)
+            elif saida:
+                saida.write(json.dumps(linha, ensure_ascii=False) + "\n")
+            total += 1
+    finally:
+        if saida:
+            saida.close()
+    print(f"✅ {total} laudos" + (f" gravados em {args.saida}" if args.saida else ""), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Filtros do pré-processamento em faixas horizontais, numa pool de threads.
+
+O denoise (fastNlMeansDenoising), a binarização adaptativa e o sharpening do
+upscale rodam como uma chamada só sobre a página inteira. Aqui a página é
+dividida em faixas horizontais, cada faixa é lida com uma margem (halo) de
+linhas vizinhas do tamanho da janela do filtro e processada numa thread (o
+OpenCV libera o GIL); da saída de cada faixa só ficam as linhas dela.
+
+Com halo igual ao raio de dependência do filtro, cada pixel de saída vê
+exatamente a mesma vizinhança que na chamada inteira, então o resultado é
+idêntico bit a bit (confira com python -m benchmarks.faixas). Ativado por
+AIH_PRE_THREADS com mais de 1 thread.
+"""
+from __future__ import annotations
+
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from aih.sob_demanda import sob_demanda
+
+np = sob_demanda("numpy")
+
+# Threads por filtro. 1 (padrão) mantém a chamada única sobre a página
+THREADS_PRE = max(1, int(os.environ.get("AIH_PRE_THREADS") or 1))
+# Faixas mais baixas que isso custam mais em halo e agendamento do que ganham
+ALTURA_MINIMA_FAIXA = 128
+
+
+def halo_denoise(template: int, busca: int) -> int:
+    """Linhas vizinhas que o fastNlMeansDenoising lê: raio da busca + raio do template."""
+    return busca // 2 + template // 2
+
+
+def halo_janela(janela: int) -> int:
+    """Linhas vizinhas de um filtro com janela quadrada de lado `janela`."""
+    return janela // 2
+
+
+@functools.lru_cache(maxsize=None)
+def _executor(threads: int) -> ThreadPoolExecutor:
+    # Compartilhado entre as sessões: com vários documentos ao mesmo tempo, as
+    # faixas entram na mesma fila em vez de cada documento abrir as suas threads
+    return ThreadPoolExecutor(max_workers=threads, thread_name_prefix="aih-faixa")
+
+
+def em_faixas(funcao, image: np.ndarray, halo: int, threads: int = None) -> np.ndarray:
+    """
+    Aplica funcao(imagem) -> imagem do mesmo tamanho em faixas horizontais.
+    `halo` é o raio de dependência vertical do filtro, em linhas. Com uma faixa
+    só (poucas threads ou imagem baixa), é a própria chamada funcao(image).
+    """
+    threads = THREADS_PRE if threads is None else threads
+    altura = image.shape[0]
+    n_faixas = min(threads, altura // ALTURA_MINIMA_FAIXA)
+    if n_faixas <= 1:
+        return funcao(image)
+    limites = np.linspace(0, altura, n_faixas + 1).astype(int)
+
+    def faixa(i):
+        y0, y1 = limites[i], limites[i + 1]
+        a, b = max(0, y0 - halo), min(altura, y1 + halo)
+        return funcao(image[a:b])[y0 - a:y1 - a]
+
+    return np.concatenate(list(_executor(threads).map(faixa, range(n_faixas))))
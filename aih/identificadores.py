@@ -0,0 +1,203 @@
+"""
+Validação e formatação de CPF, CNS, CEP e telefone em lote, com NumPy.
+
+As funções de aih.pipeline (validar_cpf, formatar_cep...) tratam um valor por
+vez, com um re.sub e uma soma em Python para cada documento. Na conciliação de
+exportações históricas são milhões de identificadores; aqui uma coluna inteira
+vira uma matriz de dígitos (uma linha por valor) e os dígitos verificadores
+saem de um produto matricial pelos pesos.
+
+    mascara = validar_cpf_lote(df["cpf"])        # array de bool
+    df["cpf"] = formatar_cpf_lote(df["cpf"])     # array de str
+
+Os resultados são idênticos aos das funções escalares, valor a valor: None
+conta como texto vazio na validação e continua None na formatação, e
+valores com caracteres fora do ASCII (dígitos de outros alfabetos, que o \\D
+do re também aceita) são refeitos pela função escalar. As colunas são
+processadas em blocos de AIH_LOTE_BLOCO linhas, para a memória não crescer com
+o tamanho da exportação.
+"""
+from __future__ import annotations
+
+import os
+
+from aih import pipeline
+from aih.sob_demanda import sob_demanda
+
+np = sob_demanda("numpy")
+
+BLOCO = int(os.environ.get("AIH_LOTE_BLOCO") or 1 << 17)
+
+# Pesos dos dígitos verificadores
+PESOS_CPF_1 = tuple(range(10, 1, -1))   # 9 primeiros dígitos
+PESOS_CPF_2 = tuple(range(11, 1, -1))   # 10 primeiros dígitos
+PESOS_CNS = tuple(range(15, 0, -1))
+
+# Modelos de formatação: "#" é um dígito, o resto é copiado
+MODELO_CPF = "###.###.###-##"
+MODELO_CEP = "#####-###"
+MODELO_TELEFONE_11 = "(##) #####-####"
+MODELO_TELEFONE_10 = "(##) ####-####"
+
+
+def _coluna(valores):
+    """
+    Coluna de textos (lista, tupla, array, Series...) como array de str, com None
+    trocado por "". Retorna (coluna, máscara dos None).
+    """
+    valores = np.asarray(valores, dtype=object)
+    if valores.ndim != 1:
+        raise ValueError("esperada uma coluna (sequência de uma dimensão)")
+    nulos = np.equal(valores, None)
+    if nulos.any():
+        valores = valores.copy()
+        valores[nulos] = ""
+    return valores.astype(str), nulos
+
+
+def _blocos(coluna):
+    for inicio in range(0, len(coluna), BLOCO):
+        yield inicio, coluna[inicio:inicio + BLOCO]
+
+
+def _codigos(coluna):
+    """Matriz (n × maior tamanho) com o código de cada caractere; 0 preenche o fim."""
+    largura = max(coluna.dtype.itemsize // 4, 1)
+    return np.ascontiguousarray(coluna, dtype=f"<U{largura}").view(np.uint32).reshape(len(coluna), largura)
+
+
+def _digitos(codigos, largura):
+    """
+    Os primeiros `largura` dígitos ASCII de cada linha, alinhados à esquerda
+    (equivale a so_digitos). Retorna (matriz n × largura de dígitos 0-9,
+    quantidade total de dígitos por linha).
+    """
+    eh_digito = (codigos >= 48) & (codigos <= 57)
+    # Coluna de destino de cada dígito: quantos dígitos vieram antes dele na linha
+    destino = np.cumsum(eh_digito, axis=1, dtype=np.int32) - 1
+    quantidade = destino[:, -1] + 1
+    linhas, colunas = np.nonzero(eh_digito & (destino < largura))
+    digitos = np.zeros((len(codigos), largura), dtype=np.int32)
+    digitos[linhas, destino[linhas, colunas]] = codigos[linhas, colunas] - 48
+    return digitos, quantidade
+
+
+def _nao_ascii(codigos):
+    return (codigos > 127).any(axis=1)
+
+
+def _aplicar(valores, largura, funcao_bloco, funcao_escalar, dtype):
+    """Roda funcao_bloco(coluna, dígitos, quantidade) bloco a bloco e refaz as linhas não ASCII."""
+    coluna, nulos = _coluna(valores)
+    saida = None
+    for inicio, bloco in _blocos(coluna):
+        codigos = _codigos(bloco)
+        digitos, quantidade = _digitos(codigos, largura)
+        resultado = funcao_bloco(bloco, digitos, quantidade)
+        especiais = np.flatnonzero(_nao_ascii(codigos))
+        if len(especiais):
+            resultado = resultado.astype(object) if dtype is str else resultado
+            for i in especiais:
+                resultado[i] = funcao_escalar(str(bloco[i]))
+            if dtype is str:
+                resultado = resultado.astype(str)
+        saida = resultado if saida is None else _concatenar(saida, resultado)
+    if saida is None:
+        return np.zeros(0, dtype=bool if dtype is bool else str)
+    if dtype is str and nulos.any():
+        # Como as funções escalares, a formatação devolve o próprio valor quando não há o que formatar
+        saida = saida.astype(object)
+        saida[nulos] = None
+    return saida
+
+
+def _concatenar(a, b):
+    if a.dtype.kind == "U" and b.dtype.kind == "U" and a.dtype != b.dtype:
+        largura = max(a.dtype.itemsize, b.dtype.itemsize) // 4
+        a, b = a.astype(f"<U{largura}"), b.astype(f"<U{largura}")
+    return np.concatenate([a, b])
+
+
+def _verificador(digitos, pesos):
+    """Dígito verificador mod 11 (resto < 2 → 0) de cada linha."""
+    soma = digitos[:, :len(pesos)] @ np.asarray(pesos, dtype=np.int32)
+    digito = 11 - soma % 11
+    return np.where(digito > 9, 0, digito)
+
+
+def _formatar(digitos, modelo):
+    """Monta o texto do modelo com os dígitos de cada linha (matriz n × len(modelo))."""
+    saida = np.empty((len(digitos), len(modelo)), dtype=np.uint32)
+    posicoes = [i for i, c in enumerate(modelo) if c == "#"]
+    saida[:, posicoes] = digitos[:, :len(posicoes)] + 48
+    for i, c in enumerate(modelo):
+        if c != "#":
+            saida[:, i] = ord(c)
+    return saida.view(f"<U{len(modelo)}").ravel()
+
+
+def _formatar_por_tamanho(coluna, digitos, quantidade, modelos):
+    """Formata as linhas cujo número de dígitos tem modelo; as demais ficam como vieram."""
+    largura = max([coluna.dtype.itemsize // 4] + [len(m) for m in modelos.values()])
+    saida = coluna.astype(f"<U{largura}")
+    for tamanho, modelo in modelos.items():
+        linhas = quantidade == tamanho
+        if linhas.any():
+            saida[linhas] = _formatar(digitos[linhas], modelo)
+    return saida
+
+
+# --- Validação ---
+
+def _cpf_bloco(coluna, digitos, quantidade):
+    validos = quantidade == 11
+    # Todos os dígitos iguais (000.000.000-00, 111...) não são CPF
+    validos &= (digitos[:, :11] != digitos[:, :1]).any(axis=1)
+    validos &= digitos[:, 9] == _verificador(digitos, PESOS_CPF_1)
+    validos &= digitos[:, 10] == _verificador(digitos, PESOS_CPF_2)
+    return validos
+
+
+def _cns_bloco(coluna, digitos, quantidade):
+    validos = (quantidade == 15) & np.isin(digitos[:, 0], (1, 2, 7, 8, 9))
+    return validos & ((digitos[:, :15] @ np.asarray(PESOS_CNS, dtype=np.int32)) % 11 == 0)
+
+
+def _cep_bloco(coluna, digitos, quantidade):
+    return quantidade == 8
+
+
+def validar_cpf_lote(valores):
+    """Máscara booleana: validar_cpf de cada valor da coluna."""
+    return _aplicar(valores, 11, _cpf_bloco, pipeline.validar_cpf, bool)
+
+
+def validar_cns_lote(valores):
+    """Máscara booleana: validar_cns de cada valor da coluna."""
+    return _aplicar(valores, 15, _cns_bloco, pipeline.validar_cns, bool)
+
+
+def validar_cep_lote(valores):
+    """Máscara booleana: validar_cep de cada valor da coluna."""
+    return _aplicar(valores, 8, _cep_bloco, pipeline.validar_cep, bool)
+
+
+# --- Formatação ---
+
+def formatar_cpf_lote(valores):
+    """formatar_cpf de cada valor: XXX.XXX.XXX-XX com 11 dígitos, senão o valor original."""
+    return _aplicar(valores, 11, lambda c, d, q: _formatar_por_tamanho(c, d, q, {11: MODELO_CPF}),
+                    pipeline.formatar_cpf, str)
+
+
+def formatar_cep_lote(valores):
+    """formatar_cep de cada valor: XXXXX-XXX com 8 dígitos, senão o valor original."""
+    return _aplicar(valores, 8, lambda c, d, q: _formatar_por_tamanho(c, d, q, {8: MODELO_CEP}),
+                    pipeline.formatar_cep, str)
+
+
+def formatar_telefone_lote(valores):
+    """formatar_telefone de cada valor: (XX) XXXXX-XXXX ou (XX) XXXX-XXXX, senão o original."""
+    modelos = {11: MODELO_TELEFONE_11, 10: MODELO_TELEFONE_10}
+    return _aplicar(valores, 11, lambda c, d, q: _formatar_por_tamanho(c, d, q, modelos),
+                    pipeline.formatar_telefone, str)
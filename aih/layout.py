@@ -0,0 +1,397 @@
+"""
+Extração por layout: registra a foto no modelo do laudo e reconhece só as caixas dos campos.
+
+O modelo é o formulário do modelo_hemo.pdf (612x792 pontos), descrito em pontos
+PDF. Uma detecção barata (imagem reduzida) encontra os rótulos impressos do
+cabeçalho e dos blocos de identificação, endereço e clínica; pelas posições
+deles estima-se a transformação modelo → imagem, e cada caixa de valor é
+recortada em resolução cheia e enviada direto ao reconhecedor, com
+pós-processamento por tipo de campo (ex.: só dígitos para CNS/CEP).
+
+Origem das medidas: o modelo_hemo.pdf não tem camada de texto (a página é uma
+imagem escaneada e page.get_text("words") vem vazio). Os rótulos foram medidos
+pelas caixas do RapidOCR na página renderizada a 200 dpi, e as caixas de valor
+pelas linhas da tabela (abertura morfológica horizontal e vertical da mesma
+renderização): cada caixa é a parte da célula livre do rótulo, com ~1,5 pt de
+recuo das linhas para o traço da tabela não entrar no recorte. Campos que o
+formulário não tem (CPF, telefone, CID, procedimento, CNES) ficam de fora.
+
+Os rótulos do laudo AIH com camada de texto (ROTULOS_LAUDO) são outra coisa:
+servem à leitura de PDFs pelas caixas de palavras (campos_por_palavras) e ao
+texto reconstruído do layout.
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+
+from aih import segmentacao
+from aih.metrics import etapa, medir
+from aih.sob_demanda import sob_demanda
+
+cv2 = sob_demanda("cv2")
+np = sob_demanda("numpy")
+
+# Página do modelo em pontos PDF
+LARGURA_MODELO, ALTURA_MODELO = 612, 792
+
+# Caixas de valor dos campos no modelo_hemo.pdf: campo → (x0, y0, x1, y1) em pontos.
+# Ao lado do rótulo quando a célula tem espaço, senão abaixo dele
+CAIXAS_MODELO = {
+    "data_laudo": (481.0, 56.5, 514.5, 78.0),               # Data (rótulo vertical)
+    "nome_paciente": (111.5, 80.5, 459.0, 101.5),           # Nome do Paciente
+    "nome_genitora": (360.0, 104.0, 578.0, 121.5),          # Nome da Genitora
+    "prontuario": (402.5, 136.0, 459.0, 145.0),             # Prontuário (abaixo)
+    "cartao_sus": (492.5, 124.0, 578.0, 145.0),             # Cartão SUS
+    "endereco_completo": (39.0, 166.0, 401.0, 177.5),       # Endereço de residência (abaixo)
+    "cep": (61.5, 179.5, 103.5, 197.5),                     # CEP
+    "uf": (169.0, 179.5, 211.5, 197.5),                     # Estado de origem
+    "municipio_referencia": (285.0, 179.5, 349.5, 197.5),   # Município de origem
+    "data_nascimento": (38.5, 217.0, 97.0, 231.0),          # Nascimento (abaixo)
+    "sexo": (118.5, 204.5, 140.0, 231.0),                   # Sexo (rótulo vertical)
+    "raca": (220.5, 204.5, 240.5, 231.0),                   # Raça (rótulo vertical)
+    "diagnostico": (459.0, 217.0, 578.5, 231.0),            # Diagnóstico (abaixo)
+}
+
+# Âncoras impressas no modelo: texto → ponto esquerdo-central (pontos PDF).
+# Só rótulos horizontais que aparecem uma vez na parte de cima da página
+# (ex.: "SUS" e "Unidade" se repetem e ficam de fora)
+ANCORAS_MODELO = {
+    "SOLICITACAODE": (217.8, 25.8),
+    "HEMOCOMPONENTES": (258.1, 38.9),
+    "STH": (531.7, 17.1),
+    "REV4": (529.2, 36.9),
+    "Hospital/Unidade de Saúde": (41.8, 61.7),
+    "Telefone de contato da Unidade": (337.9, 62.3),
+    "Nome do Paciente": (41.4, 86.0),
+    "Convênio especifique": (465.4, 87.2),
+    "Nome social": (41.0, 107.0),
+    "Nome da Genitora": (290.1, 106.4),
+    "Enfermaria": (42.6, 137.7),
+    "Prontuário": (405.6, 130.5),
+    "Cartão": (465.0, 130.9),
+    "Endereço de residência do paciente": (162.2, 160.9),
+    "Bairro": (478.5, 160.7),
+    "CEP": (41.8, 186.2),
+    "Estado de origem": (109.6, 186.2),
+    "Município de origem": (216.8, 186.4),
+    "IBGE": (355.0, 186.2),
+    "Código de Etnia": (443.1, 186.4),
+    "Nascimento": (41.0, 211.2),
+    "Diagnóstico": (461.8, 211.6),
+    "Antecedente transfusional": (41.8, 239.9),
+    "Antecedentes obstétricos": (145.4, 239.5),
+    "Reação transfusional prévia": (245.8, 239.9),
+    "Indicação transfusional": (404.8, 240.1),
+    "Fenotipagem": (41.4, 269.0),
+}
+
+# Rótulos do laudo AIH com camada de texto, por linha: [(rótulo, campo)].
+# Rótulos com campo None delimitam o campo anterior na linha
+ROTULOS_LAUDO = [
+    [("Nome do Paciente", "nome_paciente"), ("CNS", "cartao_sus")],
+    [("Data de Nasc", "data_nascimento"), ("Sexo", "sexo"), ("Raça/cor", "raca"),
+     ("Nome do Responsável", None)],
+    [("Nome da Mãe", "nome_genitora")],
+    [("Endereço Residencial (Rua, Av etc)", "endereco_completo")],
+    [("CPF", "cpf"), ("Municipio de Referência", "municipio_referencia"), ("Cód. IBGE", "cod_ibge")],
+    [("UF", "uf"), ("CEP", "cep"), ("Diretor Clinico", None)],
+    [("Núm. Prontuário", "prontuario"), ("Telefone de Contato", "telefone_paciente"),
+     ("Telefone Celular", None)],
+    [("Diagnóstico Inicial", "diagnostico"), ("CID 10 Principal", "cid10")],
+    [("Codigo do Procedimento", "codigo_procedimento"), ("CNES", "cnes")],
+]
+
+# Lado maior da imagem usada na detecção barata das âncoras
+LADO_DETECCAO = 1000
+
+# Só procura âncoras na parte de cima da imagem (cabeçalho + identificação + clínica)
+FRACAO_BUSCA_ANCORAS = 0.45
+
+MIN_ANCORAS = 4
+
+TIPOS_CAMPO = {
+    "cartao_sus": "digitos", "cpf": "digitos", "cep": "digitos", "prontuario": "digitos",
+    "telefone_paciente": "digitos", "codigo_procedimento": "digitos", "cnes": "digitos",
+    "data_nascimento": "data", "data_laudo": "data", "uf": "sigla", "cid10": "cid", "sexo": "sexo",
+    "nome_paciente": "nome", "nome_genitora": "nome", "municipio_referencia": "nome", "raca": "nome",
+}
+
+TAMANHOS_EXATOS = {"cartao_sus": 15, "cpf": 11, "cep": 8}
+
+# Esticamento horizontal do recorte antes do reconhecimento: em células estreitas
+# e altas o reconhecedor junta dígitos repetidos ("02/02/2025" → "0202025"),
+# como no CNS lido pelas duplicatas
+ESTICAR_CAMPOS = {"data_laudo": 2.0}
+
+# Confusões comuns do reconhecedor entre letras e dígitos
+LETRA_PARA_DIGITO = str.maketrans("OQDIL|SBZGT", "00011158267")
+DIGITO_PARA_LETRA = str.maketrans("01582", "OISBZ")
+
+
+def normalizar_ancora(texto: str) -> str:
+    """Maiúsculas, sem acentos e só letras/dígitos (ex.: 'Cód. IBGE' -> 'CODIBGE')."""
+    texto = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode()
+    return re.sub(r"[^A-Z0-9]", "", texto.upper())
+
+
+def ancoras_modelo() -> dict:
+    """Todas as âncoras do modelo: texto normalizado → ponto (x, y) em pontos PDF."""
+    return {normalizar_ancora(texto): ponto for texto, ponto in ANCORAS_MODELO.items()}
+
+
+def caixas_campos(campos=None) -> dict:
+    """Caixas de valor dos campos no modelo: campo → (x0, y0, x1, y1) em pontos PDF."""
+    return {campo: caixa for campo, caixa in CAIXAS_MODELO.items()
+            if campos is None or campo in campos}
+
+
+def localizar_ancoras(textos_caixas: list) -> tuple:
+    """
+    Casa os textos reconhecidos com as âncoras do modelo.
+    Recebe [(texto, caixa 4x2 na imagem)] e devolve (pontos_modelo, pontos_imagem).
+    Se o rótulo estiver no meio de uma caixa maior (rótulo + valor colados),
+    a posição é estimada pela proporção de caracteres.
+    """
+    ancoras = ancoras_modelo()
+    encontradas = {}
+    for texto, caixa in textos_caixas:
+        norm = normalizar_ancora(texto)
+        if not norm:
+            continue
+        x0, x1 = caixa[:, 0].min(), caixa[:, 0].max()
+        y_meio = caixa[:, 1].mean()
+        for ancora, ponto in ancoras.items():
+            idx = norm.find(ancora)
+            # Âncoras curtas (CNS, CPF, UF...) só valem no início da caixa
+            if idx < 0 or (len(ancora) < 4 and idx != 0):
+                continue
+            x = x0 + (x1 - x0) * idx / len(norm)
+            # Âncora vista mais de uma vez é ambígua e fica de fora
+            encontradas[ancora] = None if ancora in encontradas else (ponto, (x, y_meio))
+    pares = [par for par in encontradas.values() if par is not None]
+    pontos_modelo = np.float32([p[0] for p in pares]).reshape(-1, 2)
+    pontos_imagem = np.float32([p[1] for p in pares]).reshape(-1, 2)
+    return pontos_modelo, pontos_imagem
+
+
+def registrar_modelo(pontos_modelo: np.ndarray, pontos_imagem: np.ndarray):
+    """Estima a transformação afim modelo → imagem (RANSAC). Retorna None se não for confiável."""
+    if len(pontos_modelo) < MIN_ANCORAS:
+        return None
+    escala_aprox = np.ptp(pontos_imagem[:, 0]) / max(np.ptp(pontos_modelo[:, 0]), 1.0)
+    M, inliers = cv2.estimateAffine2D(pontos_modelo, pontos_imagem, method=cv2.RANSAC,
+                                      ransacReprojThreshold=max(6.0, 4.0 * escala_aprox))
+    if M is None or inliers is None or int(inliers.sum()) < MIN_ANCORAS - 1:
+        return None
+    # Rejeita transformações degeneradas (escala muito diferente entre os eixos)
+    sx, sy = np.linalg.norm(M[:, 0]), np.linalg.norm(M[:, 1])
+    if sx <= 0 or sy <= 0 or not 0.5 < sx / sy < 2.0:
+        return None
+    return M
+
+
+def pos_processar_campo(campo: str, texto: str):
+    """Limpa o texto reconhecido conforme o tipo do campo. Retorna None se inválido."""
+    tipo = TIPOS_CAMPO.get(campo, "texto")
+    texto = texto.strip()
+    if tipo == "digitos":
+        valor = re.sub(r"\D", "", texto.upper().translate(LETRA_PARA_DIGITO))
+        if campo in TAMANHOS_EXATOS and len(valor) != TAMANHOS_EXATOS[campo]:
+            return None
+    elif tipo == "data":
+        digitos = re.sub(r"\D", "", texto.upper().translate(LETRA_PARA_DIGITO))
+        if len(digitos) != 8:
+            return None
+        valor = f"{digitos[:2]}/{digitos[2:4]}/{digitos[4:]}"
+    elif tipo == "sigla":
+        valor = re.sub(r"[^A-Z]", "", texto.upper().translate(DIGITO_PARA_LETRA))[:2]
+        if len(valor) != 2:
+            return None
+    elif tipo == "cid":
+        texto = re.sub(r"[^A-Z0-9]", "", texto.upper())
+        if len(texto) < 3:
+            return None
+        valor = texto[0].translate(DIGITO_PARA_LETRA) + texto[1:4].translate(LETRA_PARA_DIGITO)
+        if not re.fullmatch(r"[A-Z]\d{2,3}", valor):
+            return None
+    elif tipo == "sexo":
+        match = re.search(r"FEM|MASC", texto.upper())
+        valor = {"FEM": "Feminino", "MASC": "Masculino"}.get(match.group(0)) if match else None
+    elif tipo == "nome":
+        valor = re.sub(r"[^A-ZÀ-Ý ]", "", texto.upper())
+    else:
+        valor = re.sub(r"[^A-ZÀ-Ý0-9 ,]", "", texto.upper())
+    if valor and tipo in ("nome", "texto"):
+        # Letras soltas nas pontas são restos de rótulo ou ruído da borda da caixa
+        valor = re.sub(r"^\S\s+|\s+\S$", "", re.sub(r"\s+", " ", valor).strip())
+        valor = separar_coladas(valor)
+    return valor or None
+
+
+# Tokens a partir deste tamanho são candidatos a palavras coladas dentro de um campo
+TAMANHO_COLADAS = 8
+RE_TOKEN_LONGO = re.compile(r"[A-ZÀ-Ý]{%d,}" % TAMANHO_COLADAS)
+
+
+def separar_coladas(valor: str) -> str:
+    """
+    Separa palavras coladas num campo de nome/texto (ex.: FERNANDARODRIGUES), só
+    quando todas as partes são palavras do léxico: um nome incomum fica intacto.
+    """
+    try:
+        return RE_TOKEN_LONGO.sub(lambda m: segmentacao.separar(m.group(0), so_conhecidas=True), valor)
+    except Exception:
+        return valor
+
+
+def texto_do_layout(dados: dict) -> str:
+    """Reconstrói o texto do bloco (rótulo + valor), para debug e extração de códigos."""
+    linhas = []
+    for itens in ROTULOS_LAUDO:
+        partes = []
+        for rotulo, campo in itens:
+            partes.append(rotulo)
+            if campo and dados.get(campo):
+                partes.append(dados[campo])
+        linhas.append(" ".join(partes))
+    return "\n".join(linhas)
+
+
+@medir("layout")
+def extrair_por_layout(gray_img: np.ndarray, ocr, campos) -> dict:
+    """
+    Extrai os campos por layout. `ocr` é a instância do RapidOCR e `campos` os
+    campos desejados. Retorna {"dados", "raw_text", "ancoras"} ou None se a imagem
+    não puder ser registrada no modelo.
+    """
+    img_bgr = cv2.cvtColor(gray_img, cv2.COLOR_GRAY2BGR) if gray_img.ndim == 2 else gray_img
+    h, w = img_bgr.shape[:2]
+    escala = min(1.0, LADO_DETECCAO / max(h, w))
+
+    # 1. Detecção barata na imagem reduzida, só na parte de cima
+    with etapa("layout_deteccao"):
+        reduzida = cv2.resize(img_bgr, None, fx=escala, fy=escala, interpolation=cv2.INTER_AREA) \
+            if escala < 1 else img_bgr
+        caixas, _ = ocr.text_det(reduzida)
+    if caixas is None or len(caixas) == 0:
+        return None
+    caixas = [c / escala for c in caixas if c[:, 1].mean() / escala < h * FRACAO_BUSCA_ANCORAS]
+    if not caixas:
+        return None
+
+    # 2. Reconhece as caixas candidatas (recortadas da imagem em resolução cheia)
+    with etapa("layout_ancoras"):
+        recortes = ocr.get_crop_img_list(img_bgr, [c.astype(np.float32) for c in caixas])
+        reconhecidos, _ = ocr.text_rec(recortes)
+    textos_caixas = [(r[0], c) for r, c in zip(reconhecidos, caixas)]
+
+    # 3. Registro no modelo
+    M = registrar_modelo(*localizar_ancoras(textos_caixas))
+    if M is None:
+        return None
+
+    # 4. Recorta só as caixas dos campos e reconhece sem detecção
+    with etapa("layout_campos"):
+        caixas_modelo = caixas_campos(campos)
+        quadrilateros = []
+        for x0, y0, x1, y1 in caixas_modelo.values():
+            cantos = np.float32([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+            quadrilateros.append(cv2.transform(cantos[None], M)[0].astype(np.float32))
+        recortes = ocr.get_crop_img_list(img_bgr, quadrilateros)
+        recortes = [cv2.resize(recorte, None, fx=ESTICAR_CAMPOS[campo], fy=1.0, interpolation=cv2.INTER_CUBIC)
+                    if campo in ESTICAR_CAMPOS else recorte
+                    for campo, recorte in zip(caixas_modelo.keys(), recortes)]
+        reconhecidos, _ = ocr.text_rec(recortes)
+
+    dados = {}
+    for campo, (texto, *_) in zip(caixas_modelo.keys(), reconhecidos):
+        valor = pos_processar_campo(campo, texto)
+        if valor:
+            dados[campo] = valor
+    return {"dados": dados, "raw_text": texto_do_layout(dados), "ancoras": len(textos_caixas)}
+
+
+# === Leitura de PDF com camada de texto pelas caixas de palavras ===
+
+def _rotulos_tokenizados() -> dict:
+    """Primeiro token normalizado → [(tokens do rótulo, campo)], rótulos mais longos primeiro."""
+    indice = {}
+    for itens in ROTULOS_LAUDO:
+        for rotulo, campo in itens:
+            tokens = [t for t in map(normalizar_ancora, rotulo.split()) if t]
+            indice.setdefault(tokens[0], []).append((tokens, campo))
+    for candidatos in indice.values():
+        candidatos.sort(key=lambda c: -len(c[0]))
+    return indice
+
+
+ROTULOS_POR_TOKEN = _rotulos_tokenizados()
+
+
+def agrupar_linhas(palavras: list) -> list:
+    """Agrupa as palavras (x0, y0, x1, y1, texto, ...) em linhas visuais, ordenadas por x."""
+    linhas = []
+    for p in sorted(palavras, key=lambda p: (p[1] + p[3]) / 2):
+        centro, altura = (p[1] + p[3]) / 2, p[3] - p[1]
+        if linhas and abs(centro - linhas[-1]["centro"]) <= altura / 2:
+            linhas[-1]["palavras"].append(p)
+        else:
+            linhas.append({"centro": centro, "altura": altura, "palavras": [p]})
+    for linha in linhas:
+        linha["palavras"].sort(key=lambda p: p[0])
+    return linhas
+
+
+def localizar_rotulos(linha: dict) -> list:
+    """Rótulos do modelo presentes na linha: [(campo, x0, x1, índice inicial, índice final)]."""
+    tokens = [normalizar_ancora(p[4]) for p in linha["palavras"]]
+    rotulos, i = [], 0
+    while i < len(tokens):
+        for tokens_rotulo, campo in ROTULOS_POR_TOKEN.get(tokens[i], ()):
+            fim = i + len(tokens_rotulo)
+            if tokens[i:fim] == tokens_rotulo:
+                rotulos.append((campo, linha["palavras"][i][0], linha["palavras"][fim - 1][2], i, fim))
+                i = fim
+                break
+        else:
+            i += 1
+    return rotulos
+
+
+def _limpar_valor_pdf(campo: str, palavras: list):
+    texto = " ".join(p[4] for p in palavras).strip()
+    if TIPOS_CAMPO.get(campo) == "digitos":
+        texto = re.sub(r"\D", "", texto)
+    return texto or None
+
+
+@medir("pdf_campos_palavras")
+def campos_por_palavras(palavras: list, campos=None) -> dict:
+    """
+    Extrai os campos de uma página pelas caixas de palavras do PyMuPDF
+    (page.get_text("words")): o valor é lido à direita do rótulo, até o próximo
+    rótulo da linha, ou na linha de baixo quando não há nada à direita.
+    `campos` restringe os campos devolvidos (por padrão, todos os do modelo).
+    """
+    linhas = agrupar_linhas(palavras)
+    rotulos_por_linha = [localizar_rotulos(linha) for linha in linhas]
+    dados = {}
+    for n, (linha, rotulos) in enumerate(zip(linhas, rotulos_por_linha)):
+        for k, (campo, x0, _, _, fim) in enumerate(rotulos):
+            if not campo or campo in dados or (campos is not None and campo not in campos):
+                continue
+            limite = rotulos[k + 1][1] if k + 1 < len(rotulos) else float("inf")
+            fim_valor = rotulos[k + 1][3] if k + 1 < len(rotulos) else len(linha["palavras"])
+            valor = linha["palavras"][fim:fim_valor]
+            # Rótulo sozinho: valor na linha de baixo, na mesma coluna
+            if not valor and n + 1 < len(linhas) and \
+                    linhas[n + 1]["centro"] - linha["centro"] <= 2.5 * linha["altura"]:
+                abaixo = linhas[n + 1]
+                usadas = {i for *_, ini, f in rotulos_por_linha[n + 1] for i in range(ini, f)}
+                valor = [p for i, p in enumerate(abaixo["palavras"])
+                         if i not in usadas and x0 - linha["altura"] <= p[0] < limite]
+            valor = _limpar_valor_pdf(campo, valor)
+            if valor:
+                dados[campo] = valor
+    return dados
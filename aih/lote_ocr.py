@@ -0,0 +1,194 @@
+"""
+Reconhecimento de linhas em lote entre documentos (micro-batching).
+
+Chamado inteiro (ocr(imagem)), o RapidOCR detecta as linhas e as reconhece em
+lotes pequenos de um documento só; com várias sessões ao mesmo tempo, cada uma
+roda as suas inferências pequenas. Aqui a detecção continua por documento, mas
+os recortes das linhas vão para um LoteReconhecimento, que junta os recortes de
+vários documentos em andamento num único lote (ordenado pela proporção das
+linhas, como o próprio RapidOCR faz, para o padding ser pequeno), reconhece com
+um modelo do pool e devolve a cada documento as suas linhas.
+
+O primeiro documento que chega vira o "líder" do lote: espera os outros
+documentos em andamento entregarem os recortes, no máximo AIH_OCR_LOTE_JANELA_MS
+ou até juntar AIH_OCR_LOTE_LINHAS linhas, e reconhece o lote. Com um único
+documento em andamento não há espera nenhuma. Ativado por AIH_OCR_LOTE=1.
+"""
+import contextlib
+import os
+import threading
+import time
+
+from aih.metrics import registrar
+
+# Ativado por AIH_OCR_LOTE=1
+OCR_LOTE = os.environ.get("AIH_OCR_LOTE") == "1"
+# Prazo máximo que o primeiro documento do lote espera pelos outros
+JANELA_LOTE_S = float(os.environ.get("AIH_OCR_LOTE_JANELA_MS") or 200) / 1000
+# Com tantas linhas juntas, o lote sai sem esperar o prazo (uma foto do laudo tem ~140)
+MAX_LINHAS_LOTE = int(os.environ.get("AIH_OCR_LOTE_LINHAS") or 512)
+# Linhas por inferência do reconhecedor. Sem valor, fica a do RapidOCR (6): numa
+# CPU com poucos núcleos, inferências maiores pagam mais padding do que ganham
+LINHAS_POR_INFERENCIA = int(os.environ.get("AIH_OCR_LOTE_INFERENCIA") or 0) or None
+
+
+class _PedidoLinhas:
+    __slots__ = ("recortes", "evento", "resultado", "erro")
+
+    def __init__(self, recortes: list):
+        self.recortes = recortes
+        self.evento = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+
+class _Documento:
+    """Documento inscrito no lote; entrega os recortes uma vez por reconhecer()."""
+    __slots__ = ("lote", "entregou")
+
+    def __init__(self, lote):
+        self.lote = lote
+        self.entregou = False
+
+    def reconhecer(self, recortes: list) -> tuple:
+        inscrito, self.entregou = not self.entregou, True
+        return self.lote._reconhecer(recortes, inscrito)
+
+
+class LoteReconhecimento:
+    """
+    Junta os recortes de linhas de vários documentos num lote de reconhecimento.
+    Cada documento se inscreve com `with lote.documento() as doc:` antes da
+    detecção, para o líder saber quantos ainda vão entregar recortes, e depois
+    chama doc.reconhecer(recortes).
+    """
+
+    def __init__(self, pool, janela_s: float = None, max_linhas: int = None,
+                 linhas_por_inferencia: int = None):
+        self.pool = pool
+        self.janela_s = JANELA_LOTE_S if janela_s is None else janela_s
+        self.max_linhas = max_linhas or MAX_LINHAS_LOTE
+        self.linhas_por_inferencia = linhas_por_inferencia or LINHAS_POR_INFERENCIA
+        self._cond = threading.Condition()
+        self._pendentes = []
+        self._linhas = 0
+        # Documentos inscritos que ainda não entregaram os recortes
+        self._sem_recortes = 0
+        self._coletando = False
+        self._totais = {"lotes": 0, "documentos": 0, "linhas": 0}
+
+    def estado(self) -> dict:
+        """Totais desde o início: lotes reconhecidos, documentos e linhas que passaram por eles."""
+        with self._cond:
+            return {**self._totais, "pendentes": len(self._pendentes), "sem_recortes": self._sem_recortes}
+
+    @contextlib.contextmanager
+    def documento(self):
+        """Inscreve um documento em andamento, da detecção até entregar os recortes."""
+        doc = _Documento(self)
+        with self._cond:
+            self._sem_recortes += 1
+        try:
+            yield doc
+        finally:
+            if not doc.entregou:
+                with self._cond:
+                    self._sem_recortes -= 1
+                    self._cond.notify_all()
+
+    def reconhecer(self, recortes: list) -> tuple:
+        """
+        Reconhece os recortes junto com os de outros documentos.
+        Retorna ([(texto, score), ...], segundos do reconhecimento), como text_rec.
+        """
+        return self._reconhecer(recortes, False)
+
+    def _reconhecer(self, recortes: list, inscrito: bool) -> tuple:
+        pedido = _PedidoLinhas(recortes)
+        with self._cond:
+            # Entregar e entrar na fila juntos: o líder não pode ver a entrega sem o pedido
+            if inscrito:
+                self._sem_recortes -= 1
+                self._cond.notify_all()
+            if not recortes:
+                return [], 0.0
+            self._pendentes.append(pedido)
+            self._linhas += len(recortes)
+            self._cond.notify_all()
+            if self._coletando:
+                lider = False
+            else:
+                self._coletando = lider = True
+                lote = self._coletar()
+        if lider:
+            self._reconhecer_lote(lote)
+        pedido.evento.wait()
+        if pedido.erro is not None:
+            raise pedido.erro
+        return pedido.resultado
+
+    def _coletar(self) -> list:
+        """Espera os outros documentos até o prazo e pega o lote. Chamar com o lock."""
+        inicio = time.perf_counter()
+        prazo = inicio + self.janela_s
+        while self._linhas < self.max_linhas and self._sem_recortes > 0 and time.perf_counter() < prazo:
+            self._cond.wait(prazo - time.perf_counter())
+        lote, self._pendentes, self._linhas = self._pendentes, [], 0
+        self._coletando = False
+        self._totais["lotes"] += 1
+        self._totais["documentos"] += len(lote)
+        self._totais["linhas"] += sum(len(pedido.recortes) for pedido in lote)
+        registrar("ocr_lote_espera", time.perf_counter() - inicio)
+        return lote
+
+    def _reconhecer_lote(self, lote: list) -> None:
+        recortes = [recorte for pedido in lote for recorte in pedido.recortes]
+        try:
+            inicio = time.perf_counter()
+            with self.pool.modelo() as ocr:
+                reconhecedor = ocr.text_rec
+                original = reconhecedor.rec_batch_num
+                reconhecedor.rec_batch_num = self.linhas_por_inferencia or original
+                try:
+                    resultados, _ = reconhecedor(recortes)
+                finally:
+                    reconhecedor.rec_batch_num = original
+            segundos = time.perf_counter() - inicio
+            registrar("ocr_lote_reconhecimento", segundos, pixels=sum(r.size for r in recortes))
+            posicao = 0
+            for pedido in lote:
+                fim = posicao + len(pedido.recortes)
+                pedido.resultado = (resultados[posicao:fim], segundos)
+                posicao = fim
+        except BaseException as e:
+            for pedido in lote:
+                pedido.erro = e
+        finally:
+            for pedido in lote:
+                pedido.evento.set()
+
+
+def reconhecer_imagem(pool, lote: LoteReconhecimento, img) -> tuple:
+    """
+    Equivalente a ocr(img) do RapidOCR, com o reconhecimento feito no lote.
+    A detecção (e a classificação de orientação) usa um modelo do pool só pelo
+    tempo dela; o modelo é devolvido antes do reconhecimento.
+    """
+    with lote.documento() as doc:
+        with pool.modelo() as ocr:
+            img = ocr.load_img(img)
+            raw_h, raw_w = img.shape[:2]
+            img, ratio_h, ratio_w = ocr.preprocess(img)
+            op_record = {"preprocess": {"ratio_h": ratio_h, "ratio_w": ratio_w}}
+            img, op_record = ocr.maybe_add_letterbox(img, op_record)
+            dt_boxes, det_elapse = ocr.auto_text_det(img)
+            if dt_boxes is None:
+                return None, None
+            recortes = ocr.get_crop_img_list(img, dt_boxes)
+            cls_res, cls_elapse = None, 0.0
+            if ocr.use_cls:
+                recortes, cls_res, cls_elapse = ocr.text_cls(recortes)
+        rec_res, rec_elapse = doc.reconhecer(recortes)
+    # Os passos finais só leem a configuração do modelo, sem inferência
+    dt_boxes = ocr._get_origin_points(dt_boxes, op_record, raw_h, raw_w)
+    return ocr.get_final_res(dt_boxes, cls_res, rec_res, det_elapse, cls_elapse, rec_elapse)
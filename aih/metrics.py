@@ -0,0 +1,246 @@
+"""
+Instrumentação leve das etapas do pipeline.
+
+Cada etapa registra tempo de parede, tempo de CPU do processo, pixels de
+entrada e, opcionalmente (AIH_METRICS_MEMORIA=1), o pico de alocação via
+tracemalloc. As medições alimentam histogramas globais do processo, exportados
+no formato texto do Prometheus, e o rastro do documento em processamento.
+
+O tempo de CPU é o do processo inteiro (time.process_time) durante a etapa:
+inclui as threads a que a etapa entrega o trabalho (OCR por página, lote do
+reconhecedor, threads do onnxruntime), mas, com vários documentos ao mesmo
+tempo, também o trabalho dos outros. O pico de alocação do tracemalloc também é
+do processo, então só é registrado quando nenhuma outra thread tinha etapa
+aberta durante a etapa; nos outros casos fica None.
+"""
+import contextlib
+import contextvars
+import functools
+import os
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Limites (em segundos) dos buckets dos histogramas de duração
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+MEDIR_MEMORIA = os.environ.get("AIH_METRICS_MEMORIA") == "1"
+if MEDIR_MEMORIA:
+    tracemalloc.start()
+
+_rastro_atual = contextvars.ContextVar("aih_rastro", default=None)
+_pilha = threading.local()
+
+# Threads com etapa aberta e quantas vezes uma thread abriu etapa com outra já
+# medindo: uma etapa que viu concorrência não tem pico próprio
+_medindo = {"threads": 0, "sobreposicoes": 0}
+_lock_medindo = threading.Lock()
+
+
+class _Histograma:
+    __slots__ = ("contagens", "soma", "total", "cpu", "pixels", "pico_bytes")
+
+    def __init__(self):
+        self.contagens = [0] * len(BUCKETS)
+        self.soma = 0.0
+        self.total = 0
+        self.cpu = 0.0
+        self.pixels = 0
+        self.pico_bytes = 0
+
+
+class Registro:
+    """Agrega as medições de todas as etapas do processo."""
+
+    def __init__(self):
+        self._etapas = {}
+        self._lock = threading.Lock()
+
+    def observar(self, etapa: str, wall_s: float, cpu_s: float = None,
+                 pixels: int = None, pico_bytes: int = None) -> None:
+        with self._lock:
+            h = self._etapas.get(etapa)
+            if h is None:
+                h = self._etapas[etapa] = _Histograma()
+            for i, limite in enumerate(BUCKETS):
+                if wall_s <= limite:
+                    h.contagens[i] += 1
+            h.soma += wall_s
+            h.total += 1
+            h.cpu += cpu_s or 0.0
+            h.pixels += pixels or 0
+            h.pico_bytes = max(h.pico_bytes, pico_bytes or 0)
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._etapas.clear()
+
+    def exportar_prometheus(self) -> str:
+        """Serializa os histogramas no formato texto do Prometheus."""
+        linhas = [
+            "# HELP aih_etapa_duracao_segundos Tempo de parede por etapa do pipeline.",
+            "# TYPE aih_etapa_duracao_segundos histogram",
+        ]
+        with self._lock:
+            etapas = sorted(self._etapas.items())
+            for nome, h in etapas:
+                for limite, contagem in zip(BUCKETS, h.contagens):
+                    linhas.append(f'aih_etapa_duracao_segundos_bucket{{etapa="{nome}",le="{limite}"}} {contagem}')
+                linhas.append(f'aih_etapa_duracao_segundos_bucket{{etapa="{nome}",le="+Inf"}} {h.total}')
+                linhas.append(f'aih_etapa_duracao_segundos_sum{{etapa="{nome}"}} {h.soma:.6f}')
+                linhas.append(f'aih_etapa_duracao_segundos_count{{etapa="{nome}"}} {h.total}')
+            linhas += [
+                "# HELP aih_etapa_cpu_segundos_total Tempo de CPU do processo (todas as threads) "
+                "durante a etapa, acumulado; com documentos simultâneos inclui o trabalho dos outros.",
+                "# TYPE aih_etapa_cpu_segundos_total counter",
+            ]
+            linhas += [f'aih_etapa_cpu_segundos_total{{etapa="{nome}"}} {h.cpu:.6f}' for nome, h in etapas]
+            linhas += [
+                "# HELP aih_etapa_pixels_total Pixels de entrada processados por etapa.",
+                "# TYPE aih_etapa_pixels_total counter",
+            ]
+            linhas += [f'aih_etapa_pixels_total{{etapa="{nome}"}} {h.pixels}' for nome, h in etapas]
+            linhas += [
+                "# HELP aih_etapa_pico_memoria_bytes Maior pico de alocação do processo por etapa, "
+                "só em etapas sem outra etapa simultânea.",
+                "# TYPE aih_etapa_pico_memoria_bytes gauge",
+            ]
+            linhas += [f'aih_etapa_pico_memoria_bytes{{etapa="{nome}"}} {h.pico_bytes}' for nome, h in etapas]
+        return "\n".join(linhas) + "\n"
+
+
+REGISTRO = Registro()
+
+
+def registrar(etapa: str, wall_s: float, cpu_s: float = None,
+              pixels: int = None, pico_bytes: int = None) -> None:
+    """Registra uma medição feita fora de etapa() (ex.: tempos devolvidos pelo RapidOCR)."""
+    REGISTRO.observar(etapa, wall_s, cpu_s, pixels, pico_bytes)
+    rastro = _rastro_atual.get()
+    if rastro is not None:
+        rastro.append({
+            "etapa": etapa,
+            "wall_s": round(wall_s, 6),
+            "cpu_s": None if cpu_s is None else round(cpu_s, 6),
+            "pixels": pixels,
+            "pico_bytes": pico_bytes,
+        })
+
+
+def _abrir_medicao(pilha: list) -> tuple:
+    """Marca a thread como medindo; retorna (sozinha, sobreposições até agora)."""
+    with _lock_medindo:
+        if not pilha:
+            _medindo["threads"] += 1
+            if _medindo["threads"] > 1:
+                _medindo["sobreposicoes"] += 1
+        return _medindo["threads"] == 1, _medindo["sobreposicoes"]
+
+
+def _fechar_medicao(pilha: list, sobreposicoes: int) -> bool:
+    """Desmarca a thread ao fechar a última etapa; True se a etapa rodou sem concorrência."""
+    with _lock_medindo:
+        sozinha = _medindo["threads"] == 1 and _medindo["sobreposicoes"] == sobreposicoes
+        if not pilha:
+            _medindo["threads"] -= 1
+        return sozinha
+
+
+@contextlib.contextmanager
+def etapa(nome: str, pixels: int = None):
+    """
+    Mede o bloco como uma etapa do pipeline. O pico de memória fica None se
+    outra thread mediu uma etapa ao mesmo tempo (o tracemalloc é do processo).
+    """
+    memoria = MEDIR_MEMORIA and tracemalloc.is_tracing()
+    if memoria:
+        pilha = getattr(_pilha, "frames", None)
+        if pilha is None:
+            pilha = _pilha.frames = []
+        sozinha, sobreposicoes = _abrir_medicao(pilha)
+        atual = tracemalloc.get_traced_memory()
+        # Preserva o pico da etapa externa antes de zerar para esta; com outra
+        # thread medindo, zerar apagaria o pico dela
+        if pilha:
+            pilha[-1][1] = max(pilha[-1][1], atual[1])
+        if sozinha:
+            tracemalloc.reset_peak()
+        frame = [atual[0], 0]
+        pilha.append(frame)
+    inicio_wall = time.perf_counter()
+    inicio_cpu = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - inicio_wall
+        cpu = time.process_time() - inicio_cpu
+        pico = None
+        if memoria:
+            pilha.pop()
+            pico_abs = max(tracemalloc.get_traced_memory()[1], frame[1])
+            if pilha:
+                pilha[-1][1] = max(pilha[-1][1], pico_abs)
+            if _fechar_medicao(pilha, sobreposicoes) and sozinha:
+                pico = pico_abs - frame[0]
+        registrar(nome, wall, cpu, pixels, pico)
+
+
+def medir(nome: str):
+    """Decorador: mede a função como uma etapa, contando os pixels do 1º argumento se for imagem."""
+    def decorador(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            pixels = getattr(args[0], "size", None) if args and hasattr(args[0], "shape") else None
+            with etapa(nome, pixels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorador
+
+
+@contextlib.contextmanager
+def rastro_documento():
+    """Coleta, numa lista, todas as etapas executadas dentro do bloco."""
+    rastro = []
+    token = _rastro_atual.set(rastro)
+    try:
+        yield rastro
+    finally:
+        _rastro_atual.reset(token)
+
+
+def registrar_rastro(rastro: list) -> None:
+    """Agrega no registro deste processo um rastro medido em outro (ex.: workers do lote)."""
+    for item in rastro:
+        REGISTRO.observar(item["etapa"], item["wall_s"], item["cpu_s"], item["pixels"], item["pico_bytes"])
+
+
+def escrever_arquivo(path: str) -> None:
+    """Grava as métricas num arquivo .prom (textfile collector do node_exporter)."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(REGISTRO.exportar_prometheus())
+    os.replace(tmp, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        corpo = REGISTRO.exportar_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def iniciar_servidor(porta: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Sobe o endpoint /metrics numa thread em segundo plano."""
+    servidor = ThreadingHTTPServer((host, porta), _MetricsHandler)
+    threading.Thread(target=servidor.serve_forever, name="aih-metrics", daemon=True).start()
+    return servidor
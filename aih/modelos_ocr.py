@@ -0,0 +1,378 @@
+"""
+Variantes dos modelos de OCR (FP32 ou INT8) e opções das sessões do onnxruntime.
+
+O RapidOCR roda os modelos de detecção e de reconhecimento em FP32. Aqui:
+
+- `python -m aih.modelos_ocr quantizar` gera, offline, versões INT8 dos modelos
+  det e rec do RapidOCR instalado (o classificador de orientação é pequeno e
+  continua em FP32). O modo "dinamica" (padrão) quantiza os pesos e calcula a
+  escala das ativações a cada inferência. O modo "estatica" calibra as escalas
+  das ativações com fotos de laudos (--calibracao), em QDQ com pesos por canal.
+  Nas CPUs sem kernels inteiros rápidos para ConvInteger, só a estática fica
+  mais rápida que o FP32. Precisa do pacote onnx (pip install onnx), só para
+  quantizar;
+- AIH_OCR_VARIANTE=int8 carrega esses modelos, desde que tenham passado pelo
+  portão de acurácia e latência (python -m benchmarks.modelos_ocr), que compara
+  a variante com o FP32 no corpus sintético e grava aprovacao.json ao lado dos
+  modelos, com o SHA-256 de cada um. Sem aprovação válida para os arquivos
+  presentes, o OCR continua em FP32 e um aviso é emitido;
+- as opções das sessões (nível de otimização do grafo, threads inter-op e o
+  arena de memória da CPU) vêm de variáveis de ambiente. As threads intra-op
+  continuam sendo as de cada modelo do pool (AIH_OCR_THREADS).
+"""
+from __future__ import annotations
+
+import argparse
+import functools
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+from aih.sob_demanda import sob_demanda
+
+ort = sob_demanda("onnxruntime")
+
+VARIANTES = ("fp32", "int8")
+# fp32 (padrão) ou int8; int8 só vale com aprovação do portão
+VARIANTE = os.environ.get("AIH_OCR_VARIANTE") or "fp32"
+PASTA_MODELOS = Path(os.environ.get("AIH_OCR_MODELOS_DIR")
+                     or Path(__file__).resolve().parent / "dados" / "modelos_int8")
+ARQUIVOS_INT8 = {"det": "det_int8.onnx", "rec": "rec_int8.onnx"}
+ARQUIVO_APROVACAO = "aprovacao.json"
+ARQUIVO_QUANTIZACAO = "quantizacao.json"
+# O portão desliga para medir uma variante que ainda não foi aprovada
+EXIGIR_APROVACAO = True
+
+# Nível de otimização do grafo: nome aceito em AIH_OCR_OTIMIZACAO → GraphOptimizationLevel
+NIVEIS_OTIMIZACAO = {
+    "desligada": "ORT_DISABLE_ALL",
+    "basica": "ORT_ENABLE_BASIC",
+    "estendida": "ORT_ENABLE_EXTENDED",
+    "todas": "ORT_ENABLE_ALL",
+}
+OTIMIZACAO = os.environ.get("AIH_OCR_OTIMIZACAO") or "todas"
+INTER_THREADS = max(1, int(os.environ.get("AIH_OCR_INTER_THREADS") or 1))
+# Arena de memória da CPU: desligado no RapidOCR. Ligado, reaproveita os buffers
+# entre inferências (menos alocação, mais memória retida por modelo)
+ARENA = os.environ.get("AIH_OCR_ARENA") == "1"
+ARENA_ESTRATEGIA = os.environ.get("AIH_OCR_ARENA_ESTRATEGIA") or "kSameAsRequested"
+ESTRATEGIAS_ARENA = ("kSameAsRequested", "kNextPowerOfTwo")
+
+# Calibração estática: a detecção guarda as ativações de todas as camadas de uma
+# amostra, então as páginas (até 2000px) entram em recortes deste lado
+LADO_RECORTE_CALIBRACAO = 960
+
+
+def opcoes_sessao(threads: int) -> ort.SessionOptions:
+    """SessionOptions com as opções configuradas e `threads` threads intra-op."""
+    if OTIMIZACAO not in NIVEIS_OTIMIZACAO:
+        raise ValueError(f"AIH_OCR_OTIMIZACAO inválida: {OTIMIZACAO!r} "
+                         f"(use {', '.join(NIVEIS_OTIMIZACAO)})")
+    opcoes = ort.SessionOptions()
+    opcoes.log_severity_level = 4
+    opcoes.graph_optimization_level = getattr(ort.GraphOptimizationLevel, NIVEIS_OTIMIZACAO[OTIMIZACAO])
+    opcoes.intra_op_num_threads = threads
+    opcoes.inter_op_num_threads = INTER_THREADS
+    opcoes.enable_cpu_mem_arena = ARENA
+    return opcoes
+
+
+def provedores() -> list:
+    if ARENA_ESTRATEGIA not in ESTRATEGIAS_ARENA:
+        raise ValueError(f"AIH_OCR_ARENA_ESTRATEGIA inválida: {ARENA_ESTRATEGIA!r} "
+                         f"(use {', '.join(ESTRATEGIAS_ARENA)})")
+    return [("CPUExecutionProvider", {"arena_extend_strategy": ARENA_ESTRATEGIA})]
+
+
+def opcoes_padrao() -> bool:
+    """As opções configuradas são as que o próprio RapidOCR usa?"""
+    return (OTIMIZACAO == "todas" and INTER_THREADS == 1 and not ARENA
+            and ARENA_ESTRATEGIA == "kSameAsRequested")
+
+
+def modelos_fp32() -> dict:
+    """Caminhos dos modelos det, cls e rec que acompanham o RapidOCR instalado."""
+    from rapidocr_onnxruntime.main import DEFAULT_CFG_PATH
+    from rapidocr_onnxruntime.utils import read_yaml
+    from rapidocr_onnxruntime.utils.parse_parameters import update_model_path
+
+    config = update_model_path(read_yaml(DEFAULT_CFG_PATH))
+    return {"det": Path(config["Det"]["model_path"]), "cls": Path(config["Cls"]["model_path"]),
+            "rec": Path(config["Rec"]["model_path"])}
+
+
+def sha256_arquivo(caminho: Path) -> str:
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def modelos_int8(pasta: Path = None) -> dict:
+    """Modelos INT8 presentes na pasta; os que faltam continuam em FP32."""
+    pasta = Path(pasta or PASTA_MODELOS)
+    caminhos = {modelo: pasta / arquivo for modelo, arquivo in ARQUIVOS_INT8.items()}
+    return {modelo: caminho for modelo, caminho in caminhos.items() if caminho.exists()}
+
+
+def _ler_json(caminho: Path):
+    try:
+        return json.loads(caminho.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+
+
+def ler_aprovacao(pasta: Path = None):
+    """Conteúdo de aprovacao.json da pasta dos modelos INT8 (None se não existe)."""
+    return _ler_json(Path(pasta or PASTA_MODELOS) / ARQUIVO_APROVACAO)
+
+
+def ler_quantizacao(pasta: Path = None):
+    """Como os modelos INT8 da pasta foram gerados (quantizacao.json; None se não existe)."""
+    return _ler_json(Path(pasta or PASTA_MODELOS) / ARQUIVO_QUANTIZACAO)
+
+
+def verificar_aprovacao(pasta: Path = None) -> tuple:
+    """(aprovada, motivo): os modelos INT8 presentes são os que passaram pelo portão?"""
+    caminhos = modelos_int8(pasta)
+    if not caminhos:
+        return False, f"sem modelos INT8 em {pasta or PASTA_MODELOS}; rode python -m aih.modelos_ocr quantizar"
+    aprovacao = ler_aprovacao(pasta)
+    if aprovacao is None:
+        return False, "sem aprovação; rode python -m benchmarks.modelos_ocr"
+    if not aprovacao.get("aprovada"):
+        return False, f"reprovada pelo portão: {'; '.join(aprovacao.get('motivos', [])) or 'sem motivo'}"
+    esperados = aprovacao.get("modelos", {})
+    if set(esperados) != set(caminhos):
+        return False, "os modelos INT8 da pasta não são os aprovados; rode o portão de novo"
+    for modelo, caminho in caminhos.items():
+        if esperados[modelo] != sha256_arquivo(caminho):
+            return False, f"{caminho.name} mudou depois da aprovação; rode o portão de novo"
+    return True, f"aprovada ({', '.join(caminhos)} em INT8)"
+
+
+def registrar_aprovacao(pasta: Path, aprovada: bool, motivos: list, metricas: dict) -> Path:
+    """Grava o veredito do portão para os modelos INT8 presentes na pasta."""
+    pasta = Path(pasta)
+    registro = {
+        "aprovada": aprovada,
+        "motivos": motivos,
+        "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "modelos": {modelo: sha256_arquivo(caminho) for modelo, caminho in modelos_int8(pasta).items()},
+        **metricas,
+    }
+    destino = pasta / ARQUIVO_APROVACAO
+    destino.write_text(json.dumps(registro, ensure_ascii=False, indent=2), encoding="utf-8")
+    return destino
+
+
+@functools.lru_cache(maxsize=None)
+def _avisar(mensagem: str) -> None:
+    # Uma vez por mensagem: o pool cria vários modelos com a mesma configuração
+    warnings.warn(mensagem, RuntimeWarning, stacklevel=3)
+
+
+def variante_efetiva() -> str:
+    """A variante que será carregada: int8 só com aprovação válida, senão fp32."""
+    if VARIANTE not in VARIANTES:
+        raise ValueError(f"AIH_OCR_VARIANTE inválida: {VARIANTE!r} (use {', '.join(VARIANTES)})")
+    if VARIANTE == "fp32" or not EXIGIR_APROVACAO:
+        return VARIANTE
+    aprovada, motivo = verificar_aprovacao()
+    if not aprovada:
+        _avisar(f"AIH_OCR_VARIANTE=int8 ignorada, usando FP32: {motivo}")
+        return "fp32"
+    return VARIANTE
+
+
+def criar_rapidocr(classe, threads: int):
+    """
+    classe(...) é o RapidOCR, com os modelos da variante efetiva e as opções de
+    sessão configuradas. Com as opções padrão, as sessões são as do próprio
+    RapidOCR; senão cada sessão é recriada com opcoes_sessao(threads).
+    """
+    parametros = {"intra_op_num_threads": threads, "inter_op_num_threads": 1}
+    if variante_efetiva() == "int8":
+        parametros.update({f"{modelo}_model_path": str(caminho) for modelo, caminho in modelos_int8().items()})
+    ocr = classe(**parametros)
+    if not opcoes_padrao():
+        opcoes = opcoes_sessao(threads)
+        for infer in (ocr.text_det.infer, ocr.text_cls.infer, ocr.text_rec.session):
+            infer.session = ort.InferenceSession(infer.session._model_path, sess_options=opcoes,
+                                                 providers=provedores())
+    return ocr
+
+
+# --- Quantização offline ---
+
+class _Gravador:
+    """Repassa as chamadas a uma sessão do RapidOCR guardando as entradas."""
+
+    def __init__(self, sessao, entradas: list, limite: int):
+        self.sessao, self.entradas, self.limite = sessao, entradas, limite
+
+    def __call__(self, entrada):
+        if len(self.entradas) < self.limite:
+            self.entradas.append(entrada.copy())
+        return self.sessao(entrada)
+
+    def __getattr__(self, nome):
+        return getattr(self.sessao, nome)
+
+
+class _LeitorCalibracao:
+    """Entradas de calibração no formato do onnxruntime (com faixas, para CalibStridedMinMax)."""
+
+    def __init__(self, nome_entrada: str, entradas: list):
+        self.amostras = [{nome_entrada: x} for x in entradas]
+        self.set_range(0, len(self.amostras))
+
+    def __len__(self):
+        return len(self.amostras)
+
+    def set_range(self, start_index: int, end_index: int):
+        self._iter = iter(self.amostras[start_index:end_index])
+
+    def get_next(self):
+        return next(self._iter, None)
+
+
+def _recortes(entrada, lado: int) -> list:
+    """Divide um tensor NCHW em recortes de até lado x lado."""
+    _, _, altura, largura = entrada.shape
+    return [entrada[:, :, y:y + lado, x:x + lado].copy()
+            for y in range(0, altura, lado) for x in range(0, largura, lado)]
+
+
+def capturar_entradas(imagens: list, amostras: int) -> dict:
+    """
+    Roda o OCR rápido do pipeline (FP32) nas imagens e guarda as entradas que
+    chegam aos modelos det e rec: é a distribuição que a calibração precisa ver.
+    """
+    from rapidocr_onnxruntime import RapidOCR
+
+    from aih import pipeline
+
+    ocr = RapidOCR(intra_op_num_threads=os.cpu_count() or 1, inter_op_num_threads=1)
+    entradas = {"det": [], "rec": []}
+    ocr.text_det.infer = _Gravador(ocr.text_det.infer, entradas["det"], amostras)
+    ocr.text_rec.session = _Gravador(ocr.text_rec.session, entradas["rec"], amostras)
+    for caminho in imagens:
+        ocr(pipeline.preprocess_image_fast(pipeline.decode_image(Path(caminho).read_bytes())))
+    recortes = [r for x in entradas["det"] for r in _recortes(x, LADO_RECORTE_CALIBRACAO)]
+    # Recortes de páginas diferentes antes de vários da mesma
+    entradas["det"] = (recortes[::4] + recortes[1::4] + recortes[2::4] + recortes[3::4])[:amostras]
+    return entradas
+
+
+def quantizar(saida: Path, modo: str = "dinamica", modelos: tuple = ("det", "rec"),
+              operadores: list = None, calibracao: list = (), amostras: int = 8) -> dict:
+    """
+    Grava det_int8.onnx e/ou rec_int8.onnx (`modelos`) em `saida` a partir dos
+    modelos FP32 do RapidOCR; o INT8 de um modelo fora de `modelos` é apagado,
+    para ele voltar ao FP32. `operadores` restringe os tipos de nó quantizados
+    (padrão: todos os suportados); `calibracao` são as imagens do modo estático.
+    """
+    try:
+        import onnx
+        from onnx import version_converter
+        from onnxruntime.quantization import (QuantFormat, QuantType, quantize_dynamic,
+                                              quantize_static)
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+    except ImportError as e:
+        raise ImportError("A quantização precisa do pacote onnx: pip install onnx") from e
+    if modo == "estatica" and not calibracao:
+        raise ValueError("o modo estático precisa de imagens de calibração (--calibracao)")
+
+    saida = Path(saida)
+    saida.mkdir(parents=True, exist_ok=True)
+    entradas = capturar_entradas(calibracao, amostras) if modo == "estatica" else None
+    origem = modelos_fp32()
+    relatorio = {"modo": modo, "modelos": list(modelos), "operadores": operadores or "todos"}
+    with tempfile.TemporaryDirectory(prefix="aih-quantizacao-") as tmp:
+        for modelo, arquivo in ARQUIVOS_INT8.items():
+            if modelo not in modelos:
+                (saida / arquivo).unlink(missing_ok=True)
+                continue
+            inicio = time.perf_counter()
+            # Inferência de formas e fusões (Conv+BN) antes de quantizar: sem isso o
+            # quantizador não encontra os pesos das convoluções da detecção
+            preparado = Path(tmp) / f"{modelo}.onnx"
+            quant_pre_process(str(origem[modelo]), str(preparado), skip_symbolic_shape=True)
+            destino = saida / arquivo
+            if modo == "dinamica":
+                quantize_dynamic(str(preparado), str(destino), weight_type=QuantType.QUInt8,
+                                 op_types_to_quantize=operadores)
+            else:
+                # Pesos por canal (as convoluções depthwise não sobrevivem a uma escala
+                # por tensor) exigem DequantizeLinear com eixo, do opset 13 em diante
+                grafo = onnx.load(str(preparado))
+                opset = next(o.version for o in grafo.opset_import if o.domain in ("", "ai.onnx"))
+                if opset < 13:
+                    onnx.save(version_converter.convert_version(grafo, 13), str(preparado))
+                nome_entrada = grafo.graph.input[0].name
+                quantize_static(str(preparado), str(destino),
+                                _LeitorCalibracao(nome_entrada, entradas[modelo]),
+                                quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8,
+                                weight_type=QuantType.QInt8, per_channel=True,
+                                op_types_to_quantize=operadores,
+                                extra_options={"CalibStridedMinMax": 1})
+            relatorio[modelo] = {
+                "fp32_mb": round(origem[modelo].stat().st_size / 2 ** 20, 2),
+                "int8_mb": round(destino.stat().st_size / 2 ** 20, 2),
+                "amostras": len(entradas[modelo]) if entradas else 0,
+                "tempo_s": round(time.perf_counter() - inicio, 1),
+            }
+    return relatorio
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Modelos INT8 do OCR: quantização e estado.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    q = sub.add_parser("quantizar", help="gera det_int8.onnx e rec_int8.onnx")
+    q.add_argument("--saida", type=Path, default=PASTA_MODELOS)
+    q.add_argument("--modo", choices=["dinamica", "estatica"], default="dinamica")
+    q.add_argument("--modelos", nargs="+", choices=list(ARQUIVOS_INT8), default=list(ARQUIVOS_INT8),
+                   help="modelos a quantizar; os outros ficam em FP32")
+    q.add_argument("--operadores", nargs="*", help="tipos de nó a quantizar (ex.: Conv MatMul)")
+    q.add_argument("--calibracao", type=Path,
+                   help="pasta de fotos de laudos para o modo estático "
+                        "(python -m benchmarks.laudos --salvar-corpus PASTA)")
+    q.add_argument("--amostras", type=int, default=8, help="entradas de calibração por modelo")
+    e = sub.add_parser("estado", help="mostra se os modelos INT8 podem ser usados")
+    e.add_argument("--pasta", type=Path, default=PASTA_MODELOS)
+    args = parser.parse_args(argv)
+
+    if args.comando == "estado":
+        aprovada, motivo = verificar_aprovacao(args.pasta)
+        print(f"{'✅' if aprovada else '❌'} {args.pasta}: {motivo}")
+        return 0 if aprovada else 1
+
+    imagens = []
+    if args.calibracao:
+        imagens = sorted(p for p in args.calibracao.rglob("*")
+                         if p.suffix.lower() in (".png", ".jpg", ".jpeg"))
+    try:
+        relatorio = quantizar(args.saida, args.modo, tuple(args.modelos), args.operadores or None,
+                              imagens, args.amostras)
+    except (ImportError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    for modelo in args.modelos:
+        r = relatorio[modelo]
+        calibracao = f", {r['amostras']} amostras de calibração" if r["amostras"] else ""
+        print(f"✅ {modelo}: {r['fp32_mb']}MB → {r['int8_mb']}MB ({relatorio['modo']}{calibracao}, {r['tempo_s']}s)")
+    (Path(args.saida) / ARQUIVO_QUANTIZACAO).write_text(
+        json.dumps(relatorio, ensure_ascii=False, indent=2), encoding="utf-8")
+    print("Antes de usar (AIH_OCR_VARIANTE=int8), aprove no portão: python -m benchmarks.modelos_ocr")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""
+Pool limitado de modelos de OCR compartilhado pelas sessões do processo.
+
+Com um único RapidOCR por processo e o onnxruntime usando todos os núcleos por
+padrão, várias sessões reconhecendo ao mesmo tempo disputam as mesmas CPUs e a
+latência de todas se multiplica. Aqui há no máximo AIH_OCR_MODELOS instâncias,
+cada uma com AIH_OCR_THREADS threads de inferência (por padrão, os núcleos
+divididos entre os modelos), e quem não consegue um modelo espera numa fila
+justa: os pedidos pendentes são atendidos em rodízio entre as sessões, então um
+PDF com muitas páginas digitalizadas não passa na frente de quem chegou depois
+com uma única foto. Com mais de AIH_OCR_FILA_MAX pedidos esperando, novos
+pedidos são recusados com FilaCheia (a interface pede para tentar de novo).
+
+A sessão e o aviso de posição na fila vêm do contexto (contexto_fila), que as
+threads do pipeline já copiam, sem precisar passar parâmetros pelo pipeline.
+"""
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from aih.metrics import registrar
+
+# Intervalo entre avisos de posição enquanto um pedido espera na fila
+INTERVALO_AVISO_S = 0.5
+
+_sessao_atual = contextvars.ContextVar("aih_ocr_sessao", default=None)
+_ao_esperar_atual = contextvars.ContextVar("aih_ocr_ao_esperar", default=None)
+
+
+class FilaCheia(RuntimeError):
+    """A fila do OCR passou do limite; o pedido foi recusado sem esperar."""
+
+    def __init__(self, na_fila: int):
+        super().__init__(f"fila do OCR cheia ({na_fila} pedidos aguardando)")
+        self.na_fila = na_fila
+
+
+def _env_int(nome: str, padrao: int) -> int:
+    valor = os.environ.get(nome)
+    return int(valor) if valor else padrao
+
+
+@contextlib.contextmanager
+def contexto_fila(sessao=None, ao_esperar=None):
+    """
+    Identifica a sessão dos pedidos de OCR feitos dentro do bloco e, opcionalmente,
+    uma função ao_esperar(posicao) chamada enquanto um pedido aguarda na fila.
+    """
+    tokens = (_sessao_atual.set(sessao), _ao_esperar_atual.set(ao_esperar))
+    try:
+        yield
+    finally:
+        _ao_esperar_atual.reset(tokens[1])
+        _sessao_atual.reset(tokens[0])
+
+
+def sessao_atual():
+    """Sessão definida pelo contexto_fila() em vigor (None fora dele)."""
+    return _sessao_atual.get()
+
+
+class _Pedido:
+    __slots__ = ("sessao", "evento", "modelo", "concedido")
+
+    def __init__(self, sessao):
+        self.sessao = sessao
+        self.evento = threading.Event()
+        self.modelo = None
+        self.concedido = False
+
+
+class PoolOCR:
+    """
+    Até `modelos` instâncias criadas sob demanda por fabrica(threads), emprestadas
+    com `with pool.modelo() as ocr:`. Pedidos sem modelo livre esperam em rodízio
+    por sessão; com `fila_maxima` pedidos esperando, novos pedidos levantam FilaCheia.
+    """
+
+    def __init__(self, fabrica, modelos: int = None, threads: int = None, fila_maxima: int = None):
+        cpus = os.cpu_count() or 1
+        self.modelos = max(1, modelos or _env_int("AIH_OCR_MODELOS", max(1, min(4, cpus // 2))))
+        self.threads = max(1, threads or _env_int("AIH_OCR_THREADS", max(1, cpus // self.modelos)))
+        self.fila_maxima = max(0, fila_maxima if fila_maxima is not None
+                               else _env_int("AIH_OCR_FILA_MAX", 8 * self.modelos))
+        self._fabrica = fabrica
+        self._lock = threading.Lock()
+        self._livres = []
+        self._criados = 0
+        # sessão → pedidos pendentes, na ordem em que a sessão será atendida
+        self._filas = OrderedDict()
+        self._na_fila = 0
+
+    # --- Fila justa ---
+
+    def _ordem(self):
+        """Pedidos pendentes na ordem de atendimento (rodízio entre sessões)."""
+        filas = [list(fila) for fila in self._filas.values()]
+        for rodada in range(max((len(f) for f in filas), default=0)):
+            for fila in filas:
+                if rodada < len(fila):
+                    yield fila[rodada]
+
+    def _despachar(self) -> None:
+        """Entrega modelos livres (ou vagas para criar um) aos próximos da fila. Chamar com o lock."""
+        while self._filas and (self._livres or self._criados < self.modelos):
+            sessao, fila = next(iter(self._filas.items()))
+            pedido = fila.popleft()
+            del self._filas[sessao]
+            if fila:
+                # A sessão volta para o fim do rodízio
+                self._filas[sessao] = fila
+            self._na_fila -= 1
+            if self._livres:
+                pedido.modelo = self._livres.pop()
+            else:
+                self._criados += 1
+            pedido.concedido = True
+            pedido.evento.set()
+
+    def posicao(self, pedido: _Pedido) -> int:
+        """Posição (1 = o próximo) do pedido na fila; 0 se já foi atendido."""
+        with self._lock:
+            if pedido.concedido:
+                return 0
+            return next((i for i, p in enumerate(self._ordem(), 1) if p is pedido), 0)
+
+    def estado(self) -> dict:
+        with self._lock:
+            return {"modelos": self.modelos, "threads": self.threads, "criados": self._criados,
+                    "livres": len(self._livres) + self.modelos - self._criados,
+                    "na_fila": self._na_fila, "fila_maxima": self.fila_maxima}
+
+    # --- Empréstimo ---
+
+    def _adquirir(self, sessao, ao_esperar):
+        pedido = _Pedido(sessao)
+        with self._lock:
+            if self._na_fila >= self.fila_maxima and not (self._livres or self._criados < self.modelos):
+                raise FilaCheia(self._na_fila)
+            self._filas.setdefault(sessao, deque()).append(pedido)
+            self._na_fila += 1
+            self._despachar()
+        inicio = time.perf_counter()
+        ultima = None
+        while not pedido.evento.wait(0 if ultima is None else INTERVALO_AVISO_S):
+            posicao = self.posicao(pedido)
+            if ao_esperar is not None and posicao and posicao != ultima:
+                try:
+                    ao_esperar(posicao)
+                except Exception:
+                    pass
+            ultima = posicao
+        if ultima is not None:
+            registrar("ocr_fila_espera", time.perf_counter() - inicio)
+        if pedido.modelo is None:
+            try:
+                pedido.modelo = self._fabrica(self.threads)
+            except Exception:
+                with self._lock:
+                    self._criados -= 1
+                    self._despachar()
+                raise
+        return pedido.modelo
+
+    def _devolver(self, modelo) -> None:
+        with self._lock:
+            self._livres.append(modelo)
+            self._despachar()
+
+    def aquecer(self, funcao=None) -> int:
+        """
+        Cria de uma vez os modelos que ainda faltam, sem passar pela fila, e roda
+        funcao(modelo) em cada um (ex.: uma inferência de teste). Retorna quantos criou.
+        """
+        criados = 0
+        while True:
+            with self._lock:
+                if self._criados >= self.modelos:
+                    return criados
+                self._criados += 1
+            try:
+                modelo = self._fabrica(self.threads)
+            except Exception:
+                with self._lock:
+                    self._criados -= 1
+                    self._despachar()
+                raise
+            try:
+                if funcao is not None:
+                    funcao(modelo)
+            finally:
+                self._devolver(modelo)
+            criados += 1
+
+    @contextlib.contextmanager
+    def modelo(self, sessao=None, ao_esperar=None):
+        """
+        Empresta um modelo pelo tempo do bloco. Sessão e aviso de posição vêm do
+        contexto_fila() quando não são informados.
+        """
+        if sessao is None:
+            sessao = _sessao_atual.get()
+        if ao_esperar is None:
+            ao_esperar = _ao_esperar_atual.get()
+        modelo = self._adquirir(sessao, ao_esperar)
+        try:
+            yield modelo
+        finally:
+            self._devolver(modelo)
@@ -0,0 +1,1232 @@
+from __future__ import annotations
+
+import io
+import re
+import functools
+import os
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from aih import layout, segmentacao
+from aih.sob_demanda import carregar, sob_demanda
+from aih.ocr_pool import FilaCheia, PoolOCR, contexto_fila, sessao_atual
+from aih.lote_ocr import OCR_LOTE, LoteReconhecimento, reconhecer_imagem
+from aih.faixas import em_faixas, halo_denoise, halo_janela
+from aih.duplicatas import (DUPLICATAS, MESCLAR as MESCLAR_DUPLICATAS, IndiceDuplicatas, calcular_impressao,
+                            ler_identificadores, mesmo_paciente)
+from aih import modelos_ocr
+from aih.scanner import ScannerCampos, Substituicoes
+from aih.metrics import etapa, medir, registrar, rastro_documento
+
+# === ADIÇÃO 28: IMPORTS PESADOS SOB DEMANDA ===
+# A interface abre sem carregar OpenCV/NumPy/PyMuPDF/Pillow; cada um é importado
+# no primeiro uso (PDFs com texto nem chegam a carregar o OpenCV) e o tempo de
+# import aparece nas métricas como "import_<módulo>"
+fitz = sob_demanda("fitz")
+np = sob_demanda("numpy")
+cv2 = sob_demanda("cv2")
+Image = sob_demanda("PIL.Image")
+ImageOps = sob_demanda("PIL.ImageOps")
+ExifTags = sob_demanda("PIL.ExifTags")
+
+# Campos extraídos de um laudo, na ordem usada em exportações
+CAMPOS_TEXTO = [
+    "nome_paciente", "cartao_sus", "nome_genitora", "data_nascimento", "sexo", "raca",
+    "telefone_paciente", "prontuario", "endereco_completo", "municipio_referencia",
+    "uf", "cep", "diagnostico", "cpf",
+]
+CAMPOS_CODIGOS = ["cid10", "codigo_procedimento", "cnes"]
+CAMPOS_LAUDO = CAMPOS_TEXTO + CAMPOS_CODIGOS
+# Lidos só pelo layout, das caixas medidas no formulário (a data do laudo
+# distingue, na exportação, uma revisão de um laudo novo do mesmo paciente)
+CAMPOS_LAYOUT = CAMPOS_LAUDO + ["data_laudo"]
+
+# --- FUNÇÕES AUXILIARES ---
+def limpar_texto(txt: str) -> str:
+    return re.sub(r"\s+", " ", txt).strip() if txt else ""
+
+def so_digitos(txt: str) -> str:
+    return re.sub(r"\D", "", txt or "")
+
+# === ADIÇÃO 3: PÓS-PROCESSAMENTO DE TEXTO OCR ===
+# Correções comuns de OCR
+CORRECOES_OCR = Substituicoes({
+    r'\baS\b': 'às',
+    r'\bde[Ss]aide\b': 'de Saúde',
+    r'\bTeI\b': 'Tel',
+    r'\bEsiado\b': 'Estado',
+    r'\bGOVERNODOE[Ss]IADO\b': 'GOVERNO DO ESTADO',
+})
+RE_MAIUSCULAS_LONGAS = re.compile(r'\b[A-ZÀÁÂÃÄÅÆÇÈÉÊËÌÍÎÏÐÑÒÓÔÕÖØÙÚÛÜÝÞ]{15,}\b')
+
+def post_process_ocr_text(text: str) -> str:
+    """
+    Melhora o texto extraído por OCR corrigindo problemas comuns:
+    - Separa palavras em maiúsculas coladas
+    - Corrige caracteres mal interpretados
+    - Melhora espaçamento
+    """
+    if not text:
+        return text
+    
+    # Aplicar correções de caracteres (todas numa passada)
+    corrected_text = CORRECOES_OCR.aplicar(text)
+    
+    # Separar palavras em maiúsculas coladas (ex: JOAOSILVA -> JOAO SILVA)
+    # Procura por padrões onde uma palavra termina e outra começa
+    def separate_uppercase_words(match):
+        word = match.group(0)
+        # Adiciona espaço antes de cada letra maiúscula que segue uma minúscula ou outra maiúscula seguida de minúscula
+        separated = re.sub(r'([a-z])([A-Z])', r'\1 \2', word)
+        # Adiciona espaço entre sequências de maiúsculas e uma palavra que começa com maiúscula
+        separated = re.sub(r'([A-Z]+)([A-Z][a-z])', r'\1 \2', separated)
+        return separated
+    
+    # Separar nomes próprios colados (sequências longas de maiúsculas)
+    # Identifica palavras com mais de 15 caracteres em maiúsculas sem espaços
+    corrected_text = RE_MAIUSCULAS_LONGAS.sub(lambda m: separate_long_uppercase(m.group(0)), corrected_text)
+    
+    return corrected_text
+
+def separate_long_uppercase(word: str) -> str:
+    """
+    Separa palavras longas em maiúsculas pela segmentação por léxico (aih/segmentacao.py).
+    Ex: JULIANAALVESRODRIGUES -> JULIANA ALVES RODRIGUES
+    """
+    if len(word) < 15:
+        return word
+    try:
+        return segmentacao.separar(word)
+    except Exception:
+        # Léxico ausente ou corrompido: mantém a palavra como veio
+        return word
+
+# === ADIÇÃO 8: CORREÇÃO DE ESPAÇAMENTO INDEVIDO ===
+# Padrões de palavras conhecidas que aparecem quebradas
+CORRECOES_PALAVRAS = Substituicoes({
+    r'DOSSA\s+NTOS': 'DOS SANTOS',
+    r'A\s+NATA\s*LIABA\s*RBOSA': 'ANATALIA BARBOSA',
+    r'A\s+NATA\s*LIA': 'ANATALIA',
+    r'BA\s+RBOSA': 'BARBOSA',
+    r'Nomedo': 'Nome do',
+    r'Solicltante': 'Solicitante',
+    r'CURETAGEMPOS': 'CURETAGEM POS',
+    r'ABORTORETIDO': 'ABORTO RETIDO',
+    r'RETIDODE': 'RETIDO DE',
+    r'SANGRAMENTOVAGINAL': 'SANGRAMENTO VAGINAL',
+    r'Telefonede': 'Telefone de',
+    r'Municipiode': 'Municipio de',
+})
+RE_LETRAS_SOLTAS = re.compile(r'\b([A-Z])\s+([A-Z]{1,3})\s+([A-Z]{2,})')
+
+def fix_broken_words(text: str) -> str:
+    """
+    Corrige palavras que foram quebradas incorretamente pelo OCR.
+    Ex: 'DOSSA NTOS' -> 'DOS SANTOS', 'A NATA LIA' -> 'ANATALIA'
+    """
+    if not text:
+        return text
+    
+    fixed_text = CORRECOES_PALAVRAS.aplicar(text)
+    
+    # Corrigir padrão geral: letra + espaço + 1-2 letras + espaço + resto da palavra
+    # Ex: "A NATA" -> "ANATA", mas só se fizer sentido
+    # Procura por padrões como: [LETRA] [1-3 LETRAS] [LETRA] onde há espaços indevidos
+    fixed_text = RE_LETRAS_SOLTAS.sub(lambda m: m.group(1) + m.group(2) + m.group(3) if len(m.group(2)) <= 2 else m.group(0),
+                                      fixed_text)
+    
+    return fixed_text
+
+# === ADIÇÃO 9: NORMALIZAÇÃO DE DATAS ===
+RE_DATA = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{2,4})')
+
+def normalize_dates(text: str) -> str:
+    """
+    Normaliza formatos de data para o padrão DD/MM/AAAA.
+    Ex: '26/3/25' -> '26/03/2025', '1/1/25' -> '01/01/2025'
+    """
+    if not text:
+        return text
+    
+    # Padrão para datas no formato D/M/AA ou DD/M/AA ou D/MM/AA
+    def expand_date(match):
+        day, month, year = match.groups()
+        
+        # Adicionar zero à esquerda se necessário
+        day = day.zfill(2)
+        month = month.zfill(2)
+        
+        # Expandir ano de 2 para 4 dígitos
+        if len(year) == 2:
+            year_int = int(year)
+            # Se ano >= 50, considera 19XX, senão 20XX
+            if year_int >= 50:
+                year = '19' + year
+            else:
+                year = '20' + year
+        
+        return f"{day}/{month}/{year}"
+    
+    # Procurar padrões de data: D/M/AA ou DD/MM/AA
+    normalized = RE_DATA.sub(expand_date, text)
+    
+    return normalized
+
+# === ADIÇÃO 10: EXTRAÇÃO MELHORADA DE CÓDIGOS ===
+SCANNER_CODIGOS = ScannerCampos({
+    # CID-10 (formato: letra seguida de 2-3 dígitos)
+    "cid10": (r'CID\s*10\s*Principal', r'[^A-Z0-9]*([A-Z]\d{2,3})'),
+    # Código do procedimento (geralmente 10 dígitos)
+    "codigo_procedimento": (r'Codigo\s*do\s*Procedimento', r'[^\d]*(\d{10})'),
+    # CNES (7 dígitos)
+    "cnes": (r'CNES', r'[^\d]*(\d{7})'),
+})
+
+@medir("extract_medical_codes")
+def extract_medical_codes(text: str) -> dict:
+    """
+    Extrai códigos médicos específicos do texto.
+    Retorna um dicionário com os códigos encontrados.
+    """
+    return {campo: match.group(1) for campo, match in SCANNER_CODIGOS.buscar(text).items()}
+
+# === ADIÇÃO 4: VALIDAÇÃO DE DADOS ===
+def validar_cpf(cpf: str) -> bool:
+    """Valida CPF usando algoritmo de dígito verificador."""
+    cpf_digits = so_digitos(cpf)
+    if len(cpf_digits) != 11 or cpf_digits == cpf_digits[0] * 11:
+        return False
+    
+    # Validar primeiro dígito
+    soma = sum(int(cpf_digits[i]) * (10 - i) for i in range(9))
+    digito1 = 11 - (soma % 11)
+    digito1 = 0 if digito1 > 9 else digito1
+    
+    if int(cpf_digits[9]) != digito1:
+        return False
+    
+    # Validar segundo dígito
+    soma = sum(int(cpf_digits[i]) * (11 - i) for i in range(10))
+    digito2 = 11 - (soma % 11)
+    digito2 = 0 if digito2 > 9 else digito2
+    
+    return int(cpf_digits[10]) == digito2
+
+def validar_cns(cns: str) -> bool:
+    """Valida Cartão Nacional de Saúde (CNS)."""
+    cns_digits = so_digitos(cns)
+    if len(cns_digits) != 15:
+        return False
+    
+    # CNS começando com 1 ou 2
+    if cns_digits[0] in ['1', '2']:
+        soma = sum(int(cns_digits[i]) * (15 - i) for i in range(15))
+        return soma % 11 == 0
+    
+    # CNS começando com 7, 8 ou 9
+    if cns_digits[0] in ['7', '8', '9']:
+        soma = sum(int(cns_digits[i]) * (15 - i) for i in range(15))
+        return soma % 11 == 0
+    
+    return False
+
+def validar_cep(cep: str) -> bool:
+    """Valida formato de CEP."""
+    cep_digits = so_digitos(cep)
+    return len(cep_digits) == 8
+
+def formatar_cpf(cpf: str) -> str:
+    """Formata CPF no padrão XXX.XXX.XXX-XX."""
+    digits = so_digitos(cpf)
+    if len(digits) == 11:
+        return f"{digits[:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:]}"
+    return cpf
+
+def formatar_cep(cep: str) -> str:
+    """Formata CEP no padrão XXXXX-XXX."""
+    digits = so_digitos(cep)
+    if len(digits) == 8:
+        return f"{digits[:5]}-{digits[5:]}"
+    return cep
+
+def formatar_telefone(telefone: str) -> str:
+    """Formata telefone no padrão (XX) XXXXX-XXXX ou (XX) XXXX-XXXX."""
+    digits = so_digitos(telefone)
+    if len(digits) == 11:
+        return f"({digits[:2]}) {digits[2:7]}-{digits[7:]}"
+    elif len(digits) == 10:
+        return f"({digits[:2]}) {digits[2:6]}-{digits[6:]}"
+    return telefone
+
+# === ADIÇÃO 5: FORMATAÇÃO DO TEXTO DE DEBUG ===
+# Padrões que indicam início de nova seção
+SECOES_DEBUG = [
+    'Identificacao do Estabelecimento',
+    'Identificacao do Paciente',
+    'Nome do Paciente',
+    'Data de Nasc',
+    'Endereco Residencial',
+    'Justificativa da Internacao',
+    'Diagnostico Inicial',
+    'Procedimento Solicitado',
+    'AUTORIZACAO'
+]
+# Campos após os quais entra uma quebra de linha
+QUEBRAS_DEBUG = [re.compile(p) for p in (r'(CNS\s+\d+)', r'(CPF\s+[\d.-]+)', r'(CEP\s+[\d.-]+)', r'(Telefone[^)]+\))')]
+RE_QUEBRAS_MULTIPLAS = re.compile(r'\n{3,}')
+
+def formatar_texto_debug(text: str) -> str:
+    """Formata o texto extraído para melhor legibilidade."""
+    if not text:
+        return "Nenhum texto extraído."
+    
+    # Adiciona quebras de linha após campos comuns
+    formatted = text
+    
+    for marker in SECOES_DEBUG:
+        formatted = formatted.replace(marker, f'\n\n{marker}')
+    
+    # Adiciona quebra após campos específicos
+    for regex in QUEBRAS_DEBUG:
+        formatted = regex.sub(r'\1\n', formatted)
+    
+    # Remove múltiplas quebras de linha
+    formatted = RE_QUEBRAS_MULTIPLAS.sub('\n\n', formatted)
+    
+    return formatted.strip()
+
+# --- MOTORES DE ANÁLISE (A BASE ESTÁVEL) ---
+SCANNER_PDF = ScannerCampos({
+    "nome_paciente": (r"Nome do Paciente", r"\s+([A-ZÀ-ÿ\s]+?)\s+CNS"),
+    "cartao_sus": (r"CNS", r"\s+(\d{15})\s+"),
+    "nome_genitora": (r"Nome da Mãe", r"\s+([A-ZÀ-ÿ\s]+?)\s+Endereço Residencial"),
+    "data_nascimento": (r"Data de Nasc", r"\s+([\d/]+)\s+Sexo"),
+    "sexo": (r"Sexo", r"\s+(Feminino|Masculino)\s+Raça/cor"),
+    "raca": (r"Raça/cor", r"\s+([A-ZÀ-ÿ]+)\s+Nome do Responsável"),
+    "telefone_paciente": (r"Telefone de Contato", r"\s+([()\d\s-]+?)\s+Telefone Celular"),
+    "prontuario": (r"Núm\. Prontuário", r"\s+(\d+)\s+Telefone de Contato"),
+    "endereco_completo": (r"Endereço Residencial \(Rua, Av etc\)", r"\s+(.*?)\s+CPF"),
+    "municipio_referencia": (r"Municipio de Referência", r"\s+([A-ZÀ-ÿ\s]+?)\s+Cód\. IBGE"),
+    "uf": (r"UF", r"\s+([A-Z]{2})\s+CEP"),
+    "cep": (r"CEP", r"\s+([\d.-]+?)\s+Diretor Clinico"),
+    "diagnostico": (r"Diagnóstico Inicial", r"\s+(.*?)\s+CID 10 Principal"),
+    "cpf": (r"CPF", r"\s+([\d.-]+)\s+Municipio"),
+})
+
+@medir("parse_pdf_text")
+def parse_pdf_text(full_text: str):
+    data = {}
+    for field, match in SCANNER_PDF.buscar(full_text).items():
+        data[field] = limpar_texto(match.group(1))
+    if data.get("cartao_sus"): data["cartao_sus"] = so_digitos(data["cartao_sus"])
+    if data.get("cep"): data["cep"] = so_digitos(data["cep"])
+    if data.get("cpf"): data["cpf"] = so_digitos(data["cpf"])
+    if data.get("telefone_paciente"): data["telefone_paciente"] = so_digitos(data["telefone_paciente"])
+    return data
+
+SCANNER_OCR = ScannerCampos({
+    "nome_paciente": (r"Paciente", r"\s*([A-Z\s]+?)\s*CNS"),
+    "cartao_sus": (r"CNS", r"\s*(\d{15})"),
+    "nome_genitora": (r"Mae", r"\s*([A-Z\s]+?)\s*(Feminino|Endereco)"),
+    "data_nascimento": (r"Nasc", r"\s*([\d/]+)"),
+    "sexo": (r"(Feminino|Masculino)", r""),
+    "raca": (r"Raca/cor", r"\s*([A-Z]+)"),
+    "telefone_paciente": (r"\((\d{2})\)", r"\s?(\d{4,5}-?\d{4})"),
+    "prontuario": (r"Prontuario", r"\s*(\d+)"),
+    "diagnostico": (r"Diagnostico\s*Inicial", r"\s*(.*?)\s*CID"),
+    "cpf": (r"CPF", r"\s*([\d.-]+)"),
+    "endereco_completo": (r"RUA", r"\s*([A-Z\s,\d]+)"),
+    "municipio_referencia": (r"Municipio\s*de\s*Referencia", r"\s*([A-Z\s]+)"),
+    "uf": (r"UF", r"\s*([A-Z]{2})"),
+    "cep": (r"CEP", r"\s*([\d.-]+)"),
+})
+
+@medir("parse_ocr_text")
+def parse_ocr_text(full_text: str):
+    data = {}
+    encontrados = SCANNER_OCR.buscar(full_text)
+    # Mesma ordem de campos do dicionário de padrões
+    for field in SCANNER_OCR.padroes:
+        match = encontrados.get(field)
+        if match:
+            value = next((g for g in match.groups() if g is not None and not g.lower() in ['feminino', 'endereco']), None)
+            if value: data[field] = limpar_texto(value)
+    if data.get("cartao_sus"): data["cartao_sus"] = so_digitos(data["cartao_sus"])
+    if data.get("cep"): data["cep"] = so_digitos(data["cep"])
+    if data.get("cpf"): data["cpf"] = so_digitos(data["cpf"])
+    if data.get("telefone_paciente"): data["telefone_paciente"] = so_digitos(data["telefone_paciente"])
+    return data
+
+# === ADIÇÃO 29: EVENTOS DE PROGRESSO DA EXTRAÇÃO ===
+class Emissor:
+    """
+    Repassa eventos de progresso de um documento para ao_evento(dict). Cada campo
+    é emitido quando aparece ou muda de valor; chamado também pelas threads das
+    páginas de PDF (ao_evento precisa ser thread-safe, ex.: queue.Queue.put).
+    """
+
+    def __init__(self, ao_evento=None):
+        self.ao_evento = ao_evento
+        self._campos = {}
+        self._lock = threading.Lock()
+
+    def evento(self, nome: str, **dados) -> None:
+        if self.ao_evento is not None:
+            self.ao_evento({"evento": nome, **dados})
+
+    def campos(self, dados: dict, nivel: str) -> None:
+        if self.ao_evento is None:
+            return
+        with self._lock:
+            novos = {c: v for c, v in dados.items() if v and self._campos.get(c) != v}
+            self._campos.update(novos)
+        for campo, valor in novos.items():
+            self.evento("campo", campo=campo, valor=valor, nivel=nivel)
+
+_emissor_atual = contextvars.ContextVar("aih_emissor", default=Emissor())
+
+def emissor() -> Emissor:
+    """Emissor do documento em processamento (sem ouvinte fora de processar_documento)."""
+    return _emissor_atual.get()
+
+# --- PRÉ-PROCESSAMENTO E EXTRAÇÃO (COM AS NOVAS ADIÇÕES) ---
+# === ADIÇÃO 27: POOL LIMITADO DE MODELOS DE OCR ===
+def criar_modelo_ocr(threads: int):
+    """RapidOCR com o número de threads de inferência fixado (det, cls e rec)."""
+    with etapa("import_rapidocr_onnxruntime"):
+        from rapidocr_onnxruntime import RapidOCR
+    with etapa("ocr_carga_modelo"):
+        # === ADIÇÃO 37: VARIANTE INT8 E OPÇÕES DAS SESSÕES DO ONNXRUNTIME ===
+        # AIH_OCR_VARIANTE=int8 (se aprovada pelo portão), AIH_OCR_OTIMIZACAO,
+        # AIH_OCR_INTER_THREADS e AIH_OCR_ARENA; veja aih/modelos_ocr.py
+        return modelos_ocr.criar_rapidocr(RapidOCR, threads)
+
+@functools.lru_cache(maxsize=1)
+def get_ocr_pool() -> PoolOCR:
+    """Pool de modelos de OCR do processo, compartilhado por todas as sessões."""
+    return PoolOCR(criar_modelo_ocr)
+
+# === ADIÇÃO 33: RECONHECIMENTO EM LOTE ENTRE DOCUMENTOS ===
+@functools.lru_cache(maxsize=1)
+def get_lote_reconhecimento() -> LoteReconhecimento:
+    """Junta as linhas de documentos simultâneos num lote de reconhecimento (AIH_OCR_LOTE=1)."""
+    return LoteReconhecimento(get_ocr_pool())
+
+# === ADIÇÃO 34: REAPROVEITAMENTO DE FOTOS REPETIDAS DO MESMO LAUDO ===
+@functools.lru_cache(maxsize=1)
+def get_indice_duplicatas() -> IndiceDuplicatas:
+    """Impressões dos laudos já extraídos no processo (AIH_DUPLICATAS=1)."""
+    return IndiceDuplicatas()
+
+# === ADIÇÃO 28: AQUECIMENTO DO OCR EM SEGUNDO PLANO ===
+# Desligado por padrão; AIH_OCR_AQUECER=1 carrega os modelos logo na subida do app
+OCR_AQUECER = os.environ.get("AIH_OCR_AQUECER") == "1"
+
+def aquecer_ocr() -> float:
+    """
+    Importa a pilha de visão, cria os modelos do pool e roda uma inferência de
+    teste em cada um, para que o primeiro documento não pague a carga do ONNX.
+    Retorna o tempo gasto (também registrado como a etapa "ocr_aquecimento").
+    """
+    inicio = time.perf_counter()
+    with etapa("ocr_aquecimento"):
+        carregar(np, cv2, Image)
+        amostra = np.full((64, 320), 255, dtype=np.uint8)
+        cv2.putText(amostra, "LAUDO AIH 0123", (8, 44), cv2.FONT_HERSHEY_SIMPLEX, 1.0, 0, 2)
+        get_ocr_pool().aquecer(lambda ocr: ocr(amostra))
+    return time.perf_counter() - inicio
+
+def iniciar_aquecimento() -> threading.Thread:
+    """Roda aquecer_ocr() numa thread daemon; falhas só adiam a carga para o primeiro uso."""
+    def alvo():
+        try:
+            aquecer_ocr()
+        except Exception:
+            pass
+    thread = threading.Thread(target=alvo, name="aih-aquecimento-ocr", daemon=True)
+    thread.start()
+    return thread
+
+# === ADIÇÃO 22: RESOLUÇÃO ALVO PARA O OCR ===
+# Altura mínima de texto (px) para o reconhecedor do RapidOCR, cuja entrada tem 48px
+ALTURA_TEXTO_OCR_PX = 24
+# O corpo do laudo usa fonte de ~10pt numa página A4 (842pt de altura)
+FRACAO_ALTURA_TEXTO = 10 / 842
+# O RapidOCR reduz qualquer entrada para no máximo 2000px no lado maior (max_side_len)
+MAX_LADO_OCR = 2000
+# Lado maior com que as imagens são processadas: acima disso só aumenta o custo
+LADO_MAIOR_ALVO = min(MAX_LADO_OCR, round(ALTURA_TEXTO_OCR_PX / FRACAO_ALTURA_TEXTO))
+
+def reduzir_para_alvo(image: np.ndarray, lado_maior: int = LADO_MAIOR_ALVO) -> np.ndarray:
+    """Reduz a imagem para que o lado maior não passe do alvo."""
+    height, width = image.shape[:2]
+    escala = lado_maior / max(height, width)
+    if escala >= 1:
+        return image
+    new_size = (max(1, round(width * escala)), max(1, round(height * escala)))
+    return cv2.resize(image, new_size, interpolation=cv2.INTER_AREA)
+
+# === ADIÇÃO 13: CORREÇÃO DE PERSPECTIVA ===
+@medir("correct_perspective")
+def correct_perspective(image: np.ndarray) -> np.ndarray:
+    """
+    Detecta e corrige perspectiva de documentos fotografados de ângulo.
+    Encontra os 4 cantos do documento e aplica transformação de perspectiva.
+    """
+    try:
+        localizacao = localizar_documento(image)
+        return retificar_documento(image, {**localizacao, "recorte": None})
+    except Exception:
+        return image
+
+# === ADIÇÃO 14: AJUSTE AUTOMÁTICO DE BRILHO E CONTRASTE ===
+@medir("auto_adjust_brightness_contrast")
+def auto_adjust_brightness_contrast(image: np.ndarray) -> np.ndarray:
+    """
+    Ajusta automaticamente brilho e contraste da imagem.
+    Útil para fotos escuras ou com pouca luz.
+    """
+    try:
+        # Aplicar equalização de histograma adaptativa (CLAHE)
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        enhanced = clahe.apply(image)
+        
+        # Ajuste adicional de contraste
+        # Calcular valores mínimo e máximo
+        min_val = np.percentile(enhanced, 2)
+        max_val = np.percentile(enhanced, 98)
+        
+        # Normalizar entre 0 e 255
+        if max_val > min_val:
+            enhanced = np.clip((enhanced - min_val) * (255.0 / (max_val - min_val)), 0, 255).astype(np.uint8)
+        
+        return enhanced
+    except Exception:
+        return image
+
+# === ADIÇÃO 15: UPSCALING DE IMAGEM ===
+@medir("upscale_image")
+def upscale_image(image: np.ndarray, scale_factor: float = 2.0) -> np.ndarray:
+    """
+    Aumenta a resolução da imagem usando interpolação de alta qualidade.
+    Útil para fotos pequenas ou de baixa resolução.
+    """
+    try:
+        height, width = image.shape[:2]
+        
+        # Só fazer upscale se a imagem for pequena, sem passar do lado maior alvo
+        scale_factor = min(scale_factor, LADO_MAIOR_ALVO / max(width, height))
+        if scale_factor > 1.1:
+            new_width = int(width * scale_factor)
+            new_height = int(height * scale_factor)
+            
+            # Usar interpolação cúbica para melhor qualidade
+            upscaled = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_CUBIC)
+            
+            # Aplicar sharpening leve para melhorar nitidez
+            # === ADIÇÃO 35: EM FAIXAS PARALELAS (AIH_PRE_THREADS) ===
+            return realcar(upscaled)
+        
+        return image
+    except Exception:
+        return image
+
+# === ADIÇÃO 16: DETECÇÃO E RECORTE DE BORDAS ===
+@medir("detect_and_crop_document")
+def detect_and_crop_document(image: np.ndarray) -> np.ndarray:
+    """
+    Detecta as bordas do documento e recorta apenas a área relevante.
+    Remove fundos desnecessários.
+    """
+    try:
+        localizacao = localizar_documento(image)
+        return retificar_documento(image, {**localizacao, "cantos": None})
+    except Exception:
+        return image
+
+# === ADIÇÃO 17: VALIDAÇÃO DE QUALIDADE DA IMAGEM ===
+def _qualidade(proxy: np.ndarray, width: int, height: int) -> dict:
+    """Métricas de qualidade: resolução da original, blur e brilho da imagem reduzida."""
+    quality = {
+        'is_blurry': False,
+        'is_too_dark': False,
+        'is_too_bright': False,
+        'is_low_resolution': False,
+        'blur_score': 0,
+        'brightness': 0,
+        'resolution': (0, 0)
+    }
+    
+    try:
+        # Verificar resolução
+        quality['resolution'] = (width, height)
+        quality['is_low_resolution'] = width < 800 or height < 800
+        
+        # Verificar blur (usando variância do Laplaciano)
+        _, desvio = cv2.meanStdDev(cv2.Laplacian(proxy, cv2.CV_32F))
+        laplacian_var = float(desvio[0, 0]) ** 2
+        quality['blur_score'] = laplacian_var
+        quality['is_blurry'] = laplacian_var < 100  # Threshold empírico
+        
+        # Verificar brilho
+        brightness = float(cv2.mean(proxy)[0])
+        quality['brightness'] = brightness
+        quality['is_too_dark'] = brightness < 80
+        quality['is_too_bright'] = brightness > 200
+        
+        return quality
+    except Exception:
+        return quality
+
+@medir("assess_image_quality")
+def assess_image_quality(image: np.ndarray) -> dict:
+    """
+    Avalia a qualidade da imagem e retorna métricas.
+    """
+    height, width = image.shape[:2]
+    return _qualidade(reduzir_para_alvo(image, LADO_PROXY_LOCALIZACAO), width, height)
+
+# === ADIÇÃO 31: LOCALIZAÇÃO DO DOCUMENTO EM UMA PASSADA ===
+# Bordas, contornos e métricas de qualidade são calculados uma vez, numa cópia
+# reduzida; recorte e perspectiva viram um único warp na resolução original.
+LADO_PROXY_LOCALIZACAO = 640
+# Recorte só vale a pena se mantiver mais que isso da área da imagem
+AREA_MINIMA_RECORTE = 0.5
+
+def ordenar_cantos(pts: np.ndarray) -> np.ndarray:
+    """Ordena 4 pontos: topo-esquerda, topo-direita, base-direita, base-esquerda."""
+    rect = np.zeros((4, 2), dtype="float32")
+    
+    # Somar coordenadas: top-left terá menor soma, bottom-right maior
+    s = pts.sum(axis=1)
+    rect[0] = pts[np.argmin(s)]
+    rect[2] = pts[np.argmax(s)]
+    
+    # Diferença: top-right terá menor diferença, bottom-left maior
+    diff = np.diff(pts, axis=1)
+    rect[1] = pts[np.argmin(diff)]
+    rect[3] = pts[np.argmax(diff)]
+    return rect
+
+@medir("localizar_documento")
+def localizar_documento(image: np.ndarray) -> dict:
+    """
+    Procura o documento numa cópia reduzida da imagem (LADO_PROXY_LOCALIZACAO).
+    Retorna a qualidade (como assess_image_quality), o recorte (x, y, w, h) e os
+    4 cantos do documento, já nas coordenadas da imagem original. Recorte e
+    cantos são None quando não foram encontrados.
+    """
+    height, width = image.shape[:2]
+    proxy = reduzir_para_alvo(image, LADO_PROXY_LOCALIZACAO)
+    escala = proxy.shape[1] / width
+    quality = _qualidade(proxy, width, height)
+    localizacao = {"qualidade": quality, "recorte": None, "cantos": None}
+    
+    # Fotos escuras ou estouradas têm pouco contraste para o Canny
+    if quality['is_too_dark'] or quality['is_too_bright']:
+        proxy = auto_adjust_brightness_contrast(proxy)
+    
+    # Bordas e contornos, uma vez só
+    blurred = cv2.GaussianBlur(proxy, (5, 5), 0)
+    edges = cv2.Canny(blurred, 50, 150)
+    dilated = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return localizacao
+    largest_contour = max(contours, key=cv2.contourArea)
+    
+    # Recorte: bounding box do maior contorno, com margem de 2%
+    x, y, w, h = (v / escala for v in cv2.boundingRect(largest_contour))
+    margin = min(w, h) * 0.02
+    x0, y0 = max(0, int(x - margin)), max(0, int(y - margin))
+    x1, y1 = min(width, int(x + w + margin)), min(height, int(y + h + margin))
+    if (x1 - x0) * (y1 - y0) > width * height * AREA_MINIMA_RECORTE:
+        localizacao["recorte"] = (x0, y0, x1 - x0, y1 - y0)
+    
+    # Perspectiva: o mesmo contorno aproximado por um quadrilátero
+    epsilon = 0.02 * cv2.arcLength(largest_contour, True)
+    approx = cv2.approxPolyDP(largest_contour, epsilon, True)
+    if len(approx) == 4:
+        localizacao["cantos"] = ordenar_cantos(approx.reshape(4, 2) / escala)
+    return localizacao
+
+@medir("retificar_documento")
+def retificar_documento(image: np.ndarray, localizacao: dict) -> np.ndarray:
+    """
+    Aplica o resultado de localizar_documento() na resolução original: com os 4
+    cantos, um único warpPerspective (que já recorta); senão, só o recorte.
+    """
+    if localizacao["cantos"] is not None:
+        (tl, tr, br, bl) = rect = localizacao["cantos"]
+        
+        # Calcular largura e altura do documento corrigido
+        maxWidth = int(max(np.hypot(*(br - bl)), np.hypot(*(tr - tl))))
+        maxHeight = int(max(np.hypot(*(tr - br)), np.hypot(*(tl - bl))))
+        dst = np.array([
+            [0, 0],
+            [maxWidth - 1, 0],
+            [maxWidth - 1, maxHeight - 1],
+            [0, maxHeight - 1]], dtype="float32")
+        M = cv2.getPerspectiveTransform(rect, dst)
+        return cv2.warpPerspective(image, M, (maxWidth, maxHeight))
+    
+    if localizacao["recorte"] is not None:
+        x, y, w, h = localizacao["recorte"]
+        return image[y:y+h, x:x+w]
+    return image
+
+# === ADIÇÃO 32: ESTIMATIVA RÁPIDA DA INCLINAÇÃO ===
+# A inclinação é estimada pelo perfil de projeção horizontal do texto numa cópia
+# reduzida e binarizada: no ângulo certo as linhas de texto viram picos estreitos
+# no histograma das linhas, e a soma dos quadrados do histograma é máxima.
+LADO_ESTIMATIVA_INCLINACAO = 1000
+MAX_INCLINACAO_GRAUS = 10
+# Pontos de tinta usados na busca (amostrados quando a página tem mais)
+MAX_PONTOS_INCLINACAO = 30000
+# Abaixo disso (em graus) a imagem não é girada
+INCLINACAO_MINIMA_GRAUS = float(os.environ.get("AIH_DESKEW_MIN_GRAUS") or 0.3)
+
+def _nitidez_perfil(xs: np.ndarray, ys: np.ndarray, angulos: np.ndarray) -> np.ndarray:
+    """Para cada ângulo, a soma dos quadrados do perfil de projeção dos pontos girados."""
+    rad = np.deg2rad(angulos).astype(np.float32)[:, None]
+    # Mesma convenção do cv2.getRotationMatrix2D: y' = -sen(a)·x + cos(a)·y
+    linhas = np.rint(ys * np.cos(rad) - xs * np.sin(rad)).astype(np.int32)
+    linhas -= linhas.min(axis=1, keepdims=True)
+    altura = int(linhas.max()) + 1
+    # Um histograma por ângulo num único bincount, cada ângulo na sua faixa
+    linhas += np.arange(len(angulos), dtype=np.int32)[:, None] * altura
+    perfis = np.bincount(linhas.ravel(), minlength=len(angulos) * altura).reshape(len(angulos), altura)
+    return (perfis.astype(np.float64) ** 2).sum(axis=1)
+
+@medir("estimar_inclinacao")
+def estimar_inclinacao(image: np.ndarray) -> float:
+    """
+    Ângulo, em graus, que deixa as linhas de texto na horizontal (pronto para
+    cv2.getRotationMatrix2D). Busca grossa de 0,5° em ±MAX_INCLINACAO_GRAUS e
+    refinamento de 0,05° em volta do melhor. Retorna 0 se não há texto.
+    """
+    proxy = reduzir_para_alvo(image, LADO_ESTIMATIVA_INCLINACAO)
+    _, binaria = cv2.threshold(proxy, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    ys, xs = np.nonzero(binaria)
+    if len(xs) < 100:
+        return 0.0
+    passo = -(-len(xs) // MAX_PONTOS_INCLINACAO)
+    xs, ys = xs[::passo].astype(np.float32), ys[::passo].astype(np.float32)
+    
+    grossos = np.arange(-MAX_INCLINACAO_GRAUS, MAX_INCLINACAO_GRAUS + 0.25, 0.5)
+    melhor = grossos[np.argmax(_nitidez_perfil(xs, ys, grossos))]
+    finos = melhor + np.arange(-0.5, 0.5 + 0.025, 0.05)
+    # O ângulo não depende da escala: a cópia reduzida só limita o custo
+    return float(finos[np.argmax(_nitidez_perfil(xs, ys, finos))])
+
+@medir("deskew")
+def deskew(image: np.ndarray) -> np.ndarray:
+    """Função para corrigir a inclinação da imagem."""
+    angle = estimar_inclinacao(image)
+    if abs(angle) < INCLINACAO_MINIMA_GRAUS:
+        return image
+    (h, w) = image.shape[:2]
+    center = (w // 2, h // 2)
+    M = cv2.getRotationMatrix2D(center, angle, 1.0)
+    rotated = cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+    return rotated
+
+# === ADIÇÃO 21: PIPELINE SEM CÓPIAS (NDARRAY ATÉ O OCR) ===
+@medir("decode_image")
+def decode_image(image_bytes: bytes, lado_maior: int = LADO_MAIOR_ALVO) -> np.ndarray:
+    """
+    Decodifica a imagem, aplica a autorotação do EXIF e converte para cinza,
+    já limitada ao lado maior alvo (None mantém a resolução original).
+    """
+    pil_img = Image.open(io.BytesIO(image_bytes))
+    
+    # === ADIÇÃO 22: DECODIFICAÇÃO EM RESOLUÇÃO REDUZIDA ===
+    # Em JPEG, decodifica direto em cinza e na menor escala DCT (1/2, 1/4, 1/8)
+    # que ainda cubra o alvo, sem materializar a foto inteira em RGB
+    if lado_maior and pil_img.format == 'JPEG':
+        escala = lado_maior / max(pil_img.size)
+        if escala < 1:
+            pil_img.draft('L', (int(pil_img.width * escala), int(pil_img.height * escala)))
+    
+    # Autorotação
+    try:
+        for orientation in ExifTags.TAGS.keys():
+            if ExifTags.TAGS[orientation] == 'Orientation': break
+        exif = dict(pil_img._getexif().items())
+        if exif[orientation] == 3: pil_img = pil_img.rotate(180, expand=True)
+        elif exif[orientation] == 6: pil_img = pil_img.rotate(270, expand=True)
+        elif exif[orientation] == 8: pil_img = pil_img.rotate(90, expand=True)
+    except (AttributeError, KeyError, IndexError): pass
+    
+    gray_img = np.array(pil_img.convert('L'))
+    if lado_maior:
+        gray_img = reduzir_para_alvo(gray_img, lado_maior)
+    return gray_img
+
+# === ADIÇÃO 35: DENOISE E BINARIZAÇÃO EM FAIXAS PARALELAS ===
+# Janelas dos filtros; o halo das faixas (aih/faixas.py) sai delas
+DENOISE_H, DENOISE_TEMPLATE, DENOISE_BUSCA = 10, 7, 21
+BLOCO_BINARIZACAO, C_BINARIZACAO = 35, 15
+
+# Sharpening do upscale, mesclado 70% realçado + 30% original para não exagerar
+KERNEL_REALCE = ((-1, -1, -1),
+                 (-1, 9, -1),
+                 (-1, -1, -1))
+
+# `threads` substitui AIH_PRE_THREADS (o benchmark das faixas compara 1 × N)
+def remover_ruido(image: np.ndarray, threads: int = None) -> np.ndarray:
+    """fastNlMeansDenoising da página, em faixas quando AIH_PRE_THREADS > 1."""
+    return em_faixas(
+        lambda faixa: cv2.fastNlMeansDenoising(faixa, None, DENOISE_H, DENOISE_TEMPLATE, DENOISE_BUSCA),
+        image, halo_denoise(DENOISE_TEMPLATE, DENOISE_BUSCA), threads)
+
+def binarizar(image: np.ndarray, threads: int = None) -> np.ndarray:
+    """Binarização adaptativa gaussiana, em faixas quando AIH_PRE_THREADS > 1."""
+    return em_faixas(
+        lambda faixa: cv2.adaptiveThreshold(faixa, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                                            BLOCO_BINARIZACAO, C_BINARIZACAO),
+        image, halo_janela(BLOCO_BINARIZACAO), threads)
+
+def realcar(image: np.ndarray, threads: int = None) -> np.ndarray:
+    """Sharpening leve (KERNEL_REALCE), em faixas quando AIH_PRE_THREADS > 1."""
+    kernel = np.array(KERNEL_REALCE)
+    return em_faixas(
+        lambda faixa: cv2.addWeighted(cv2.filter2D(faixa, -1, kernel), 0.7, faixa, 0.3, 0),
+        image, halo_janela(kernel.shape[0]), threads)
+
+def preprocess_image(gray_img: np.ndarray) -> np.ndarray:
+    """Aplica o pré-processamento completo sobre a imagem em cinza."""
+    try:
+        # === ADIÇÃO 31: LOCALIZAR O DOCUMENTO (QUALIDADE, RECORTE E PERSPECTIVA) ===
+        localizacao = localizar_documento(gray_img)
+        quality = localizacao["qualidade"]
+        
+        # === ADIÇÃO 16 E 13: RECORTAR E CORRIGIR PERSPECTIVA NUM ÚNICO WARP ===
+        gray_img = retificar_documento(gray_img, localizacao)
+        
+        # === ADIÇÃO 15: UPSCALING SE NECESSÁRIO ===
+        if quality['is_low_resolution']:
+            gray_img = upscale_image(gray_img, scale_factor=2.0)
+        
+        # === ADIÇÃO 14: AJUSTAR BRILHO/CONTRASTE SE NECESSÁRIO ===
+        if quality['is_too_dark'] or quality['is_too_bright']:
+            gray_img = auto_adjust_brightness_contrast(gray_img)
+        
+        # === ADIÇÃO 1: REMOÇÃO DE RUÍDO ===
+        with etapa("denoise", gray_img.size):
+            denoised_img = remover_ruido(gray_img)
+
+        # === ADIÇÃO 2: CORREÇÃO DE INCLINAÇÃO (DESKEW) ===
+        deskewed_img = deskew(denoised_img)
+
+        # Binarização Adaptativa (que já tínhamos)
+        with etapa("threshold", deskewed_img.size):
+            return binarizar(deskewed_img)
+    except Exception:
+        return gray_img
+
+def encode_png(image: np.ndarray) -> bytes:
+    _, buffer = cv2.imencode('.png', image)
+    return buffer.tobytes()
+
+def preprocess_image_for_ocr(image_bytes: bytes) -> bytes:
+    """
+    Compatibilidade: pré-processa e devolve a imagem como PNG.
+    O pipeline de OCR usa preprocess_image() direto, sem codificar.
+    """
+    try:
+        return encode_png(preprocess_image(decode_image(image_bytes)))
+    except Exception:
+        return image_bytes
+
+# === ADIÇÃO 20: SUPORTE A PDF DIGITALIZADO ===
+# Páginas com menos caracteres que isso na camada de texto são tratadas como digitalizadas
+MIN_CHARS_CAMADA_TEXTO = 40
+
+# 200 DPI deixa o texto de 8-10pt do laudo com ~25-30px de altura, próximo da
+# altura de entrada do reconhecedor do RapidOCR; acima disso só aumenta o custo
+DPI_OCR_PDF = 200
+
+def page_needs_ocr(page_text: str) -> bool:
+    """Indica se a camada de texto da página está ausente ou fina demais."""
+    return len(page_text.strip()) < MIN_CHARS_CAMADA_TEXTO
+
+@medir("rasterize_page")
+def rasterize_page(page, dpi: int = DPI_OCR_PDF) -> np.ndarray:
+    """Renderiza a página do PDF em tons de cinza direto para um ndarray."""
+    # Páginas grandes (A3, digitalizações com margem) não passam do lado maior alvo
+    lado_pol = max(page.rect.width, page.rect.height) / 72
+    dpi = min(dpi, int(LADO_MAIOR_ALVO / lado_pol))
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+
+def extract_pages_from_pdf(pdf_bytes: bytes, dpi: int = DPI_OCR_PDF, max_workers: int = None,
+                           campos: dict = None) -> list:
+    """
+    Extrai o texto de cada página do PDF, em ordem.
+    Páginas sem camada de texto são rasterizadas e enviadas ao pipeline de imagem,
+    em paralelo. Retorna uma lista de (texto, veio_do_ocr) por página.
+    Para extrair também os campos pela posição das palavras, passe um dict em
+    campos: ele é preenchido página a página, e a leitura para na primeira página
+    em que todos os campos do laudo já tiverem sido encontrados.
+    """
+    paginas = []
+    pendentes = {}
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        # O PyMuPDF não é thread-safe: leitura e rasterização ficam na thread atual
+        for i, page in enumerate(doc):
+            with etapa("pdf_camada_texto"):
+                page_text = page.get_text(sort=True)
+            if page_needs_ocr(page_text):
+                pendentes[i] = rasterize_page(page, dpi)
+                paginas.append(None)
+                continue
+            paginas.append((page_text, False))
+            # === ADIÇÃO 26: CAMPOS PELAS CAIXAS DE PALAVRAS ===
+            if campos is not None:
+                for campo, valor in layout.campos_por_palavras(page.get_text("words"), CAMPOS_LAUDO).items():
+                    campos.setdefault(campo, valor)
+                emissor().campos(campos, "pdf_palavras")
+                if not pendentes and all(campo in campos for campo in CAMPOS_LAUDO):
+                    break
+    
+    if pendentes:
+        workers = max_workers or min(len(pendentes), os.cpu_count() or 1, 4)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Cada thread roda numa cópia do contexto para registrar no rastro do documento
+            futuros = {
+                i: executor.submit(contextvars.copy_context().run, extract_text_from_array, img)
+                for i, img in pendentes.items()
+            }
+            for i, futuro in futuros.items():
+                paginas[i] = (futuro.result(), True)
+    return paginas
+
+def extract_text_from_pdf(pdf_bytes: bytes) -> str:
+    return " ".join(texto for texto, _ in extract_pages_from_pdf(pdf_bytes))
+
+def extract_text_from_image(image_bytes: bytes, debug_images: list = None) -> str:
+    return extract_text_from_array(decode_image(image_bytes), debug_images)
+
+RE_PALAVRA_CAPITALIZADA = re.compile(r"([A-Z][a-z]+)")
+RE_SIGLA = re.compile(r"([A-Z]{2,})")
+RE_ESPACOS = re.compile(r'\s+')
+
+def extract_text_from_array(gray_img: np.ndarray, debug_images: list = None,
+                            preprocess=preprocess_image) -> str:
+    """
+    Pré-processa e reconhece o texto de uma imagem em cinza.
+    A imagem processada vai direto para o RapidOCR como ndarray. Para inspecionar
+    o resultado do pré-processamento, passe uma lista em debug_images: o PNG
+    correspondente é anexado a ela.
+    """
+    processed_img = preprocess(gray_img)
+    emissor().evento("pre_processamento", etapa=getattr(preprocess, "__name__", "preprocess"),
+                     largura=int(processed_img.shape[1]), altura=int(processed_img.shape[0]))
+    if debug_images is not None:
+        debug_images.append(encode_png(processed_img))
+    if OCR_LOTE:
+        with etapa("ocr", processed_img.size):
+            result, elapse = reconhecer_imagem(get_ocr_pool(), get_lote_reconhecimento(), processed_img)
+    else:
+        with get_ocr_pool().modelo() as ocr, etapa("ocr", processed_img.size):
+            result, elapse = ocr(processed_img)
+    if elapse:
+        for nome, segundos in zip(("ocr_deteccao", "ocr_classificacao", "ocr_reconhecimento"), elapse):
+            registrar(nome, segundos)
+    if not result: return ""
+    emissor().evento("linhas_ocr", linhas=[item[1] for item in result])
+    with etapa("pos_processamento"):
+        full_text = "".join([item[1] for item in result])
+        full_text = RE_PALAVRA_CAPITALIZADA.sub(r" \1", full_text)
+        full_text = RE_SIGLA.sub(r" \1", full_text)
+        full_text = RE_ESPACOS.sub(' ', full_text).strip()
+        
+        # === APLICAR PÓS-PROCESSAMENTO ===
+        full_text = post_process_ocr_text(full_text)
+        
+        # === APLICAR CORREÇÃO DE PALAVRAS QUEBRADAS ===
+        full_text = fix_broken_words(full_text)
+        
+        # === APLICAR NORMALIZAÇÃO DE DATAS ===
+        full_text = normalize_dates(full_text)
+    
+    return full_text
+
+# === ADIÇÃO 23: OCR ADAPTATIVO (NÍVEL RÁPIDO, ESCALONA SE PRECISAR) ===
+# Ativo por padrão; AIH_OCR_ADAPTATIVO=0 força sempre o pré-processamento completo
+OCR_ADAPTATIVO = os.environ.get("AIH_OCR_ADAPTATIVO", "1") != "0"
+
+# Campos sem os quais o resultado do nível rápido não é aceito
+CAMPOS_OBRIGATORIOS = ["nome_paciente", "cartao_sus", "data_nascimento"]
+
+# Fração mínima de CAMPOS_TEXTO que o nível rápido precisa extrair
+COBERTURA_MINIMA = 0.5
+
+@medir("preprocess_image_fast")
+def preprocess_image_fast(gray_img: np.ndarray) -> np.ndarray:
+    """Pré-processamento barato: apenas a binarização adaptativa."""
+    try:
+        return binarizar(gray_img)
+    except Exception:
+        return gray_img
+
+def motivos_para_escalar(dados: dict, validacoes: dict) -> list:
+    """
+    Verifica se o resultado de um nível de OCR é aceitável.
+    Retorna a lista de motivos para escalar (vazia se o resultado foi aceito).
+    """
+    motivos = [f"faltando:{campo}" for campo in CAMPOS_OBRIGATORIOS if not dados.get(campo)]
+    motivos += [f"invalido:{campo}" for campo, valido in validacoes.items() if not valido]
+    cobertura = sum(1 for campo in CAMPOS_TEXTO if dados.get(campo)) / len(CAMPOS_TEXTO)
+    if cobertura < COBERTURA_MINIMA:
+        motivos.append(f"cobertura:{cobertura:.2f}")
+    return motivos
+
+# === ADIÇÃO 25: EXTRAÇÃO POR LAYOUT (REGISTRO NO MODELO DO LAUDO) ===
+# Desligada por padrão; AIH_OCR_LAYOUT=1 tenta primeiro reconhecer só as caixas dos campos
+OCR_LAYOUT = os.environ.get("AIH_OCR_LAYOUT") == "1"
+
+def extrair_campos_por_layout(gray_img: np.ndarray):
+    """Nível de layout: registra a imagem no modelo e reconhece só as caixas dos campos."""
+    try:
+        with get_ocr_pool().modelo() as ocr:
+            return layout.extrair_por_layout(gray_img, ocr, CAMPOS_LAYOUT)
+    except FilaCheia:
+        raise
+    except Exception:
+        return None
+
+# === ADIÇÃO 34: REAPROVEITAMENTO DE FOTOS REPETIDAS DO MESMO LAUDO ===
+# Lado maior da página comparada entre fotos (as caixas dos campos ficam com ~2px por ponto)
+LADO_PAGINA_DUPLICATAS = 1400
+
+@medir("pagina_normalizada")
+def pagina_normalizada(gray_img: np.ndarray) -> np.ndarray:
+    """Página reduzida, recortada e com a perspectiva corrigida, para comparar fotos."""
+    reduzida = reduzir_para_alvo(gray_img, LADO_PAGINA_DUPLICATAS)
+    return retificar_documento(reduzida, localizar_documento(reduzida))
+
+def reconhecer_recortes(recortes: list) -> list:
+    """Texto de cada recorte pelo reconhecedor do OCR, sem detecção nem classificação."""
+    recortes = [cv2.cvtColor(r, cv2.COLOR_GRAY2BGR) if r.ndim == 2 else r for r in recortes]
+    with get_ocr_pool().modelo() as ocr, etapa("ocr_reconhecimento_recortes"):
+        reconhecidos, _ = ocr.text_rec(recortes)
+    return [texto for texto, *_ in reconhecidos]
+
+def analisar_imagem(image_bytes: bytes, adaptativo: bool = None, usar_layout: bool = None) -> dict:
+    """
+    Extrai texto e campos de uma imagem (veja analisar_niveis). Com
+    AIH_DUPLICATAS=1, uma foto de uma folha já extraída reaproveita o resultado
+    anterior (nivel_ocr "duplicata") sem passar pelo OCR, se ele estava completo;
+    se não estava, a foto nova é extraída e os campos que faltarem nela vêm da
+    anterior (AIH_DUPLICATAS_MESCLAR=0 desliga). Nos dois casos o CNS/CPF lido
+    da foto nova tem de ser igual ao do resultado anterior; se não for, a foto é
+    tratada como um laudo novo.
+    """
+    gray_img = decode_image(image_bytes)
+    if not DUPLICATAS:
+        return analisar_niveis(gray_img, adaptativo, usar_layout)
+    
+    try:
+        pagina = pagina_normalizada(gray_img)
+        with etapa("impressao_duplicatas"):
+            impressao = calcular_impressao(pagina)
+            encontrada = get_indice_duplicatas().procurar(impressao, pagina)
+    except Exception:
+        return analisar_niveis(gray_img, adaptativo, usar_layout)
+    
+    entrada = None
+    if encontrada is not None:
+        entrada, distancia, semelhanca = encontrada
+        anterior = get_indice_duplicatas().resultado(entrada)
+        try:
+            with etapa("identificadores_duplicatas"):
+                confirmado = mesmo_paciente(ler_identificadores(pagina, reconhecer_recortes), anterior["dados"])
+        except FilaCheia:
+            raise
+        except Exception:
+            confirmado = False
+        if not confirmado:
+            entrada = None
+    if entrada is not None:
+        emissor().evento("duplicata", distancia=distancia, semelhanca=round(semelhanca, 3))
+        if not motivos_para_escalar(anterior["dados"], validar_dados(anterior["dados"])):
+            emissor().campos(anterior["dados"], "duplicata")
+            return {"raw_text": anterior["raw_text"], "dados": anterior["dados"],
+                    "nivel_ocr": "duplicata", "motivos_escalonamento": []}
+    
+    analise = analisar_niveis(gray_img, adaptativo, usar_layout)
+    if entrada is not None and MESCLAR_DUPLICATAS:
+        completar_dados(analise["dados"], [anterior["dados"]])
+    get_indice_duplicatas().registrar(
+        impressao, {"raw_text": analise["raw_text"], "dados": analise["dados"]}, entrada)
+    return analise
+
+def analisar_niveis(gray_img: np.ndarray, adaptativo: bool = None, usar_layout: bool = None) -> dict:
+    """
+    Extrai texto e campos de uma imagem por níveis: opcionalmente o layout (só as
+    caixas dos campos, sem detecção na página inteira); depois o OCR sobre a imagem
+    apenas binarizada; o pré-processamento completo (denoise, deskew, perspectiva...)
+    só roda se faltarem campos obrigatórios ou os dígitos verificadores falharem.
+    O nível aceito e os motivos de escalonamento ficam registrados no resultado.
+    Os campos de cada nível são emitidos como eventos assim que saem, mesmo que
+    o nível depois seja rejeitado (os seguintes corrigem o valor).
+    """
+    if adaptativo is None:
+        adaptativo = OCR_ADAPTATIVO
+    if usar_layout is None:
+        usar_layout = OCR_LAYOUT
+    
+    motivos = []
+    # Campos de níveis anteriores, usados para completar o nível aceito
+    anteriores = []
+    if usar_layout:
+        resultado = extrair_campos_por_layout(gray_img)
+        if resultado is None:
+            motivos = ["layout:sem_registro"]
+        else:
+            dados = resultado["dados"]
+            emissor().campos(dados, "layout")
+            motivos = motivos_para_escalar(dados, validar_dados(dados))
+            if not motivos:
+                return {"raw_text": resultado["raw_text"], "dados": dados, "nivel_ocr": "layout",
+                        "motivos_escalonamento": []}
+            anteriores.append(dados)
+            emissor().evento("escalonamento", nivel="layout", motivos=motivos)
+    
+    if adaptativo:
+        raw_text = extract_text_from_array(gray_img, preprocess=preprocess_image_fast)
+        dados = parse_ocr_text(raw_text)
+        emissor().campos(dados, "rapido")
+        motivos_rapido = motivos_para_escalar(dados, validar_dados(dados))
+        if not motivos_rapido:
+            return {"raw_text": raw_text, "dados": completar_dados(dados, anteriores),
+                    "nivel_ocr": "rapido", "motivos_escalonamento": motivos}
+        motivos += motivos_rapido
+        anteriores.insert(0, dados)
+        emissor().evento("escalonamento", nivel="rapido", motivos=motivos_rapido)
+    
+    raw_text = extract_text_from_array(gray_img)
+    dados = parse_ocr_text(raw_text)
+    emissor().campos(dados, "completo")
+    return {"raw_text": raw_text, "dados": completar_dados(dados, anteriores),
+            "nivel_ocr": "completo", "motivos_escalonamento": motivos}
+
+def completar_dados(dados: dict, anteriores: list) -> dict:
+    """Campos que só um nível anterior encontrou continuam valendo (na ordem de prioridade)."""
+    for dados_anteriores in anteriores:
+        for campo, valor in dados_anteriores.items():
+            dados.setdefault(campo, valor)
+    return dados
+
+def validar_dados(dados: dict) -> dict:
+    """Valida CPF, CNS e CEP dos dados extraídos."""
+    validacoes = {}
+    if dados.get("cpf"):
+        validacoes["cpf"] = validar_cpf(dados["cpf"])
+    if dados.get("cartao_sus"):
+        validacoes["cns"] = validar_cns(dados["cartao_sus"])
+    if dados.get("cep"):
+        validacoes["cep"] = validar_cep(dados["cep"])
+    return validacoes
+
+def processar_documento(file_bytes: bytes, is_pdf: bool, ao_evento=None) -> dict:
+    """
+    Executa o pipeline completo de extração de um documento.
+    Retorna texto bruto, campos extraídos, códigos médicos e validações.
+    ao_evento(dict), se informada, recebe o progresso enquanto o documento é
+    processado (veja eventos_documento).
+    """
+    token = _emissor_atual.set(Emissor(ao_evento))
+    try:
+        return _processar_documento(file_bytes, is_pdf)
+    finally:
+        _emissor_atual.reset(token)
+
+def _processar_documento(file_bytes: bytes, is_pdf: bool) -> dict:
+    # === ADIÇÃO 24: RASTRO DE TEMPOS POR ETAPA ===
+    with rastro_documento() as etapas, etapa("documento"):
+        if is_pdf:
+            extracted_data = {}
+            paginas = extract_pages_from_pdf(file_bytes, campos=extracted_data)
+            raw_text = " ".join(texto for texto, _ in paginas)
+            nivel_ocr = "pdf_texto"
+            motivos = []
+            # Regex só para os campos que a leitura por posição não encontrou
+            if any(campo not in extracted_data for campo in CAMPOS_TEXTO):
+                for campo, valor in parse_pdf_text(raw_text).items():
+                    extracted_data.setdefault(campo, valor)
+                emissor().campos(extracted_data, "pdf_texto")
+            # Páginas digitalizadas seguem o formato do texto de OCR
+            if any(via_ocr for _, via_ocr in paginas):
+                nivel_ocr = "completo"
+                for campo, valor in parse_ocr_text(raw_text).items():
+                    extracted_data.setdefault(campo, valor)
+                emissor().campos(extracted_data, "completo")
+        else:
+            analise = analisar_imagem(file_bytes)
+            raw_text = analise["raw_text"]
+            extracted_data = analise["dados"]
+            nivel_ocr = analise["nivel_ocr"]
+            motivos = analise["motivos_escalonamento"]
+    
+        # === ADIÇÃO 11: EXTRAIR CÓDIGOS MÉDICOS ===
+        medical_codes = extract_medical_codes(raw_text)
+        extracted_data.update(medical_codes)
+        emissor().campos(extracted_data, nivel_ocr)
+    
+        # === ADIÇÃO 6: VALIDAR DADOS EXTRAÍDOS ===
+        validacoes = validar_dados(extracted_data)
+        for campo, valido in validacoes.items():
+            emissor().evento("validacao", campo=campo, valido=valido)
+    
+        return {
+            "raw_text": raw_text,
+            "dados": extracted_data,
+            "codigos": medical_codes,
+            "validacoes": validacoes,
+            "nivel_ocr": nivel_ocr,
+            "motivos_escalonamento": motivos,
+            "etapas": etapas,
+        }
+
+EVENTOS_FINAIS = ("concluido", "erro")
+
+def eventos_documento(file_bytes: bytes, is_pdf: bool):
+    """
+    Processa o documento numa thread e gera os eventos de progresso à medida que
+    acontecem, terminando com {"evento": "concluido", "resultado": ...} ou
+    {"evento": "erro", "erro": ..., "excecao": ...}. Eventos:
+      fila (posicao)                         aguardando um modelo de OCR
+      pre_processamento (etapa, largura, altura)
+      linhas_ocr (linhas)                    texto reconhecido num nível de OCR
+      campo (campo, valor, nivel)            campo novo ou corrigido
+      escalonamento (nivel, motivos)         nível de OCR rejeitado
+      duplicata (distancia, semelhanca)      foto de uma folha já extraída, com o CNS/CPF
+                                             conferido (AIH_DUPLICATAS=1)
+      validacao (campo, valido)
+    """
+    fila = queue.Queue()
+
+    def avisar_fila(posicao):
+        fila.put({"evento": "fila", "posicao": posicao})
+
+    def executar():
+        try:
+            with contexto_fila(sessao_atual(), avisar_fila):
+                resultado = processar_documento(file_bytes, is_pdf, fila.put)
+            fila.put({"evento": "concluido", "resultado": resultado})
+        except Exception as e:
+            fila.put({"evento": "erro", "erro": f"{type(e).__name__}: {e}", "excecao": e})
+
+    # A thread herda o contexto (sessão da fila do OCR, rastro de métricas)
+    threading.Thread(target=contextvars.copy_context().run, args=(executar,),
+                     name="aih-documento", daemon=True).start()
+    while True:
+        evento = fila.get()
+        yield evento
+        if evento["evento"] in EVENTOS_FINAIS:
+            return
@@ -0,0 +1,179 @@
+"""
+Busca de campos e substituições sem uma varredura completa por expressão regular.
+
+Cada padrão começa por um rótulo literal (ex.: "Nome do Paciente", "CNS"). As
+expressões são compiladas uma vez, na importação; os rótulos são localizados
+com str.find (busca em C, bem mais rápida que o motor de regex) numa cópia do
+texto em minúsculas, feita sob demanda em blocos: quando os campos estão na 1ª
+página, o resto do texto nem é convertido. A expressão completa de cada campo
+só é testada nas posições em que o seu rótulo aparece, a partir dali, sem
+copiar o resto do texto. O resultado é o mesmo de um re.search (ou re.sub em
+sequência) por padrão.
+"""
+import re
+
+# Metacaracteres que encerram o prefixo literal de um padrão
+_METACARACTERES = set(".^$*+?{}[]|()")
+
+# Tamanho do primeiro bloco convertido para minúsculas (dobra a cada extensão)
+BLOCO_INICIAL = 8192
+
+
+def _tem_alternativa_externa(padrao: str) -> bool:
+    """Indica se o padrão tem um | fora de grupos e classes (ex.: 'abc|xyz')."""
+    profundidade, i, em_classe = 0, 0, False
+    while i < len(padrao):
+        c = padrao[i]
+        if c == "\\":
+            i += 2
+            continue
+        if em_classe:
+            em_classe = c != "]"
+        elif c == "[":
+            em_classe = True
+        elif c == "(":
+            profundidade += 1
+        elif c == ")":
+            profundidade -= 1
+        elif c == "|" and profundidade == 0:
+            return True
+        i += 1
+    return False
+
+
+def prefixo_literal(padrao: str) -> str:
+    """
+    Prefixo literal que todo match do padrão precisa ter.
+    Ignora \\b no início e aceita escapes de pontuação (ex.: \\. e \\().
+    Quantificadores (*, ?, {0,...}) anulam o último caractere do prefixo.
+    """
+    if _tem_alternativa_externa(padrao):
+        return ""
+    literal = []
+    i = 0
+    while i < len(padrao):
+        c = padrao[i]
+        if c == "\\":
+            if i + 1 >= len(padrao):
+                break
+            proximo = padrao[i + 1]
+            if proximo == "b" and not literal:
+                i += 2
+                continue
+            if proximo.isalnum():
+                break
+            c, i = proximo, i + 2
+        elif c in _METACARACTERES:
+            if c in "*?{" and literal:
+                literal.pop()
+            break
+        else:
+            i += 1
+        literal.append(c)
+    return "".join(literal)
+
+
+class _Padrao:
+    __slots__ = ("regex", "literal")
+
+    def __init__(self, padrao: str, flags: int):
+        self.regex = re.compile(padrao, flags)
+        literal = prefixo_literal(padrao)
+        self.literal = literal.lower() if flags & re.IGNORECASE else literal
+
+    def buscar(self, texto: str, base):
+        """
+        Equivalente a regex.search(texto), testando só onde o literal aparece em
+        `base` (o TextoBusca do texto, ou None para usar só a regex).
+        """
+        if not self.literal or base is None:
+            return self.regex.search(texto)
+        try:
+            pos = base.find(self.literal)
+            while pos >= 0:
+                match = self.regex.match(texto, pos)
+                if match:
+                    return match
+                pos = base.find(self.literal, pos + 1)
+        except ValueError:
+            return self.regex.search(texto)
+        return None
+
+
+class TextoBusca:
+    """
+    Texto em que os literais são procurados: em minúsculas com IGNORECASE,
+    convertido sob demanda em blocos que dobram de tamanho. Se lower() não
+    preservar as posições (ex.: 'İ' vira 2 caracteres), find levanta ValueError.
+    """
+    __slots__ = ("texto", "base")
+
+    def __init__(self, texto: str, flags: int):
+        self.texto = texto
+        self.base = "" if flags & re.IGNORECASE else texto
+
+    def _estender(self) -> None:
+        inicio = len(self.base)
+        bloco = self.texto[inicio:inicio + max(BLOCO_INICIAL, inicio)]
+        convertido = bloco.lower()
+        if len(convertido) != len(bloco):
+            raise ValueError("lower() mudou o tamanho do texto")
+        self.base += convertido
+
+    def find(self, literal: str, inicio: int = 0) -> int:
+        while True:
+            pos = self.base.find(literal, inicio)
+            if pos >= 0 or len(self.base) == len(self.texto):
+                return pos
+            # O literal pode começar no fim do bloco atual e terminar no próximo
+            inicio = max(inicio, len(self.base) - len(literal) + 1)
+            self._estender()
+
+
+class ScannerCampos:
+    """
+    Localiza vários campos num texto.
+    `padroes` mapeia campo → (rótulo, resto): a expressão do campo é rótulo + resto,
+    e buscar() devolve, por campo, o mesmo match de re.search(rótulo + resto, texto).
+    """
+
+    def __init__(self, padroes: dict, flags: int = re.IGNORECASE):
+        self.flags = flags
+        self._padroes = {campo: _Padrao(rotulo + resto, flags) for campo, (rotulo, resto) in padroes.items()}
+        self.padroes = {campo: p.regex for campo, p in self._padroes.items()}
+
+    def buscar(self, texto: str) -> dict:
+        """Retorna {campo: match} para os campos encontrados."""
+        base = TextoBusca(texto, self.flags)
+        encontrados = {}
+        for campo, padrao in self._padroes.items():
+            match = padrao.buscar(texto, base)
+            if match:
+                encontrados[campo] = match
+        return encontrados
+
+
+class Substituicoes:
+    """
+    Aplica uma lista ordenada de substituições (padrão → texto), como re.sub em
+    sequência. Padrões cujo literal não aparece no texto são pulados sem rodar a
+    expressão: no texto típico de OCR quase nenhuma correção se aplica.
+    """
+
+    def __init__(self, pares: dict, flags: int = re.IGNORECASE):
+        self.flags = flags
+        self._pares = [(_Padrao(padrao, flags), substituto) for padrao, substituto in pares.items()]
+
+    def aplicar(self, texto: str) -> str:
+        base = TextoBusca(texto, self.flags)
+        for padrao, substituto in self._pares:
+            try:
+                if padrao.literal and base is not None and base.find(padrao.literal) < 0:
+                    continue
+            except ValueError:
+                base = None
+            texto, n = padrao.regex.subn(substituto, texto)
+            if n:
+                # O texto mudou: correções seguintes são testadas sobre ele
+                base = TextoBusca(texto, self.flags)
+        return texto
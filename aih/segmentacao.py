@@ -0,0 +1,205 @@
+"""
+Segmentação de palavras coladas pelo OCR (ex.: JULIANAALVESRODRIGUES).
+
+Um léxico de prenomes, sobrenomes, palavras de endereço, municípios e descrições
+da CID, com a frequência de cada palavra, vira uma trie na primeira chamada. A
+divisão escolhida é a de maior verossimilhança (programação dinâmica sobre as
+posições do token): palavras conhecidas valem log10(frequência / total), e um
+trecho desconhecido é penalizado pelo tamanho, de modo que uma sequência sem
+palavras conhecidas fica inteira em vez de ser picada em pedaços arbitrários.
+
+O léxico em disco (aih/dados/lexico.txt.gz) é gerado a partir das listas-fonte
+em aih/dados/lexico/ (uma palavra por linha, na ordem de frequência, ou
+"PALAVRA<TAB>contagem" quando a lista traz contagens reais, como as do IBGE):
+
+    python -m aih.segmentacao construir aih/dados/lexico -o aih/dados/lexico.txt.gz
+    python -m aih.segmentacao JULIANAALVESRODRIGUES TRAVESSADOCOMERCIO
+"""
+import argparse
+import functools
+import gzip
+import math
+import os
+import sys
+from pathlib import Path
+
+from aih.metrics import etapa
+
+LEXICO_PADRAO = Path(__file__).parent / "dados" / "lexico.txt.gz"
+# Permite apontar para um léxico maior (ex.: listas completas do IBGE)
+LEXICO_PATH = os.environ.get("AIH_LEXICO") or str(LEXICO_PADRAO)
+
+# Palavras menores que isso não entram na trie ("E" quebraria nomes ao meio)
+TAMANHO_MINIMO_PALAVRA = 2
+# Custo de um trecho desconhecido: log10(1/total) + PENALIDADE_TRECHO - PENALIDADE_LETRA × tamanho
+PENALIDADE_TRECHO = 1.0
+PENALIDADE_LETRA = 1.0
+
+# Acentos → letra base, preservando o tamanho (as partes são fatias do token original)
+SEM_ACENTOS = str.maketrans("ÀÁÂÃÄÅÇÈÉÊËÌÍÎÏÑÒÓÔÕÖÙÚÛÜÝ", "AAAAAACEEEEIIIINOOOOOUUUUY")
+
+_FIM = ""  # chave do nó da trie que guarda o log da probabilidade da palavra
+
+
+# --- Formato em disco ---
+
+def ler_lista(caminho: Path) -> dict:
+    """
+    Lê uma lista-fonte: linhas "# base: N" definem o peso da 1ª palavra (as
+    seguintes recebem base/posição, distribuição de Zipf); "PALAVRA<TAB>contagem"
+    usa a contagem informada.
+    """
+    base, contagens, posicao = 1000.0, {}, 0
+    for linha in caminho.read_text(encoding="utf-8").splitlines():
+        linha = linha.strip()
+        if linha.startswith("#"):
+            if linha[1:].strip().lower().startswith("base:"):
+                base = float(linha.split(":", 1)[1])
+            continue
+        if not linha:
+            continue
+        palavra, _, contagem = linha.partition("\t")
+        palavra = palavra.strip().upper().translate(SEM_ACENTOS)
+        if palavra in contagens:
+            continue
+        posicao += 1
+        contagens[palavra] = float(contagem) if contagem else base / posicao
+    return contagens
+
+
+def construir_lexico(fontes, destino) -> int:
+    """
+    Junta as listas-fonte (frequências somadas entre listas) e grava o léxico
+    compacto: palavras ordenadas com codificação de prefixo
+    ("tamanho do prefixo comum<TAB>sufixo<TAB>contagem"), comprimidas com gzip.
+    Retorna o número de palavras.
+    """
+    contagens = {}
+    for fonte in fontes:
+        fonte = Path(fonte)
+        for arquivo in sorted(fonte.glob("*.txt")) if fonte.is_dir() else [fonte]:
+            for palavra, contagem in ler_lista(arquivo).items():
+                contagens[palavra] = contagens.get(palavra, 0.0) + contagem
+    linhas, anterior = [], ""
+    for palavra in sorted(contagens):
+        comum = len(os.path.commonprefix([anterior, palavra]))
+        linhas.append(f"{comum}\t{palavra[comum:]}\t{max(1, round(contagens[palavra]))}")
+        anterior = palavra
+    # mtime=0 e sem nome no cabeçalho: o arquivo gerado só muda quando as listas
+    # mudam, não importa quando nem em qual caminho foi construído
+    with open(destino, "wb") as f, gzip.GzipFile(filename="", fileobj=f, mode="wb", mtime=0) as gz:
+        gz.write(("\n".join(linhas) + "\n").encode("utf-8"))
+    return len(contagens)
+
+
+def ler_lexico(caminho) -> dict:
+    """Lê o léxico compacto → {palavra: contagem}."""
+    contagens, anterior = {}, ""
+    with gzip.open(caminho, "rt", encoding="utf-8") as f:
+        for linha in f:
+            comum, sufixo, contagem = linha.rstrip("\n").split("\t")
+            anterior = anterior[:int(comum)] + sufixo
+            contagens[anterior] = int(contagem)
+    return contagens
+
+
+# --- Trie e segmentação ---
+
+class Lexico:
+    """Trie (dicts aninhados) com o log10 da probabilidade de cada palavra."""
+
+    def __init__(self, contagens: dict):
+        self.total = sum(contagens.values()) or 1
+        self.trie = {}
+        for palavra, contagem in contagens.items():
+            if len(palavra) < TAMANHO_MINIMO_PALAVRA:
+                continue
+            no = self.trie
+            for letra in palavra:
+                no = no.setdefault(letra, {})
+            no[_FIM] = math.log10(contagem / self.total)
+        self.log_desconhecido = math.log10(1 / self.total) + PENALIDADE_TRECHO
+
+    def palavras_em(self, texto: str, inicio: int):
+        """Gera (fim, log_prob) para cada palavra do léxico que começa em texto[inicio]."""
+        no = self.trie
+        for fim in range(inicio, len(texto)):
+            no = no.get(texto[fim])
+            if no is None:
+                return
+            if _FIM in no:
+                yield fim + 1, no[_FIM]
+
+    def custo_desconhecido(self, tamanho: int) -> float:
+        return self.log_desconhecido - PENALIDADE_LETRA * tamanho
+
+
+@functools.lru_cache(maxsize=1)
+def carregar_lexico(caminho: str = None) -> Lexico:
+    """Carrega o léxico uma vez por processo (na primeira segmentação)."""
+    with etapa("lexico_carga"):
+        return Lexico(ler_lexico(caminho or LEXICO_PATH))
+
+
+@functools.lru_cache(maxsize=8192)
+def segmentar(token: str) -> tuple:
+    """
+    Divide um token em maiúsculas na sequência de palavras mais provável.
+    Retorna tuplas (parte, conhecida); as partes são fatias do token original
+    (acentos preservados). Tokens repetidos vêm do cache.
+    """
+    lexico = carregar_lexico()
+    chave = token.upper().translate(SEM_ACENTOS)
+    n = len(chave)
+    # melhor[i] = (log_prob, início da última parte, conhecida) para o prefixo chave[:i]
+    melhor = [(0.0, 0, True)] + [(-math.inf, 0, False)] * n
+    for inicio in range(n):
+        base = melhor[inicio][0]
+        if base == -math.inf:
+            continue
+        for fim, log_prob in lexico.palavras_em(chave, inicio):
+            if base + log_prob > melhor[fim][0]:
+                melhor[fim] = (base + log_prob, inicio, True)
+        for fim in range(inicio + 1, n + 1):
+            custo = base + lexico.custo_desconhecido(fim - inicio)
+            if custo > melhor[fim][0]:
+                melhor[fim] = (custo, inicio, False)
+    partes, fim = [], n
+    while fim > 0:
+        _, inicio, conhecida = melhor[fim]
+        partes.append((token[inicio:fim], conhecida))
+        fim = inicio
+    return tuple(reversed(partes))
+
+
+def separar(token: str, so_conhecidas: bool = False) -> str:
+    """
+    Token com as partes separadas por espaço. Com so_conhecidas=True, só separa
+    se todas as partes forem palavras do léxico (senão devolve o token como veio).
+    """
+    partes = segmentar(token)
+    if so_conhecidas and not all(conhecida for _, conhecida in partes):
+        return token
+    return " ".join(parte for parte, _ in partes)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Segmentação de palavras coladas pelo OCR.")
+    sub = parser.add_subparsers(dest="comando")
+    construir = sub.add_parser("construir", help="gera o léxico compacto a partir das listas-fonte")
+    construir.add_argument("fontes", nargs="+", help="arquivos .txt ou pastas com listas")
+    construir.add_argument("-o", "--saida", default=str(LEXICO_PADRAO))
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == "construir":
+        args = parser.parse_args(argv)
+        total = construir_lexico(args.fontes, args.saida)
+        print(f"{total} palavras → {args.saida} ({os.path.getsize(args.saida)} bytes)")
+        return 0
+    for token in argv:
+        print(f"{token} → {separar(token)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,408 @@
+"""
+Serviço HTTP de extração, sem interface, para integrações com o prontuário eletrônico.
+
+Uso:
+    pip install uvicorn
+    python -m aih.servico --porta 8080 --workers 4
+
+Endpoints:
+    POST /laudos[?arquivo=nome]   corpo = bytes do PDF ou da imagem → {"id", "status", ...}
+    GET  /laudos/{id}             status (na_fila, processando, concluido, erro) e posição na fila
+    GET  /laudos/{id}/resultado   resultado final (202 enquanto não termina)
+    GET  /laudos/{id}/eventos     NDJSON: progresso (campos, validações...) até o resultado final
+    GET  /saude                   tamanho da fila e trabalhos em andamento
+
+O id é o SHA-256 do documento: reenviar o mesmo arquivo devolve o mesmo trabalho
+(ou o resultado já pronto no cache/AIH_STORE_PATH) sem processar de novo. O OCR
+roda num pool de processos atrás de uma fila asyncio limitada: com a fila cheia,
+novos envios recebem 503. Corpos acima de AIH_SERVICO_MAX_MB recebem 413.
+O nome opcional do arquivo vai para a coluna "arquivo" da exportação
+(AIH_EXPORT_PATH).
+
+O app é ASGI puro (sem framework); qualquer servidor ASGI serve, o uvicorn é o
+usado pelo main(). Sem o lifespan (uvicorn --lifespan off), o serviço é iniciado
+na primeira requisição.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs
+
+from aih.batch import configurar_worker
+from aih.cache import ResultCache, chave_documento, hash_documento
+from aih.exportacao import ExportadorResultados
+from aih.store import ExtractionStore
+
+# Tamanho máximo do documento enviado (MB)
+MAX_BYTES = int(os.environ.get("AIH_SERVICO_MAX_MB") or 20) * 1024 * 1024
+# Documentos aguardando um worker; acima disso o envio é recusado com 503
+FILA_MAX = int(os.environ.get("AIH_SERVICO_FILA_MAX") or 64)
+# Trabalhos mantidos em memória para status/eventos (resultados seguem no cache)
+MAX_TRABALHOS = 1000
+
+EVENTOS_FINAIS = ("concluido", "erro")
+
+
+def executar_trabalho(doc_id: str, file_bytes: bytes, is_pdf: bool, eventos) -> dict:
+    """Roda no worker: extrai o documento e manda o progresso (campos, validações...) para a fila de eventos."""
+    from aih.pipeline import processar_documento
+
+    return processar_documento(file_bytes, is_pdf, lambda evento: eventos.put((doc_id, evento)))
+
+
+class Trabalho:
+    """Estado de um documento enviado. Só é alterado na thread do event loop."""
+
+    def __init__(self, doc_id: str, is_pdf: bool, arquivo: str = None):
+        self.id = doc_id
+        self.is_pdf = is_pdf
+        self.arquivo = arquivo
+        self.status = "na_fila"
+        self.resultado = None
+        self.erro = None
+        self.eventos = []
+        self.ouvintes = set()
+        self.criado = time.time()
+
+    @property
+    def terminou(self) -> bool:
+        return self.status in EVENTOS_FINAIS
+
+    def publicar(self, evento: dict) -> None:
+        self.eventos.append(evento)
+        for ouvinte in self.ouvintes:
+            ouvinte.put_nowait(evento)
+
+
+class Servico:
+    """Fila asyncio de documentos, consumida por um pool de processos."""
+
+    def __init__(self, workers: int = None, store_path: str = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = ResultCache()
+        store_path = store_path or os.environ.get("AIH_STORE_PATH")
+        self.store = ExtractionStore(store_path) if store_path else None
+        export_path = os.environ.get("AIH_EXPORT_PATH")
+        self.exportador = ExportadorResultados(export_path) if export_path else None
+        self.trabalhos = OrderedDict()
+        # ids na ordem da fila, para informar a posição de cada um
+        self.pendentes = []
+        self.fila = None
+        self._iniciando = None
+
+    # --- Ciclo de vida ---
+
+    async def garantir_iniciado(self) -> None:
+        """Inicia o serviço uma vez só: no lifespan ou, sem ele, na primeira requisição."""
+        if self._iniciando is None:
+            self._iniciando = asyncio.ensure_future(self.iniciar())
+        await asyncio.shield(self._iniciando)
+
+    async def iniciar(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self.fila = asyncio.Queue(maxsize=FILA_MAX)
+        self._manager = multiprocessing.Manager()
+        self._eventos = self._manager.Queue()
+        # Cada processo com um modelo de OCR e os núcleos divididos entre os processos
+        threads_ocr = max(1, (os.cpu_count() or 1) // self.workers)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=configurar_worker,
+                                             initargs=(threads_ocr,))
+        self._consumidores = [asyncio.create_task(self._consumir()) for _ in range(self.workers)]
+        self._leitor = threading.Thread(target=self._ler_eventos, name="aih-servico-eventos", daemon=True)
+        self._leitor.start()
+
+    async def encerrar(self) -> None:
+        for consumidor in self._consumidores:
+            consumidor.cancel()
+        await asyncio.gather(*self._consumidores, return_exceptions=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._eventos.put(None)
+        self._leitor.join(timeout=5)
+        self._manager.shutdown()
+        if self.store:
+            self.store.close()
+        if self.exportador:
+            self.exportador.close()
+
+    # --- Eventos vindos dos workers ---
+
+    def _ler_eventos(self) -> None:
+        while True:
+            item = self._eventos.get()
+            if item is None:
+                return
+            self._loop.call_soon_threadsafe(self._publicar_progresso, *item)
+
+    def _publicar_progresso(self, doc_id: str, evento: dict) -> None:
+        trabalho = self.trabalhos.get(doc_id)
+        # Um evento que chega depois do resultado final já foi superado por ele
+        if trabalho is not None and not trabalho.terminou:
+            trabalho.publicar(evento)
+
+    # --- Fila ---
+
+    async def _consumir(self) -> None:
+        while True:
+            doc_id, file_bytes = await self.fila.get()
+            trabalho = self.trabalhos[doc_id]
+            self.pendentes.remove(doc_id)
+            trabalho.status = "processando"
+            trabalho.publicar({"evento": "processando"})
+            try:
+                resultado = await self._loop.run_in_executor(
+                    self._executor, executar_trabalho, doc_id, file_bytes, trabalho.is_pdf, self._eventos)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                trabalho.status = "erro"
+                trabalho.erro = f"{type(e).__name__}: {e}"
+                trabalho.publicar({"evento": "erro", "erro": trabalho.erro})
+            else:
+                self.cache.put(chave_documento(doc_id), resultado)
+                if self.store:
+                    await self._loop.run_in_executor(None, self.store.put, doc_id, resultado)
+                if self.exportador:
+                    try:
+                        await self._loop.run_in_executor(None, self.exportador.adicionar, doc_id, resultado,
+                                                         trabalho.arquivo)
+                    except Exception as e:
+                        # Uma falha na exportação não pode deixar o trabalho sem resultado
+                        print(f"⚠️ Exportação de {trabalho.arquivo or doc_id}: {type(e).__name__}: {e}",
+                              file=sys.stderr)
+                self._concluir(trabalho, resultado)
+            finally:
+                self.fila.task_done()
+
+    def _concluir(self, trabalho: Trabalho, resultado: dict) -> None:
+        trabalho.resultado = resultado
+        trabalho.status = "concluido"
+        trabalho.publicar({"evento": "concluido", "resultado": resultado})
+
+    def _registrar(self, trabalho: Trabalho) -> None:
+        self.trabalhos[trabalho.id] = trabalho
+        # Descarta os trabalhos terminados mais antigos (o resultado continua no cache)
+        excesso = len(self.trabalhos) - MAX_TRABALHOS
+        for doc_id in [i for i, t in self.trabalhos.items() if t.terminou][:max(0, excesso)]:
+            del self.trabalhos[doc_id]
+
+    def submeter(self, file_bytes: bytes, arquivo: str = None):
+        """
+        Enfileira o documento. Retorna (status HTTP, trabalho): 202 se entrou na
+        fila, 200 se o documento já era conhecido (mesmo hash), 503 se a fila está cheia.
+        `arquivo` é o nome do arquivo original, só para a exportação.
+        """
+        doc_id = hash_documento(file_bytes)
+        trabalho = self.trabalhos.get(doc_id)
+        if trabalho is not None and trabalho.status != "erro":
+            self.trabalhos.move_to_end(doc_id)
+            return 200, trabalho
+
+        trabalho = Trabalho(doc_id, file_bytes[:5] == b"%PDF-", arquivo)
+        resultado = self.cache.get(chave_documento(doc_id))
+        if resultado is None and self.store:
+            resultado = self.store.get(doc_id)
+        if resultado is not None:
+            self._registrar(trabalho)
+            self._concluir(trabalho, resultado)
+            return 200, trabalho
+
+        if self.fila.full():
+            return 503, None
+        self._registrar(trabalho)
+        self.pendentes.append(doc_id)
+        self.fila.put_nowait((doc_id, file_bytes))
+        trabalho.publicar({"evento": "na_fila"})
+        return 202, trabalho
+
+    def status(self, trabalho: Trabalho) -> dict:
+        estado = {"id": trabalho.id, "status": trabalho.status}
+        if trabalho.status == "na_fila":
+            estado["posicao"] = self.pendentes.index(trabalho.id) + 1
+        if trabalho.erro:
+            estado["erro"] = trabalho.erro
+        return estado
+
+    def saude(self) -> dict:
+        contagem = {}
+        for trabalho in self.trabalhos.values():
+            contagem[trabalho.status] = contagem.get(trabalho.status, 0) + 1
+        return {"workers": self.workers, "na_fila": len(self.pendentes), "fila_maxima": FILA_MAX,
+                "trabalhos": contagem}
+
+
+# --- ASGI ---
+
+async def _enviar_json(send, status: int, corpo: dict) -> None:
+    dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json; charset=utf-8"),
+                            (b"content-length", str(len(dados)).encode())]})
+    await send({"type": "http.response.body", "body": dados})
+
+
+class CorpoGrandeDemais(Exception):
+    pass
+
+
+class CorpoInvalido(Exception):
+    pass
+
+
+async def _ler_corpo(scope, receive) -> bytes:
+    """
+    Lê o corpo da requisição, recusando acima de MAX_BYTES (CorpoGrandeDemais)
+    ou com Content-Length malformado (CorpoInvalido).
+    """
+    tamanho = dict(scope.get("headers", [])).get(b"content-length")
+    if tamanho is not None:
+        try:
+            tamanho = int(tamanho)
+        except ValueError:
+            raise CorpoInvalido("Content-Length inválido") from None
+        if tamanho < 0:
+            raise CorpoInvalido("Content-Length inválido")
+        if tamanho > MAX_BYTES:
+            raise CorpoGrandeDemais()
+    partes, total = [], 0
+    while True:
+        mensagem = await receive()
+        if mensagem["type"] == "http.disconnect":
+            raise ConnectionError("cliente desconectou")
+        parte = mensagem.get("body", b"")
+        total += len(parte)
+        if total > MAX_BYTES:
+            raise CorpoGrandeDemais()
+        partes.append(parte)
+        if not mensagem.get("more_body"):
+            return b"".join(partes)
+
+
+async def _esperar_desconexao(receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _transmitir_eventos(receive, send, trabalho: Trabalho) -> None:
+    """
+    Envia os eventos do trabalho (os já ocorridos e os próximos) em NDJSON, até o
+    final. Se o cliente desconecta antes, o ouvinte é removido na hora, sem
+    esperar o trabalho terminar.
+    """
+    ouvinte = asyncio.Queue()
+    pendentes = list(trabalho.eventos)
+    if not trabalho.terminou:
+        trabalho.ouvintes.add(ouvinte)
+    desconexao = asyncio.ensure_future(_esperar_desconexao(receive))
+    try:
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/x-ndjson; charset=utf-8")]})
+        while True:
+            if pendentes:
+                evento = pendentes.pop(0)
+            else:
+                proximo = asyncio.ensure_future(ouvinte.get())
+                await asyncio.wait({proximo, desconexao}, return_when=asyncio.FIRST_COMPLETED)
+                if desconexao.done():
+                    proximo.cancel()
+                    return
+                evento = proximo.result()
+            linha = json.dumps(evento, ensure_ascii=False).encode("utf-8") + b"\n"
+            final = evento["evento"] in EVENTOS_FINAIS
+            await send({"type": "http.response.body", "body": linha, "more_body": not final})
+            if final:
+                return
+    except OSError:
+        # Conexão caiu durante o envio
+        return
+    finally:
+        desconexao.cancel()
+        trabalho.ouvintes.discard(ouvinte)
+
+
+def criar_app(servico: Servico = None):
+    """Cria a aplicação ASGI. O Servico é iniciado e encerrado pelos eventos de lifespan."""
+    servico = servico or Servico()
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                mensagem = await receive()
+                if mensagem["type"] == "lifespan.startup":
+                    await servico.garantir_iniciado()
+                    await send({"type": "lifespan.startup.complete"})
+                elif mensagem["type"] == "lifespan.shutdown":
+                    await servico.encerrar()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+        await servico.garantir_iniciado()
+
+        metodo = scope["method"]
+        partes = [p for p in scope["path"].split("/") if p]
+        if partes == ["saude"] and metodo == "GET":
+            return await _enviar_json(send, 200, servico.saude())
+        if not partes or partes[0] != "laudos":
+            return await _enviar_json(send, 404, {"erro": "rota não encontrada"})
+
+        if len(partes) == 1:
+            if metodo != "POST":
+                return await _enviar_json(send, 405, {"erro": "use POST"})
+            try:
+                corpo = await _ler_corpo(scope, receive)
+            except CorpoGrandeDemais:
+                return await _enviar_json(send, 413, {"erro": f"documento acima de {MAX_BYTES // 2**20} MB"})
+            except CorpoInvalido as e:
+                return await _enviar_json(send, 400, {"erro": str(e)})
+            except ConnectionError:
+                return
+            if not corpo:
+                return await _enviar_json(send, 400, {"erro": "corpo vazio"})
+            arquivo = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("arquivo", [None])[0]
+            status, trabalho = servico.submeter(corpo, arquivo)
+            if trabalho is None:
+                return await _enviar_json(send, 503, {"erro": "fila cheia, tente novamente"})
+            return await _enviar_json(send, status, servico.status(trabalho))
+
+        trabalho = servico.trabalhos.get(partes[1])
+        if trabalho is None or len(partes) > 3 or metodo != "GET":
+            return await _enviar_json(send, 404, {"erro": "trabalho não encontrado"})
+        if len(partes) == 2:
+            return await _enviar_json(send, 200, servico.status(trabalho))
+        if partes[2] == "resultado":
+            if trabalho.status == "concluido":
+                return await _enviar_json(send, 200, trabalho.resultado)
+            return await _enviar_json(send, 500 if trabalho.status == "erro" else 202, servico.status(trabalho))
+        if partes[2] == "eventos":
+            return await _transmitir_eventos(receive, send, trabalho)
+        return await _enviar_json(send, 404, {"erro": "rota não encontrada"})
+
+    app.servico = servico
+    return app
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Serviço HTTP de extração de laudos AIH.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8080)
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="processos de extração (padrão: número de CPUs)")
+    args = parser.parse_args(argv)
+    try:
+        import uvicorn
+    except ImportError:
+        print("❌ O serviço precisa de um servidor ASGI: pip install uvicorn", file=sys.stderr)
+        return 1
+    uvicorn.run(criar_app(Servico(args.workers)), host=args.host, port=args.porta, log_level="info")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
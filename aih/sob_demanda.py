@@ -0,0 +1,52 @@
+"""
+Importação sob demanda das bibliotecas pesadas (OpenCV, NumPy, PyMuPDF, Pillow).
+
+`cv2 = sob_demanda("cv2")` devolve um módulo substituto: o import de verdade só
+acontece no primeiro acesso a um atributo (cv2.resize, np.ndarray...), e o tempo
+gasto fica registrado nas métricas como a etapa "import_cv2". Assim a interface
+abre sem carregar a pilha de visão, e uma sessão que só recebe PDFs com camada
+de texto nunca carrega o OpenCV.
+"""
+import importlib
+import threading
+import time
+import types
+
+from aih.metrics import registrar
+
+
+class ModuloSobDemanda(types.ModuleType):
+    """Substituto de um módulo, importado no primeiro acesso a um atributo."""
+
+    def __init__(self, nome: str):
+        super().__init__(nome)
+        self.__dict__["_modulo"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def _carregar(self):
+        with self._lock:
+            if self._modulo is None:
+                inicio = time.perf_counter()
+                modulo = importlib.import_module(self.__name__)
+                registrar(f"import_{self.__name__}", time.perf_counter() - inicio)
+                self.__dict__["_modulo"] = modulo
+        return self._modulo
+
+    def __getattr__(self, atributo):
+        return getattr(self._modulo or self._carregar(), atributo)
+
+    def __repr__(self):
+        estado = "carregado" if self._modulo is not None else "não carregado"
+        return f"<módulo sob demanda {self.__name__!r} ({estado})>"
+
+
+def sob_demanda(nome: str) -> ModuloSobDemanda:
+    """Módulo `nome` importado só quando for usado."""
+    return ModuloSobDemanda(nome)
+
+
+def carregar(*modulos) -> None:
+    """Força o import dos módulos sob demanda (ex.: no aquecimento)."""
+    for modulo in modulos:
+        if isinstance(modulo, ModuloSobDemanda):
+            modulo._carregar()
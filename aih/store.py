@@ -0,0 +1,121 @@
+import json
+import sqlite3
+import threading
+import time
+
+from aih.cache import PIPELINE_VERSION
+
+# Validade padrão de um resultado persistido (30 dias)
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+
+# Tamanho máximo padrão dos resultados armazenados (256 MB)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# A poda completa roda a cada N gravações, não em toda gravação
+PRUNE_EVERY = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS resultados (
+    doc_hash TEXT NOT NULL,
+    versao TEXT NOT NULL,
+    criado_em REAL NOT NULL,
+    acessado_em REAL NOT NULL,
+    tamanho INTEGER NOT NULL,
+    resultado TEXT NOT NULL,
+    PRIMARY KEY (doc_hash, versao)
+);
+CREATE INDEX IF NOT EXISTS idx_resultados_acessado ON resultados (acessado_em);
+"""
+
+
+class ExtractionStore:
+    """
+    Armazenamento persistente de resultados de extração em SQLite.
+
+    O arquivo usa o modo WAL, o que permite que várias réplicas do app
+    (ou vários workers) leiam e gravem no mesmo banco simultaneamente.
+    Cada resultado é indexado pelo hash do documento e pela versão do pipeline.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self.prune()
+
+    def get(self, doc_hash: str, versao: str = PIPELINE_VERSION):
+        """Retorna o resultado armazenado ou None se ausente/expirado."""
+        agora = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT resultado, criado_em FROM resultados WHERE doc_hash = ? AND versao = ?",
+                (doc_hash, versao),
+            ).fetchone()
+            if row is None:
+                return None
+            if agora - row[1] > self.ttl_seconds:
+                self._conn.execute(
+                    "DELETE FROM resultados WHERE doc_hash = ? AND versao = ?", (doc_hash, versao)
+                )
+                return None
+            self._conn.execute(
+                "UPDATE resultados SET acessado_em = ? WHERE doc_hash = ? AND versao = ?",
+                (agora, doc_hash, versao),
+            )
+        return json.loads(row[0])
+
+    def put(self, doc_hash: str, resultado: dict, versao: str = PIPELINE_VERSION) -> None:
+        """Grava (ou substitui) o resultado de um documento."""
+        payload = json.dumps(resultado, ensure_ascii=False)
+        agora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO resultados "
+                "(doc_hash, versao, criado_em, acessado_em, tamanho, resultado) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (doc_hash, versao, agora, agora, len(payload), payload),
+            )
+            self._writes += 1
+            podar = self._writes % PRUNE_EVERY == 0
+        if podar:
+            self.prune()
+
+    def prune(self) -> int:
+        """
+        Remove resultados expirados e, se o banco passar do limite de tamanho,
+        os menos acessados recentemente. Retorna o número de linhas removidas.
+        """
+        removidos = 0
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM resultados WHERE criado_em < ?", (time.time() - self.ttl_seconds,)
+            )
+            removidos += cur.rowcount
+            total = self._conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM resultados").fetchone()[0]
+            if total > self.max_bytes:
+                excesso = total - self.max_bytes
+                rows = self._conn.execute(
+                    "SELECT doc_hash, versao, tamanho FROM resultados ORDER BY acessado_em"
+                )
+                remover = []
+                for doc_hash, versao, tamanho in rows:
+                    if excesso <= 0:
+                        break
+                    remover.append((doc_hash, versao))
+                    excesso -= tamanho
+                self._conn.executemany(
+                    "DELETE FROM resultados WHERE doc_hash = ? AND versao = ?", remover
+                )
+                removidos += len(remover)
+        return removidos
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
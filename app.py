@@ -1,688 +1,212 @@
-import io 
-import re
+import os
+import sys
+import json
+import uuid
 import streamlit as st
-import fitz
 import traceback
-from rapidocr_onnxruntime import RapidOCR
-from PIL import Image, ImageOps, ExifTags
-import numpy as np
-import cv2
-
-# --- CONFIGURAÇÃO E FUNÇÕES AUXILIARES ---
+from aih.cache import ResultCache, chave_documento, hash_documento
+from aih.store import ExtractionStore
+from aih.exportacao import ExportadorResultados
+from aih import metrics
+from aih.ocr_pool import FilaCheia, contexto_fila
+from aih.pipeline import (
+    OCR_AQUECER,
+    formatar_cep,
+    formatar_cpf,
+    formatar_telefone,
+    formatar_texto_debug,
+    iniciar_aquecimento,
+    eventos_documento,
+)
+
+# --- CONFIGURAÇÃO ---
 st.set_page_config(page_title="Analisador de Laudo AIH", layout="centered")
 st.markdown("""<style>.block-container {max-width: 740px !important; padding-top: 1.2rem;}</style>""", unsafe_allow_html=True)
 
-def limpar_texto(txt: str) -> str:
-    return re.sub(r"\s+", " ", txt).strip() if txt else ""
-
-def so_digitos(txt: str) -> str:
-    return re.sub(r"\D", "", txt or "")
-
-# === ADIÇÃO 3: PÓS-PROCESSAMENTO DE TEXTO OCR ===
-def post_process_ocr_text(text: str) -> str:
-    """
-    Melhora o texto extraído por OCR corrigindo problemas comuns:
-    - Separa palavras em maiúsculas coladas
-    - Corrige caracteres mal interpretados
-    - Melhora espaçamento
-    """
-    if not text:
-        return text
-    
-    # Dicionário de correções comuns de OCR
-    ocr_corrections = {
-        r'\baS\b': 'às',
-        r'\bde[Ss]aide\b': 'de Saúde',
-        r'\bTeI\b': 'Tel',
-        r'\bEsiado\b': 'Estado',
-        r'\bGOVERNODOE[Ss]IADO\b': 'GOVERNO DO ESTADO',
-    }
-    
-    # Aplicar correções de caracteres
-    corrected_text = text
-    for pattern, replacement in ocr_corrections.items():
-        corrected_text = re.sub(pattern, replacement, corrected_text, flags=re.IGNORECASE)
-    
-    # Separar palavras em maiúsculas coladas (ex: JOAOSILVA -> JOAO SILVA)
-    # Procura por padrões onde uma palavra termina e outra começa
-    def separate_uppercase_words(match):
-        word = match.group(0)
-        # Adiciona espaço antes de cada letra maiúscula que segue uma minúscula ou outra maiúscula seguida de minúscula
-        separated = re.sub(r'([a-z])([A-Z])', r'\1 \2', word)
-        # Adiciona espaço entre sequências de maiúsculas e uma palavra que começa com maiúscula
-        separated = re.sub(r'([A-Z]+)([A-Z][a-z])', r'\1 \2', separated)
-        return separated
-    
-    # Separar nomes próprios colados (sequências longas de maiúsculas)
-    # Identifica palavras com mais de 15 caracteres em maiúsculas sem espaços
-    corrected_text = re.sub(r'\b[A-ZÀÁÂÃÄÅÆÇÈÉÊËÌÍÎÏÐÑÒÓÔÕÖØÙÚÛÜÝÞ]{15,}\b', 
-                           lambda m: separate_long_uppercase(m.group(0)), 
-                           corrected_text)
-    
-    return corrected_text
-
-def separate_long_uppercase(word: str) -> str:
-    """
-    Separa palavras longas em maiúsculas usando heurísticas.
-    Ex: MARIAJOSE -> MARIA JOSE
-    """
-    if len(word) < 15:
-        return word
-    
-    # Lista de nomes comuns brasileiros para ajudar na separação
-    common_names = [
-        'MARIA', 'JOSE', 'JOAO', 'ANA', 'ANTONIO', 'FRANCISCO', 'CARLOS', 'PAULO',
-        'PEDRO', 'LUCAS', 'LUIZ', 'MARCOS', 'LUIS', 'GABRIEL', 'RAFAEL', 'DANIEL',
-        'MARCELO', 'BRUNO', 'RODRIGO', 'FELIPE', 'GUSTAVO', 'ANDRE', 'FERNANDO',
-        'FABIO', 'LEONARDO', 'RICARDO', 'DIEGO', 'JULIO', 'CESAR', 'ROBERTO',
-        'JULIANA', 'MARIANA', 'FERNANDA', 'PATRICIA', 'ALINE', 'JULIANE', 'CARLA',
-        'CAMILA', 'AMANDA', 'BRUNA', 'JESSICA', 'LETICIA', 'VANESSA', 'CRISTINA',
-        'SILVA', 'SANTOS', 'OLIVEIRA', 'SOUZA', 'RODRIGUES', 'FERREIRA', 'ALVES',
-        'PEREIRA', 'LIMA', 'GOMES', 'COSTA', 'RIBEIRO', 'MARTINS', 'CARVALHO',
-        'ROCHA', 'ALMEIDA', 'LOPES', 'SOARES', 'FERNANDES', 'VIEIRA', 'BARBOSA',
-        'ARAUJO', 'CASTRO', 'CARDOSO', 'NASCIMENTO', 'REIS', 'MOREIRA', 'PINTO',
-        'RUA', 'AVENIDA', 'PRACA', 'TRAVESSA', 'ALAMEDA', 'RODOVIA',
-        'MATERNIDADE', 'HOSPITAL', 'CLINICA', 'CENTRO', 'UNIDADE', 'POSTO',
-        'FREI', 'SANTA', 'SANTO', 'SAO', 'NOSSA', 'SENHORA', 'BOM', 'BOA'
-    ]
-    
-    result = []
-    remaining = word
-    
-    while remaining:
-        found = False
-        # Tenta encontrar um nome comum no início da string
-        for name in sorted(common_names, key=len, reverse=True):
-            if remaining.startswith(name) and len(name) >= 3:
-                result.append(name)
-                remaining = remaining[len(name):]
-                found = True
-                break
-        
-        if not found:
-            # Se não encontrou, pega os próximos 3-6 caracteres como uma palavra
-            # Tenta encontrar um ponto de quebra natural
-            chunk_size = min(6, len(remaining))
-            if len(remaining) > 6:
-                # Procura por uma sequência de vogal+consoante como ponto de quebra
-                for i in range(3, min(8, len(remaining))):
-                    if i < len(remaining) - 1:
-                        if remaining[i] in 'AEIOU' and remaining[i+1] not in 'AEIOU':
-                            chunk_size = i + 1
-                            break
-            
-            result.append(remaining[:chunk_size])
-            remaining = remaining[chunk_size:]
-    
-    return ' '.join(result)
-
-# === ADIÇÃO 8: CORREÇÃO DE ESPAÇAMENTO INDEVIDO ===
-def fix_broken_words(text: str) -> str:
-    """
-    Corrige palavras que foram quebradas incorretamente pelo OCR.
-    Ex: 'DOSSA NTOS' -> 'DOS SANTOS', 'A NATA LIA' -> 'ANATALIA'
-    """
-    if not text:
-        return text
-    
-    # Padrões de palavras conhecidas que aparecem quebradas
-    word_fixes = {
-        r'DOSSA\s+NTOS': 'DOS SANTOS',
-        r'A\s+NATA\s*LIABA\s*RBOSA': 'ANATALIA BARBOSA',
-        r'A\s+NATA\s*LIA': 'ANATALIA',
-        r'BA\s+RBOSA': 'BARBOSA',
-        r'Nomedo': 'Nome do',
-        r'Solicltante': 'Solicitante',
-        r'CURETAGEMPOS': 'CURETAGEM POS',
-        r'ABORTORETIDO': 'ABORTO RETIDO',
-        r'RETIDODE': 'RETIDO DE',
-        r'SANGRAMENTOVAGINAL': 'SANGRAMENTO VAGINAL',
-        r'Telefonede': 'Telefone de',
-        r'Municipiode': 'Municipio de',
-    }
-    
-    fixed_text = text
-    for pattern, replacement in word_fixes.items():
-        fixed_text = re.sub(pattern, replacement, fixed_text, flags=re.IGNORECASE)
-    
-    # Corrigir padrão geral: letra + espaço + 1-2 letras + espaço + resto da palavra
-    # Ex: "A NATA" -> "ANATA", mas só se fizer sentido
-    # Procura por padrões como: [LETRA] [1-3 LETRAS] [LETRA] onde há espaços indevidos
-    fixed_text = re.sub(r'\b([A-Z])\s+([A-Z]{1,3})\s+([A-Z]{2,})', 
-                       lambda m: m.group(1) + m.group(2) + m.group(3) if len(m.group(2)) <= 2 else m.group(0),
-                       fixed_text)
-    
-    return fixed_text
+# --- RECURSOS COMPARTILHADOS ENTRE SESSÕES ---
+# === ADIÇÃO 18: CACHE DE RESULTADOS POR HASH DO DOCUMENTO ===
+@st.cache_resource
+def get_result_cache():
+    """Cache compartilhado entre todas as sessões do processo."""
+    return ResultCache()
 
-# === ADIÇÃO 9: NORMALIZAÇÃO DE DATAS ===
-def normalize_dates(text: str) -> str:
+# === ADIÇÃO 19: ARMAZENAMENTO PERSISTENTE (SQLITE) ===
+@st.cache_resource
+def get_extraction_store():
     """
-    Normaliza formatos de data para o padrão DD/MM/AAAA.
-    Ex: '26/3/25' -> '26/03/2025', '1/1/25' -> '01/01/2025'
+    Banco SQLite compartilhado entre réplicas e reinícios do app.
+    Opcional: só é ativado se AIH_STORE_PATH estiver definido.
     """
-    if not text:
-        return text
-    
-    # Padrão para datas no formato D/M/AA ou DD/M/AA ou D/MM/AA
-    def expand_date(match):
-        day, month, year = match.groups()
-        
-        # Adicionar zero à esquerda se necessário
-        day = day.zfill(2)
-        month = month.zfill(2)
-        
-        # Expandir ano de 2 para 4 dígitos
-        if len(year) == 2:
-            year_int = int(year)
-            # Se ano >= 50, considera 19XX, senão 20XX
-            if year_int >= 50:
-                year = '19' + year
-            else:
-                year = '20' + year
-        
-        return f"{day}/{month}/{year}"
-    
-    # Procurar padrões de data: D/M/AA ou DD/MM/AA
-    normalized = re.sub(r'(\d{1,2})/(\d{1,2})/(\d{2,4})', expand_date, text)
-    
-    return normalized
+    path = os.environ.get("AIH_STORE_PATH")
+    if not path:
+        return None
+    return ExtractionStore(path)
 
-# === ADIÇÃO 10: EXTRAÇÃO MELHORADA DE CÓDIGOS ===
-def extract_medical_codes(text: str) -> dict:
+# === ADIÇÃO 36: EXPORTAÇÃO CONTÍNUA (PARQUET/CSV) ===
+@st.cache_resource
+def get_exportador():
     """
-    Extrai códigos médicos específicos do texto.
-    Retorna um dicionário com os códigos encontrados.
+    Exportação de todos os laudos processados, para o faturamento.
+    Opcional: só é ativada se AIH_EXPORT_PATH estiver definido.
     """
-    codes = {}
-    
-    # CID-10 (formato: letra seguida de 2-3 dígitos)
-    cid_match = re.search(r'CID\s*10\s*Principal[^A-Z0-9]*([A-Z]\d{2,3})', text, re.IGNORECASE)
-    if cid_match:
-        codes['cid10'] = cid_match.group(1)
-    
-    # Código do procedimento (geralmente 10 dígitos)
-    proc_match = re.search(r'Codigo\s*do\s*Procedimento[^\d]*(\d{10})', text, re.IGNORECASE)
-    if proc_match:
-        codes['codigo_procedimento'] = proc_match.group(1)
-    
-    # CNES (7 dígitos)
-    cnes_match = re.search(r'CNES[^\d]*(\d{7})', text, re.IGNORECASE)
-    if cnes_match:
-        codes['cnes'] = cnes_match.group(1)
-    
-    return codes
-
-# === ADIÇÃO 4: VALIDAÇÃO DE DADOS ===
-def validar_cpf(cpf: str) -> bool:
-    """Valida CPF usando algoritmo de dígito verificador."""
-    cpf_digits = so_digitos(cpf)
-    if len(cpf_digits) != 11 or cpf_digits == cpf_digits[0] * 11:
-        return False
-    
-    # Validar primeiro dígito
-    soma = sum(int(cpf_digits[i]) * (10 - i) for i in range(9))
-    digito1 = 11 - (soma % 11)
-    digito1 = 0 if digito1 > 9 else digito1
-    
-    if int(cpf_digits[9]) != digito1:
-        return False
-    
-    # Validar segundo dígito
-    soma = sum(int(cpf_digits[i]) * (11 - i) for i in range(10))
-    digito2 = 11 - (soma % 11)
-    digito2 = 0 if digito2 > 9 else digito2
-    
-    return int(cpf_digits[10]) == digito2
+    path = os.environ.get("AIH_EXPORT_PATH")
+    if not path:
+        return None
+    return ExportadorResultados(path)
 
-def validar_cns(cns: str) -> bool:
-    """Valida Cartão Nacional de Saúde (CNS)."""
-    cns_digits = so_digitos(cns)
-    if len(cns_digits) != 15:
-        return False
-    
-    # CNS começando com 1 ou 2
-    if cns_digits[0] in ['1', '2']:
-        soma = sum(int(cns_digits[i]) * (15 - i) for i in range(15))
-        return soma % 11 == 0
-    
-    # CNS começando com 7, 8 ou 9
-    if cns_digits[0] in ['7', '8', '9']:
-        soma = sum(int(cns_digits[i]) * (15 - i) for i in range(15))
-        return soma % 11 == 0
-    
-    return False
-
-def validar_cep(cep: str) -> bool:
-    """Valida formato de CEP."""
-    cep_digits = so_digitos(cep)
-    return len(cep_digits) == 8
-
-def formatar_cpf(cpf: str) -> str:
-    """Formata CPF no padrão XXX.XXX.XXX-XX."""
-    digits = so_digitos(cpf)
-    if len(digits) == 11:
-        return f"{digits[:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:]}"
-    return cpf
-
-def formatar_cep(cep: str) -> str:
-    """Formata CEP no padrão XXXXX-XXX."""
-    digits = so_digitos(cep)
-    if len(digits) == 8:
-        return f"{digits[:5]}-{digits[5:]}"
-    return cep
-
-def formatar_telefone(telefone: str) -> str:
-    """Formata telefone no padrão (XX) XXXXX-XXXX ou (XX) XXXX-XXXX."""
-    digits = so_digitos(telefone)
-    if len(digits) == 11:
-        return f"({digits[:2]}) {digits[2:7]}-{digits[7:]}"
-    elif len(digits) == 10:
-        return f"({digits[:2]}) {digits[2:6]}-{digits[6:]}"
-    return telefone
-
-# === ADIÇÃO 5: FORMATAÇÃO DO TEXTO DE DEBUG ===
-def formatar_texto_debug(text: str) -> str:
-    """Formata o texto extraído para melhor legibilidade."""
-    if not text:
-        return "Nenhum texto extraído."
-    
-    # Adiciona quebras de linha após campos comuns
-    formatted = text
-    
-    # Lista de padrões que indicam início de nova seção
-    section_markers = [
-        'Identificacao do Estabelecimento',
-        'Identificacao do Paciente',
-        'Nome do Paciente',
-        'Data de Nasc',
-        'Endereco Residencial',
-        'Justificativa da Internacao',
-        'Diagnostico Inicial',
-        'Procedimento Solicitado',
-        'AUTORIZACAO'
-    ]
-    
-    for marker in section_markers:
-        formatted = formatted.replace(marker, f'\n\n{marker}')
-    
-    # Adiciona quebra após campos específicos
-    formatted = re.sub(r'(CNS\s+\d+)', r'\1\n', formatted)
-    formatted = re.sub(r'(CPF\s+[\d.-]+)', r'\1\n', formatted)
-    formatted = re.sub(r'(CEP\s+[\d.-]+)', r'\1\n', formatted)
-    formatted = re.sub(r'(Telefone[^)]+\))', r'\1\n', formatted)
-    
-    # Remove múltiplas quebras de linha
-    formatted = re.sub(r'\n{3,}', '\n\n', formatted)
-    
-    return formatted.strip()
-
-# --- MOTORES DE ANÁLISE (A BASE ESTÁVEL) ---
-def parse_pdf_text(full_text: str):
-    data = {}
-    patterns = { "nome_paciente": r"Nome do Paciente\s+([A-ZÀ-ÿ\s]+?)\s+CNS", "cartao_sus": r"CNS\s+(\d{15})\s+", "nome_genitora": r"Nome da Mãe\s+([A-ZÀ-ÿ\s]+?)\s+Endereço Residencial", "data_nascimento": r"Data de Nasc\s+([\d/]+)\s+Sexo", "sexo": r"Sexo\s+(Feminino|Masculino)\s+Raça/cor", "raca": r"Raça/cor\s+([A-ZÀ-ÿ]+)\s+Nome do Responsável", "telefone_paciente": r"Telefone de Contato\s+([()\d\s-]+?)\s+Telefone Celular", "prontuario": r"Núm\. Prontuário\s+(\d+)\s+Telefone de Contato", "endereco_completo": r"Endereço Residencial \(Rua, Av etc\)\s+(.*?)\s+CPF", "municipio_referencia": r"Municipio de Referência\s+([A-ZÀ-ÿ\s]+?)\s+Cód\. IBGE", "uf": r"UF\s+([A-Z]{2})\s+CEP", "cep": r"CEP\s+([\d.-]+?)\s+Diretor Clinico", "diagnostico": r"Diagnóstico Inicial\s+(.*?)\s+CID 10 Principal", "cpf": r"CPF\s+([\d.-]+)\s+Municipio", }
-    for field, pattern in patterns.items():
-        match = re.search(pattern, full_text, re.IGNORECASE)
-        if match: data[field] = limpar_texto(match.group(1))
-    if data.get("cartao_sus"): data["cartao_sus"] = so_digitos(data["cartao_sus"])
-    if data.get("cep"): data["cep"] = so_digitos(data["cep"])
-    if data.get("cpf"): data["cpf"] = so_digitos(data["cpf"])
-    if data.get("telefone_paciente"): data["telefone_paciente"] = so_digitos(data["telefone_paciente"])
-    return data
-
-def parse_ocr_text(full_text: str):
-    data = {}
-    patterns = { "nome_paciente": r"Paciente\s*([A-Z\s]+?)\s*CNS", "cartao_sus": r"CNS\s*(\d{15})", "nome_genitora": r"Mae\s*([A-Z\s]+?)\s*(Feminino|Endereco)", "data_nascimento": r"Nasc\s*([\d/]+)", "sexo": r"(Feminino|Masculino)", "raca": r"Raca/cor\s*([A-Z]+)", "telefone_paciente": r"\((\d{2})\)\s?(\d{4,5}-?\d{4})", "prontuario": r"Prontuario\s*(\d+)", "diagnostico": r"Diagnostico\s*Inicial\s*(.*?)\s*CID", "cpf": r"CPF\s*([\d.-]+)", "endereco_completo": r"RUA\s*([A-Z\s,\d]+)", "municipio_referencia": r"Municipio\s*de\s*Referencia\s*([A-Z\s]+)", "uf": r"UF\s*([A-Z]{2})", "cep": r"CEP\s*([\d.-]+)", }
-    for field, pattern in patterns.items():
-        match = re.search(pattern, full_text, re.IGNORECASE)
-        if match:
-            value = next((g for g in match.groups() if g is not None and not g.lower() in ['feminino', 'endereco']), None)
-            if value: data[field] = limpar_texto(value)
-    if data.get("cartao_sus"): data["cartao_sus"] = so_digitos(data["cartao_sus"])
-    if data.get("cep"): data["cep"] = so_digitos(data["cep"])
-    if data.get("cpf"): data["cpf"] = so_digitos(data["cpf"])
-    if data.get("telefone_paciente"): data["telefone_paciente"] = so_digitos(data["telefone_paciente"])
-    return data
-
-# --- PRÉ-PROCESSAMENTO E EXTRAÇÃO (COM AS NOVAS ADIÇÕES) ---
+# === ADIÇÃO 24: MÉTRICAS POR ETAPA ===
+@st.cache_resource
+def get_metrics_server():
+    """Endpoint /metrics (Prometheus), ativado por AIH_METRICS_PORT."""
+    porta = os.environ.get("AIH_METRICS_PORT")
+    if not porta:
+        return None
+    return metrics.iniciar_servidor(int(porta))
+
+# === ADIÇÃO 28: AQUECIMENTO DO OCR ===
 @st.cache_resource
-def get_ocr_model():
-    return RapidOCR()
+def get_aquecimento_ocr():
+    """Carrega os modelos de OCR em segundo plano na primeira execução do app (AIH_OCR_AQUECER=1)."""
+    return iniciar_aquecimento() if OCR_AQUECER else None
 
-# === ADIÇÃO 13: CORREÇÃO DE PERSPECTIVA ===
-def correct_perspective(image: np.ndarray) -> np.ndarray:
-    """
-    Detecta e corrige perspectiva de documentos fotografados de ângulo.
-    Encontra os 4 cantos do documento e aplica transformação de perspectiva.
-    """
-    try:
-        # Criar cópia para não modificar original
-        img_copy = image.copy()
-        
-        # Detectar bordas
-        edges = cv2.Canny(img_copy, 50, 150)
-        
-        # Encontrar contornos
-        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        if not contours:
-            return image
-        
-        # Pegar o maior contorno (provavelmente o documento)
-        largest_contour = max(contours, key=cv2.contourArea)
-        
-        # Aproximar o contorno para um polígono
-        epsilon = 0.02 * cv2.arcLength(largest_contour, True)
-        approx = cv2.approxPolyDP(largest_contour, epsilon, True)
-        
-        # Se encontrou 4 pontos (retângulo), aplicar transformação
-        if len(approx) == 4:
-            # Ordenar pontos: top-left, top-right, bottom-right, bottom-left
-            pts = approx.reshape(4, 2)
-            rect = np.zeros((4, 2), dtype="float32")
-            
-            # Somar coordenadas: top-left terá menor soma, bottom-right maior
-            s = pts.sum(axis=1)
-            rect[0] = pts[np.argmin(s)]
-            rect[2] = pts[np.argmax(s)]
-            
-            # Diferença: top-right terá menor diferença, bottom-left maior
-            diff = np.diff(pts, axis=1)
-            rect[1] = pts[np.argmin(diff)]
-            rect[3] = pts[np.argmax(diff)]
-            
-            # Calcular largura e altura do documento corrigido
-            (tl, tr, br, bl) = rect
-            widthA = np.sqrt(((br[0] - bl[0]) ** 2) + ((br[1] - bl[1]) ** 2))
-            widthB = np.sqrt(((tr[0] - tl[0]) ** 2) + ((tr[1] - tl[1]) ** 2))
-            maxWidth = max(int(widthA), int(widthB))
-            
-            heightA = np.sqrt(((tr[0] - br[0]) ** 2) + ((tr[1] - br[1]) ** 2))
-            heightB = np.sqrt(((tl[0] - bl[0]) ** 2) + ((tl[1] - bl[1]) ** 2))
-            maxHeight = max(int(heightA), int(heightB))
-            
-            # Pontos de destino
-            dst = np.array([
-                [0, 0],
-                [maxWidth - 1, 0],
-                [maxWidth - 1, maxHeight - 1],
-                [0, maxHeight - 1]], dtype="float32")
-            
-            # Calcular matriz de transformação e aplicar
-            M = cv2.getPerspectiveTransform(rect, dst)
-            warped = cv2.warpPerspective(image, M, (maxWidth, maxHeight))
-            
-            return warped
-        
-        return image
-    except Exception:
-        return image
-
-# === ADIÇÃO 14: AJUSTE AUTOMÁTICO DE BRILHO E CONTRASTE ===
-def auto_adjust_brightness_contrast(image: np.ndarray) -> np.ndarray:
-    """
-    Ajusta automaticamente brilho e contraste da imagem.
-    Útil para fotos escuras ou com pouca luz.
-    """
-    try:
-        # Aplicar equalização de histograma adaptativa (CLAHE)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(image)
-        
-        # Ajuste adicional de contraste
-        # Calcular valores mínimo e máximo
-        min_val = np.percentile(enhanced, 2)
-        max_val = np.percentile(enhanced, 98)
-        
-        # Normalizar entre 0 e 255
-        if max_val > min_val:
-            enhanced = np.clip((enhanced - min_val) * (255.0 / (max_val - min_val)), 0, 255).astype(np.uint8)
-        
-        return enhanced
-    except Exception:
-        return image
-
-# === ADIÇÃO 15: UPSCALING DE IMAGEM ===
-def upscale_image(image: np.ndarray, scale_factor: float = 2.0) -> np.ndarray:
-    """
-    Aumenta a resolução da imagem usando interpolação de alta qualidade.
-    Útil para fotos pequenas ou de baixa resolução.
-    """
-    try:
-        height, width = image.shape[:2]
-        
-        # Só fazer upscale se a imagem for pequena (menor que 1500px)
-        if width < 1500 or height < 1500:
-            new_width = int(width * scale_factor)
-            new_height = int(height * scale_factor)
-            
-            # Usar interpolação cúbica para melhor qualidade
-            upscaled = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_CUBIC)
-            
-            # Aplicar sharpening leve para melhorar nitidez
-            kernel = np.array([[-1,-1,-1],
-                             [-1, 9,-1],
-                             [-1,-1,-1]])
-            sharpened = cv2.filter2D(upscaled, -1, kernel)
-            
-            # Mesclar 70% sharpened + 30% upscaled para não exagerar
-            result = cv2.addWeighted(sharpened, 0.7, upscaled, 0.3, 0)
-            
-            return result
-        
-        return image
-    except Exception:
-        return image
-
-# === ADIÇÃO 16: DETECÇÃO E RECORTE DE BORDAS ===
-def detect_and_crop_document(image: np.ndarray) -> np.ndarray:
+def obter_resultado(file_bytes: bytes, is_pdf: bool, ao_evento=None, nome_arquivo: str = None) -> dict:
     """
-    Detecta as bordas do documento e recorta apenas a área relevante.
-    Remove fundos desnecessários.
+    Busca o resultado no cache em memória, depois no armazenamento persistente,
+    e só executa o pipeline se o documento nunca foi processado.
+    ao_evento(dict) recebe o progresso (posição na fila, campos parciais...)
+    enquanto o pipeline roda.
     """
-    try:
-        # Aplicar blur para reduzir ruído
-        blurred = cv2.GaussianBlur(image, (5, 5), 0)
-        
-        # Detectar bordas
-        edges = cv2.Canny(blurred, 50, 150)
-        
-        # Dilatar para conectar bordas próximas
-        kernel = np.ones((5, 5), np.uint8)
-        dilated = cv2.dilate(edges, kernel, iterations=2)
-        
-        # Encontrar contornos
-        contours, _ = cv2.findContours(dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        if contours:
-            # Pegar o maior contorno
-            largest_contour = max(contours, key=cv2.contourArea)
-            
-            # Pegar bounding box
-            x, y, w, h = cv2.boundingRect(largest_contour)
-            
-            # Adicionar margem de 2%
-            margin = int(min(w, h) * 0.02)
-            x = max(0, x - margin)
-            y = max(0, y - margin)
-            w = min(image.shape[1] - x, w + 2 * margin)
-            h = min(image.shape[0] - y, h + 2 * margin)
-            
-            # Recortar
-            cropped = image[y:y+h, x:x+w]
-            
-            # Só retornar se o recorte for significativo (> 50% da imagem original)
-            if cropped.size > image.size * 0.5:
-                return cropped
-        
-        return image
-    except Exception:
-        return image
-
-# === ADIÇÃO 17: VALIDAÇÃO DE QUALIDADE DA IMAGEM ===
-def assess_image_quality(image: np.ndarray) -> dict:
-    """
-    Avalia a qualidade da imagem e retorna métricas.
-    """
-    quality = {
-        'is_blurry': False,
-        'is_too_dark': False,
-        'is_too_bright': False,
-        'is_low_resolution': False,
-        'blur_score': 0,
-        'brightness': 0,
-        'resolution': (0, 0)
-    }
-    
-    try:
-        # Verificar resolução
-        height, width = image.shape[:2]
-        quality['resolution'] = (width, height)
-        quality['is_low_resolution'] = width < 800 or height < 800
-        
-        # Verificar blur (usando variância do Laplaciano)
-        laplacian_var = cv2.Laplacian(image, cv2.CV_64F).var()
-        quality['blur_score'] = laplacian_var
-        quality['is_blurry'] = laplacian_var < 100  # Threshold empírico
-        
-        # Verificar brilho
-        brightness = np.mean(image)
-        quality['brightness'] = brightness
-        quality['is_too_dark'] = brightness < 80
-        quality['is_too_bright'] = brightness > 200
-        
-        return quality
-    except Exception:
-        return quality
-
-def deskew(image: np.ndarray) -> np.ndarray:
-    """Função para corrigir a inclinação da imagem."""
-    coords = np.column_stack(np.where(image < 255))
-    if len(coords) == 0:
-        return image
-    angle = cv2.minAreaRect(coords)[-1]
-    if angle < -45:
-        angle = -(90 + angle)
-    else:
-        angle = -angle
-    (h, w) = image.shape[:2]
-    center = (w // 2, h // 2)
-    M = cv2.getRotationMatrix2D(center, angle, 1.0)
-    rotated = cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
-    return rotated
-
-def preprocess_image_for_ocr(image_bytes: bytes) -> bytes:
-    """Aplica o pré-processamento completo, incluindo as novas adições."""
-    try:
-        pil_img = Image.open(io.BytesIO(image_bytes))
-        # Autorotação
-        try:
-            for orientation in ExifTags.TAGS.keys():
-                if ExifTags.TAGS[orientation] == 'Orientation': break
-            exif = dict(pil_img._getexif().items())
-            if exif[orientation] == 3: pil_img = pil_img.rotate(180, expand=True)
-            elif exif[orientation] == 6: pil_img = pil_img.rotate(270, expand=True)
-            elif exif[orientation] == 8: pil_img = pil_img.rotate(90, expand=True)
-        except (AttributeError, KeyError, IndexError): pass
-        
-        img_array = np.array(pil_img.convert('RGB'))
-        gray_img = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-        
-        # === ADIÇÃO 13: AVALIAR QUALIDADE DA IMAGEM ===
-        quality = assess_image_quality(gray_img)
-        
-        # === ADIÇÃO 15: UPSCALING SE NECESSÁRIO ===
-        if quality['is_low_resolution']:
-            gray_img = upscale_image(gray_img, scale_factor=2.0)
-        
-        # === ADIÇÃO 14: AJUSTAR BRILHO/CONTRASTE SE NECESSÁRIO ===
-        if quality['is_too_dark'] or quality['is_too_bright']:
-            gray_img = auto_adjust_brightness_contrast(gray_img)
-        
-        # === ADIÇÃO 16: DETECTAR E RECORTAR DOCUMENTO ===
-        gray_img = detect_and_crop_document(gray_img)
-        
-        # === ADIÇÃO 13: CORRIGIR PERSPECTIVA ===
-        gray_img = correct_perspective(gray_img)
-        
-        # === ADIÇÃO 1: REMOÇÃO DE RUÍDO ===
-        denoised_img = cv2.fastNlMeansDenoising(gray_img, None, 10, 7, 21)
-
-        # === ADIÇÃO 2: CORREÇÃO DE INCLINAÇÃO (DESKEW) ===
-        deskewed_img = deskew(denoised_img)
-
-        # Binarização Adaptativa (que já tínhamos)
-        processed_img = cv2.adaptiveThreshold(deskewed_img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 35, 15)
-        
-        _, buffer = cv2.imencode('.png', processed_img)
-        return buffer.tobytes()
-    except Exception:
-        return image_bytes
-
-def extract_text_from_pdf(pdf_bytes: bytes) -> str:
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    return " ".join(page.get_text(sort=True) for page in doc)
-
-def extract_text_from_image(image_bytes: bytes) -> str:
-    processed_bytes = preprocess_image_for_ocr(image_bytes)
-    ocr = get_ocr_model()
-    result, _ = ocr(processed_bytes)
-    if not result: return ""
-    full_text = "".join([item[1] for item in result])
-    full_text = re.sub(r"([A-Z][a-z]+)", r" \1", full_text)
-    full_text = re.sub(r"([A-Z]{2,})", r" \1", full_text)
-    full_text = re.sub(r'\s+', ' ', full_text).strip()
-    
-    # === APLICAR PÓS-PROCESSAMENTO ===
-    full_text = post_process_ocr_text(full_text)
-    
-    # === APLICAR CORREÇÃO DE PALAVRAS QUEBRADAS ===
-    full_text = fix_broken_words(full_text)
-    
-    # === APLICAR NORMALIZAÇÃO DE DATAS ===
-    full_text = normalize_dates(full_text)
-    
-    return full_text
+    doc_hash = hash_documento(file_bytes)
+    chave = chave_documento(doc_hash)
+    result_cache = get_result_cache()
+    resultado = result_cache.get(chave)
+    if resultado is not None:
+        return resultado
+    
+    store = get_extraction_store()
+    resultado = store.get(doc_hash) if store else None
+    if resultado is None:
+        with contexto_fila(st.session_state.sessao_id):
+            for evento in eventos_documento(file_bytes, is_pdf):
+                if evento["evento"] == "erro":
+                    raise evento["excecao"]
+                if evento["evento"] == "concluido":
+                    resultado = evento["resultado"]
+                elif ao_evento is not None:
+                    ao_evento(evento)
+        if store:
+            store.put(doc_hash, resultado)
+        exportador = get_exportador()
+        if exportador:
+            try:
+                exportador.adicionar(doc_hash, resultado, nome_arquivo)
+            except Exception as e:
+                # Uma falha na exportação não pode descartar o resultado já extraído
+                print(f"⚠️ Exportação de {nome_arquivo or doc_hash}: {type(e).__name__}: {e}", file=sys.stderr)
+        if os.environ.get("AIH_METRICS_FILE"):
+            metrics.escrever_arquivo(os.environ["AIH_METRICS_FILE"])
+    
+    result_cache.put(chave, resultado)
+    return resultado
 
 # --- LÓGICA PRINCIPAL DO APLICATIVO ---
+get_metrics_server()
+get_aquecimento_ocr()
+
 if "dados" not in st.session_state: st.session_state.dados = {}
 if "full_text_debug" not in st.session_state: st.session_state.full_text_debug = ""
 if "validacoes" not in st.session_state: st.session_state.validacoes = {}
+if "etapas" not in st.session_state: st.session_state.etapas = []
+if "sessao_id" not in st.session_state: st.session_state.sessao_id = uuid.uuid4().hex
 
 st.title("Analisador de Laudo AIH")
 st.markdown("---")
 
 uploaded = st.file_uploader("📤 Carregar Laudo (PDF ou Imagem)", type=["pdf", "png", "jpg", "jpeg"])
 
+# === ADIÇÃO 30: RESULTADO PARCIAL ENQUANTO O DOCUMENTO É PROCESSADO ===
+# Os widgets do formulário não podem ser desenhados duas vezes com a mesma key
+# na mesma execução; a prévia fica num painel à parte, trocado a cada evento.
+CAMPOS_PREVIA = [
+    ("nome_paciente", "Nome do Paciente", None),
+    ("nome_genitora", "Nome da Mãe", None),
+    ("cpf", "CPF", formatar_cpf),
+    ("cartao_sus", "Cartão SUS", None),
+    ("data_nascimento", "Data de Nascimento", None),
+    ("sexo", "Sexo", None),
+    ("raca", "Raça/Cor", None),
+    ("prontuario", "Prontuário", None),
+    ("endereco_completo", "Endereço Completo", None),
+    ("municipio_referencia", "Município", None),
+    ("uf", "UF", None),
+    ("cep", "CEP", formatar_cep),
+    ("telefone_paciente", "Telefone", formatar_telefone),
+    ("diagnostico", "Diagnóstico", None),
+    ("cid10", "CID-10", None),
+]
+# Chave da validação → campo do formulário
+CAMPO_VALIDACAO = {"cpf": "cpf", "cns": "cartao_sus", "cep": "cep"}
+
+def painel_de_progresso(placeholder):
+    """
+    Monta a função ao_evento que mostra, no placeholder, a posição na fila, a
+    etapa atual e os campos já extraídos, com o ícone de validação quando houver.
+    """
+    campos, validos = {}, {}
+    estado = {"mensagem": "🔍 Analisando documento...", "linhas": 0}
+
+    def ao_evento(evento):
+        tipo = evento["evento"]
+        if tipo == "campo":
+            campos[evento["campo"]] = evento["valor"]
+        elif tipo == "fila":
+            estado["mensagem"] = f"⏳ Aguardando o OCR: posição {evento['posicao']} na fila"
+        elif tipo == "pre_processamento":
+            estado["mensagem"] = "🖼️ Imagem preparada, reconhecendo o texto..."
+        elif tipo == "linhas_ocr":
+            estado["linhas"] += len(evento["linhas"])
+            estado["mensagem"] = f"🔤 {estado['linhas']} linhas reconhecidas"
+        elif tipo == "escalonamento":
+            estado["mensagem"] = "🔁 Conferindo campos com o pré-processamento completo..."
+        elif tipo == "duplicata":
+            estado["mensagem"] = "♻️ Esta folha já foi lida em outra foto, reaproveitando os campos..."
+        elif tipo == "validacao" and evento["campo"] in CAMPO_VALIDACAO:
+            validos[CAMPO_VALIDACAO[evento["campo"]]] = evento["valido"]
+        else:
+            return
+        linhas = []
+        for campo, rotulo, formatar in CAMPOS_PREVIA:
+            valor = campos.get(campo)
+            if not valor:
+                continue
+            icone = {True: " ✅", False: " ⚠️"}.get(validos.get(campo), "")
+            linhas.append(f"- **{rotulo}{icone}:** {formatar(valor) if formatar else valor}")
+        with placeholder.container():
+            st.info(estado["mensagem"])
+            if linhas:
+                st.markdown("\n".join(linhas))
+    return ao_evento
+
 if uploaded:
+    previa = st.empty()
     with st.spinner("🔍 Analisando documento..."):
         try:
-            file_bytes = uploaded.read()
+            file_bytes = uploaded.getvalue()
             
-            if "pdf" in uploaded.type:
-                raw_text = extract_text_from_pdf(file_bytes)
-                extracted_data = parse_pdf_text(raw_text)
-            else:
-                raw_text = extract_text_from_image(file_bytes)
-                extracted_data = parse_ocr_text(raw_text)
+            # === ADIÇÃO 18: REAPROVEITAR RESULTADO EM CACHE ===
+            # Cada edição no formulário gera um rerun; com o cache o custo é só o hash
+            resultado = obter_resultado(file_bytes, "pdf" in uploaded.type, painel_de_progresso(previa),
+                                        uploaded.name)
+            previa.empty()
+            
+            raw_text = resultado["raw_text"]
+            extracted_data = resultado["dados"]
+            validacoes = resultado["validacoes"]
             
             st.session_state.full_text_debug = raw_text
             st.session_state.dados = extracted_data
-            
-            # === ADIÇÃO 11: EXTRAIR CÓDIGOS MÉDICOS ===
-            medical_codes = extract_medical_codes(raw_text)
-            if medical_codes:
-                extracted_data.update(medical_codes)
-                st.session_state.dados = extracted_data
-            
-            # === ADIÇÃO 6: VALIDAR DADOS EXTRAÍDOS ===
-            validacoes = {}
-            if extracted_data.get("cpf"):
-                validacoes["cpf"] = validar_cpf(extracted_data["cpf"])
-            if extracted_data.get("cartao_sus"):
-                validacoes["cns"] = validar_cns(extracted_data["cartao_sus"])
-            if extracted_data.get("cep"):
-                validacoes["cep"] = validar_cep(extracted_data["cep"])
             st.session_state.validacoes = validacoes
+            st.session_state.etapas = resultado.get("etapas", [])
 
             if any(extracted_data.values()):
                 st.success("✅ Documento analisado com sucesso!")
@@ -701,7 +225,11 @@ if uploaded:
                         st.warning(" | ".join(avisos))
             else:
                 st.warning("⚠️ Arquivo lido, mas nenhum dado foi extraído. Verifique o texto de debug.")
+        except FilaCheia as e:
+            previa.empty()
+            st.warning(f"⏳ Servidor ocupado ({e.na_fila} documentos na fila do OCR). Tente novamente em instantes.")
         except Exception as e:
+            previa.empty()
             st.error("Ocorreu um erro crítico ao processar o arquivo.")
             st.session_state.full_text_debug = traceback.format_exc()
 
@@ -786,7 +314,6 @@ st.markdown("---")
 col_btn1, col_btn2 = st.columns(2)
 with col_btn1:
     if st.button("📋 Copiar Dados (JSON)", use_container_width=True):
-        import json
         dados_json = json.dumps(st.session_state.dados, ensure_ascii=False, indent=2)
         st.code(dados_json, language="json")
         st.info("💡 Use Ctrl+A e Ctrl+C para copiar")
@@ -796,6 +323,7 @@ with col_btn2:
         st.session_state.dados = {}
         st.session_state.full_text_debug = ""
         st.session_state.validacoes = {}
+        st.session_state.etapas = []
         st.rerun()
 
 with st.expander("🔍 Ver texto completo extraído (debug)"):
@@ -809,4 +337,20 @@ with st.expander("🔍 Ver texto completo extraído (debug)"):
             file_name="texto_extraido.txt",
             mime="text/plain"
         )
+    
+    # === ADIÇÃO 24: TEMPOS POR ETAPA DO DOCUMENTO ===
+    if st.session_state.get("etapas") and st.checkbox("⏱️ Mostrar tempos por etapa"):
+        st.dataframe(
+            [
+                {
+                    "Etapa": item["etapa"],
+                    "Tempo (s)": item["wall_s"],
+                    "CPU do processo (s)": item["cpu_s"],
+                    "Pixels": item["pixels"],
+                    "Pico de memória (bytes)": item["pico_bytes"],
+                }
+                for item in st.session_state.etapas
+            ],
+            use_container_width=True,
+        )
 
@@ -0,0 +1 @@
+"""Benchmarks de desempenho e acurácia do pipeline de extração."""
@@ -0,0 +1,107 @@
+"""
+Benchmark do deskew: minAreaRect sobre todos os pixels × perfil de projeção.
+
+Uso:
+    python -m benchmarks.deskew                          # 3 páginas × 8 ângulos
+    python -m benchmarks.deskew --paginas 5 --angulos -8 -2 0 0.5 4
+
+Cada página sintética do laudo é girada por ângulos conhecidos, com ruído e um
+leve desfoque, como a imagem em cinza que sai do denoise. Para cada versão mede
+tempo, pico de memória do NumPy (tracemalloc) e o erro da inclinação que sobra
+depois da correção. A implementação anterior fica aqui como referência.
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+import cv2
+import fitz
+import numpy as np
+
+from aih import pipeline
+from benchmarks.sinteticos import gerar_paciente, renderizar_pdf
+
+ANGULOS_PADRAO = [-7, -3, -1, -0.2, 0, 0.8, 2.5, 6]
+
+
+def referencia_angulo(image: np.ndarray) -> float:
+    """Ângulo aplicado pelo deskew anterior (0 quando não girava)."""
+    coords = np.column_stack(np.where(image < 255))
+    if len(coords) == 0:
+        return 0.0
+    angle = cv2.minAreaRect(coords)[-1]
+    if angle < -45:
+        angle = -(90 + angle)
+    else:
+        angle = -angle
+    return angle
+
+
+def atual_angulo(image: np.ndarray) -> float:
+    angulo = pipeline.estimar_inclinacao(image)
+    return angulo if abs(angulo) >= pipeline.INCLINACAO_MINIMA_GRAUS else 0.0
+
+
+def pagina_cinza(rng: random.Random, dpi: int = 200) -> np.ndarray:
+    doc = fitz.open(stream=renderizar_pdf(gerar_paciente(rng)), filetype="pdf")
+    pix = doc[0].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    pagina = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width).copy()
+    doc.close()
+    return pagina
+
+
+def girar(pagina: np.ndarray, angulo: float, rng: np.random.Generator) -> np.ndarray:
+    """Gira a página e imita o cinza do denoise: papel levemente abaixo de 255, com ruído."""
+    h, w = pagina.shape
+    M = cv2.getRotationMatrix2D((w // 2, h // 2), angulo, 1.0)
+    girada = cv2.warpAffine(pagina, M, (w, h), borderValue=255).astype(np.int16)
+    girada += rng.normal(-8, 4, girada.shape).astype(np.int16)
+    return cv2.GaussianBlur(np.clip(girada, 0, 255).astype(np.uint8), (3, 3), 0)
+
+
+def medir(funcao, imagem: np.ndarray) -> tuple:
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    angulo = funcao(imagem)
+    decorrido = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return angulo, decorrido, pico
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark do deskew (anterior × perfil de projeção).")
+    parser.add_argument("--paginas", type=int, default=3)
+    parser.add_argument("--angulos", type=float, nargs="*", default=ANGULOS_PADRAO)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    ruido = np.random.default_rng(args.seed)
+    paginas = [pagina_cinza(rng) for _ in range(args.paginas)]
+    resultados = {"anterior": [], "atual": []}
+    print(f"{'ângulo':>7} {'anterior':>10} {'atual':>8}   (inclinação que sobra após a correção, graus)")
+    for pagina in paginas:
+        for angulo in args.angulos:
+            imagem = girar(pagina, angulo, ruido)
+            residuos = []
+            for nome, funcao in (("anterior", referencia_angulo), ("atual", atual_angulo)):
+                corrigido, decorrido, pico = medir(funcao, imagem)
+                residuo = abs(angulo + corrigido)
+                resultados[nome].append((residuo, decorrido, pico))
+                residuos.append(residuo)
+            print(f"{angulo:>7.1f} {residuos[0]:>10.2f} {residuos[1]:>8.2f}")
+
+    print(f"\n{'versão':<10} {'tempo p50':>10} {'pico memória':>13} {'erro médio':>11} {'erro máx':>9}")
+    for nome, linhas in resultados.items():
+        residuos, tempos, picos = zip(*linhas)
+        print(f"{nome:<10} {statistics.median(tempos) * 1e3:>8.1f}ms {max(picos) / 2 ** 20:>11.1f}MB "
+              f"{statistics.mean(residuos):>10.2f}° {max(residuos):>8.2f}°")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
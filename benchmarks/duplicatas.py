@@ -0,0 +1,126 @@
+"""
+Benchmark da detecção de fotos repetidas do mesmo laudo (aih.duplicatas).
+
+Uso:
+    python -m benchmarks.duplicatas                  # 6 pacientes x 5 fotos
+    python -m benchmarks.duplicatas -n 10 --ocr      # também o pipeline com e sem o índice
+
+Para cada par de fotos mede a distância de Hamming das impressões e a
+correlação do pior campo, separando pares da mesma folha e de pacientes
+diferentes: a faixa entre os dois grupos é a margem dos limiares
+AIH_DUPLICATAS_DISTANCIA e AIH_DUPLICATAS_SEMELHANCA. Depois simula o índice:
+a primeira foto de cada paciente entra, as outras procuram (acertos, perdidas
+e falsos positivos), e um candidato só vale com o CNS lido da foto igual ao
+guardado, como no pipeline. As fotos são do formulário do modelo preenchido nas
+próprias células (gerar_corpus(..., formulario=True)). Com --ocr, processa as fotos pelo pipeline com o índice
+desligado e ligado e compara o tempo e os campos.
+"""
+import argparse
+import itertools
+import statistics
+import sys
+import time
+
+from aih import duplicatas, pipeline
+from benchmarks.sinteticos import gerar_corpus
+
+
+def preparar(corpus: list) -> list:
+    """[(paciente, tipo, página normalizada, impressão, segundos, gabarito)] das fotos do corpus."""
+    fotos = []
+    for item in corpus:
+        if item["is_pdf"]:
+            continue
+        gray = pipeline.decode_image(item["bytes"])
+        inicio = time.perf_counter()
+        pagina = pipeline.pagina_normalizada(gray)
+        impressao = duplicatas.calcular_impressao(pagina)
+        fotos.append((item["nome"].rsplit("_", 1)[0], item["tipo"], pagina, impressao,
+                      time.perf_counter() - inicio, item["verdade"]))
+    return fotos
+
+
+def separacao(fotos: list) -> None:
+    grupos = {"mesma folha": ([], []), "outro paciente": ([], [])}
+    for (pa, _, _, ia, *_), (pb, _, pagina_b, ib, *_) in itertools.combinations(fotos, 2):
+        distancias, semelhancas = grupos["mesma folha" if pa == pb else "outro paciente"]
+        distancias.append(duplicatas.distancia(ia.bits, ib.bits))
+        semelhancas.append(duplicatas.semelhanca(pagina_b, ia))
+    print(f"{'pares':<16} {'n':>4} {'bits mín':>9} {'bits máx':>9} {'correl. mín':>12} {'correl. máx':>12}")
+    for nome, (distancias, semelhancas) in grupos.items():
+        if distancias:
+            print(f"{nome:<16} {len(distancias):>4} {min(distancias):>9} {max(distancias):>9} "
+                  f"{min(semelhancas):>12.3f} {max(semelhancas):>12.3f}")
+
+
+def simular_indice(fotos: list) -> None:
+    indice = duplicatas.IndiceDuplicatas()
+    acertos = perdidas = falsas = barradas = 0
+    tempos, tempos_cns = [], []
+    vistos = set()
+    for paciente, tipo, pagina, impressao, _, verdade in fotos:
+        inicio = time.perf_counter()
+        encontrada = indice.procurar(impressao, pagina)
+        tempos.append(time.perf_counter() - inicio)
+        if encontrada is not None:
+            inicio = time.perf_counter()
+            lidos = duplicatas.ler_identificadores(pagina, pipeline.reconhecer_recortes)
+            tempos_cns.append(time.perf_counter() - inicio)
+            if not duplicatas.mesmo_paciente(lidos, encontrada[0].resultado["dados"]):
+                barradas += int(encontrada[0].resultado["paciente"] != paciente)
+                encontrada = None
+        if encontrada is not None:
+            if encontrada[0].resultado["paciente"] == paciente:
+                acertos += 1
+            else:
+                falsas += 1
+                print(f"  ❌ {paciente} {tipo} casou com {encontrada[0].resultado['paciente']}")
+        elif paciente in vistos:
+            perdidas += 1
+            print(f"  ⚠️ {paciente} {tipo} não encontrou a foto anterior")
+        if encontrada is None:
+            indice.registrar(impressao, {"paciente": paciente, "dados": verdade})
+        vistos.add(paciente)
+    print(f"🔎 índice: {acertos} encontradas, {perdidas} perdidas, {falsas} falsos positivos, "
+          f"{barradas} candidatos de outro paciente barrados pelo CNS "
+          f"(busca p50 {statistics.median(tempos) * 1e3:.1f}ms"
+          + (f", leitura do CNS p50 {statistics.median(tempos_cns) * 1e3:.1f}ms)" if tempos_cns else ")"))
+
+
+def pipeline_com_indice(corpus: list) -> None:
+    fotos = [item for item in corpus if not item["is_pdf"]]
+    for ligado in (False, True):
+        pipeline.DUPLICATAS = ligado
+        pipeline.get_indice_duplicatas().clear()
+        inicio = time.perf_counter()
+        niveis, campos = [], 0
+        for item in fotos:
+            resultado = pipeline.processar_documento(item["bytes"], False)
+            niveis.append(resultado["nivel_ocr"])
+            campos += sum(pipeline.limpar_texto(str(resultado["dados"].get(c, ""))).upper() ==
+                          pipeline.limpar_texto(str(v)).upper() for c, v in item["verdade"].items())
+        decorrido = time.perf_counter() - inicio
+        print(f"{'com' if ligado else 'sem'} índice: {decorrido:.1f}s para {len(fotos)} fotos, "
+              f"{niveis.count('duplicata')} reaproveitadas, {campos} campos corretos")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Fotos repetidas do mesmo laudo: separação e reaproveitamento.")
+    parser.add_argument("-n", "--pacientes", type=int, default=6)
+    parser.add_argument("--ocr", action="store_true", help="processar as fotos pelo pipeline, sem e com o índice")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    corpus = gerar_corpus(args.pacientes, args.seed, formulario=True)
+    fotos = preparar(corpus)
+    print(f"🖼️ {len(fotos)} fotos de {args.pacientes} pacientes, impressão de {fotos[0][3].n_bits} bits "
+          f"em {statistics.median(f[4] for f in fotos) * 1e3:.1f}ms (p50)")
+    separacao(fotos)
+    simular_indice(fotos)
+    if args.ocr:
+        pipeline_com_indice(corpus)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
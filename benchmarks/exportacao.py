@@ -0,0 +1,115 @@
+"""
+Benchmark da exportação contínua (aih.exportacao): vazão e memória.
+
+Uso:
+    python -m benchmarks.exportacao                      # 20 mil laudos, Parquet
+    python -m benchmarks.exportacao -n 100000 --formato csv --repetidos 0.2
+
+Gera resultados sintéticos (sem OCR), com uma fração de documentos repetidos:
+o mesmo arquivo reenviado (mesmo hash), outra foto do mesmo laudo (outro hash,
+mesmo paciente, procedimento e data) ou um laudo novo do mesmo paciente (outra
+data), e exporta todos. A cada quinto do caminho mostra o pico de memória do
+Python (tracemalloc), que deve ficar no mesmo patamar do começo ao fim. No
+final, lê a exportação e confere que cada laudo aparece uma vez só e que
+nenhum laudo novo sobrescreveu outro do mesmo paciente.
+"""
+import argparse
+import datetime
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from aih import exportacao
+from aih.pipeline import CAMPOS_LAUDO
+from benchmarks.sinteticos import gerar_paciente
+
+
+def data_sintetica(i: int) -> str:
+    """Data de laudo única por documento gerado."""
+    return (datetime.date(2020, 1, 1) + datetime.timedelta(days=i)).strftime("%d/%m/%Y")
+
+
+def resultado_sintetico(paciente: dict, data_laudo: str) -> dict:
+    dados = {campo: paciente[campo] for campo in CAMPOS_LAUDO if campo in paciente}
+    dados["data_laudo"] = data_laudo
+    return {
+        "dados": dados,
+        "validacoes": {"cpf": True, "cns": True, "cep": True},
+        "nivel_ocr": "rapido",
+        "motivos_escalonamento": [],
+        "etapas": [{"etapa": "documento", "wall_s": 14.2}, {"etapa": "ocr", "wall_s": 11.8}],
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Vazão e memória da exportação contínua.")
+    parser.add_argument("-n", "--documentos", type=int, default=20000)
+    parser.add_argument("--formato", choices=["parquet", "csv"], default=exportacao.FORMATO)
+    parser.add_argument("--linhas", type=int, default=exportacao.LINHAS_POR_GRUPO,
+                        help="linhas por parte (AIH_EXPORT_LINHAS)")
+    parser.add_argument("--repetidos", type=float, default=0.1,
+                        help="fração de documentos que repetem um laudo ou um paciente já exportado")
+    parser.add_argument("--pasta", type=Path, help="pasta da exportação (padrão: temporária)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    pasta = args.pasta or Path(tempfile.mkdtemp(prefix="aih-exportacao-"))
+    exportador = exportacao.ExportadorResultados(pasta, args.formato, args.linhas, intervalo_s=float("inf"))
+    print(f"📦 {args.documentos} documentos em {pasta} ({args.formato}, {args.linhas} linhas por parte)")
+
+    laudos = []
+    esperados = 0
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    for i in range(args.documentos):
+        novo = True
+        if laudos and rng.random() < args.repetidos:
+            doc_hash, paciente, data_laudo = rng.choice(laudos)
+            # Um terço reenvia o mesmo arquivo, um terço é outra foto do mesmo laudo
+            # e um terço é um laudo novo do mesmo paciente (outra data)
+            sorteio = rng.random()
+            novo = sorteio >= 2 / 3
+            if sorteio >= 1 / 3:
+                doc_hash = f"{i:064x}"
+            if novo:
+                data_laudo = data_sintetica(i)
+        else:
+            doc_hash, paciente, data_laudo = f"{i:064x}", gerar_paciente(rng), data_sintetica(i)
+        if novo:
+            esperados += 1
+            # Guarda só uma amostra, para os repetidos não fazerem a memória do benchmark crescer
+            if len(laudos) < 1000:
+                laudos.append((doc_hash, paciente, data_laudo))
+            else:
+                laudos[rng.randrange(len(laudos))] = (doc_hash, paciente, data_laudo)
+        exportador.adicionar(doc_hash, resultado_sintetico(paciente, data_laudo), f"laudo_{i}.jpg")
+        if (i + 1) % max(1, args.documentos // 5) == 0:
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            print(f"  {i + 1:>8} documentos  {(i + 1) / (time.perf_counter() - inicio):>8.0f} docs/s  "
+                  f"pico {pico / 2 ** 20:>6.1f}MB")
+    exportador.close()
+    tracemalloc.stop()
+    decorrido = time.perf_counter() - inicio
+
+    tamanho = sum(p.stat().st_size for p in pasta.glob("parte-*"))
+    inicio = time.perf_counter()
+    registros = [linha["registro"] for linha in exportacao.ler_exportacao(pasta)]
+    leitura = time.perf_counter() - inicio
+    duplicados = len(registros) - len(set(registros))
+    perdidos = esperados - len(set(registros))
+    print(f"✅ {args.documentos / decorrido:.0f} docs/s, {exportador.partes} partes, {tamanho / 2 ** 20:.1f}MB; "
+          f"{len(registros)} laudos atuais lidos em {leitura:.1f}s, {duplicados} duplicados, "
+          f"{perdidos} sobrescritos (de {esperados} laudos)")
+    if args.pasta is None:
+        shutil.rmtree(pasta)
+    return 1 if duplicados or perdidos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
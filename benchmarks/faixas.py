@@ -0,0 +1,78 @@
+"""
+Benchmark dos filtros do pré-processamento em faixas paralelas (aih.faixas).
+
+Uso:
+    python -m benchmarks.faixas                          # 2 fotos, threads 1, 2, 4 e núcleos
+    python -m benchmarks.faixas --threads 1 8 16 --opencv-threads 1
+
+Para cada etapa (denoise, binarização e o sharpening do upscale) compara a
+chamada única sobre a página com a versão em faixas, por número de threads:
+tempo p50, speedup e quantos pixels diferem da chamada única (o esperado é 0).
+O OpenCV também paraleliza alguns filtros por dentro (cv2.setNumThreads); use
+--opencv-threads 1 para medir só o ganho das faixas.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from aih import pipeline
+from benchmarks.sinteticos import gerar_corpus
+
+# As próprias funções do pipeline, com o número de threads das faixas como parâmetro
+ETAPAS = {
+    "denoise": pipeline.remover_ruido,
+    "binarizacao": pipeline.binarizar,
+    "sharpen": pipeline.realcar,
+}
+
+
+def cronometrar(funcao, repeticoes: int) -> tuple:
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        saida = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return saida, statistics.median(tempos)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Filtros em faixas paralelas × chamada única.")
+    parser.add_argument("-n", "--fotos", type=int, default=2)
+    parser.add_argument("--threads", type=int, nargs="*",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--opencv-threads", type=int, help="cv2.setNumThreads antes de medir")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    if args.opencv_threads is not None:
+        cv2.setNumThreads(args.opencv_threads)
+    corpus = gerar_corpus(args.fotos, args.seed, variantes=["limpa"])
+    paginas = [pipeline.decode_image(item["bytes"]) for item in corpus if not item["is_pdf"]]
+    print(f"🖼️ {len(paginas)} páginas de {paginas[0].shape[1]}x{paginas[0].shape[0]}, "
+          f"{os.cpu_count()} núcleos, OpenCV com {cv2.getNumThreads()} thread(s)")
+
+    print(f"{'etapa':<12} {'threads':>7} {'p50':>9} {'speedup':>8} {'pixels diferentes':>18}")
+    for nome, funcao in ETAPAS.items():
+        base = None
+        for threads in args.threads:
+            tempos, diferentes = [], 0
+            for pagina in paginas:
+                # Com 1 thread, em_faixas é a chamada única sobre a página
+                referencia = funcao(pagina, threads=1)
+                saida, tempo = cronometrar(lambda: funcao(pagina, threads=threads), args.repeticoes)
+                tempos.append(tempo)
+                diferentes += int(np.count_nonzero(saida != referencia))
+            tempo = statistics.mean(tempos)
+            base = base or tempo
+            print(f"{nome:<12} {threads:>7} {tempo * 1e3:>7.1f}ms {base / tempo:>7.2f}x {diferentes:>18}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Benchmark da validação/formatação em lote (aih.identificadores) × funções escalares.
+
+Uso:
+    python -m benchmarks.identificadores                  # 10 mil e 1 milhão de valores
+    python -m benchmarks.identificadores --tamanhos 100000 5000000
+
+As colunas imitam uma exportação histórica: valores válidos com e sem máscara,
+dígitos trocados, tamanhos errados, vazios, None e alguns dígitos não ASCII.
+Antes de medir, o benchmark confere que o lote dá o mesmo resultado que a
+função escalar em todas as linhas.
+"""
+import argparse
+import random
+import sys
+import time
+
+from aih import identificadores, pipeline
+from benchmarks.sinteticos import gerar_cns, gerar_cpf
+
+
+def sujar(rng: random.Random, digitos: str, formatar) -> str:
+    """Uma variação do identificador como aparece nas exportações."""
+    sorteio = rng.random()
+    if sorteio < 0.35:
+        return formatar(digitos)
+    if sorteio < 0.6:
+        return digitos
+    if sorteio < 0.75:
+        i = rng.randrange(len(digitos))
+        return digitos[:i] + str((int(digitos[i]) + rng.randint(1, 9)) % 10) + digitos[i + 1:]
+    if sorteio < 0.85:
+        return digitos[:rng.randint(0, len(digitos) - 1)]
+    if sorteio < 0.9:
+        return rng.choice(["", None, "-", "NAO INFORMADO"])
+    if sorteio < 0.9005:
+        return "".join(chr(0x0660 + int(d)) for d in digitos)   # dígitos arábicos
+    return f" {digitos[:3]} {digitos[3:]} "
+
+
+def gerar_coluna(tipo: str, n: int, rng: random.Random) -> list:
+    geradores = {
+        "cpf": (lambda: gerar_cpf(rng), pipeline.formatar_cpf),
+        "cns": (lambda: gerar_cns(rng), lambda d: f"{d[:3]} {d[3:7]} {d[7:11]} {d[11:]}"),
+        "cep": (lambda: f"{rng.randrange(10 ** 8):08d}", pipeline.formatar_cep),
+        "telefone": (lambda: f"{rng.randint(11, 99)}{rng.choice(['9', ''])}{rng.randrange(10 ** 8):08d}",
+                     pipeline.formatar_telefone),
+    }
+    gerar, formatar = geradores[tipo]
+    # Valores repetidos são comuns numa exportação; um conjunto base mantém a geração rápida
+    base = [sujar(rng, gerar(), formatar) for _ in range(min(n, 50_000))]
+    return [base[rng.randrange(len(base))] for _ in range(n)]
+
+
+CASOS = [
+    ("validar_cpf", "cpf", pipeline.validar_cpf, identificadores.validar_cpf_lote),
+    ("validar_cns", "cns", pipeline.validar_cns, identificadores.validar_cns_lote),
+    ("validar_cep", "cep", pipeline.validar_cep, identificadores.validar_cep_lote),
+    ("formatar_cpf", "cpf", pipeline.formatar_cpf, identificadores.formatar_cpf_lote),
+    ("formatar_cep", "cep", pipeline.formatar_cep, identificadores.formatar_cep_lote),
+    ("formatar_telefone", "telefone", pipeline.formatar_telefone, identificadores.formatar_telefone_lote),
+]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Validação/formatação em lote × escalar.")
+    parser.add_argument("--tamanhos", type=int, nargs="*", default=[10_000, 1_000_000])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    print(f"{'função':<20} {'valores':>9} {'escalar':>10} {'lote':>10} {'ganho':>7}")
+    for n in args.tamanhos:
+        colunas = {tipo: gerar_coluna(tipo, n, rng) for tipo in ("cpf", "cns", "cep", "telefone")}
+        for nome, tipo, escalar, lote in CASOS:
+            coluna = colunas[tipo]
+            inicio = time.perf_counter()
+            esperado = [escalar(v) for v in coluna]
+            t_escalar = time.perf_counter() - inicio
+            inicio = time.perf_counter()
+            obtido = lote(coluna)
+            t_lote = time.perf_counter() - inicio
+            if obtido.tolist() != esperado:
+                print(f"❌ {nome}: resultado diferente da função escalar ({n} valores)", file=sys.stderr)
+                return 1
+            print(f"{nome:<20} {n:>9} {t_escalar:>9.3f}s {t_lote:>9.3f}s {t_escalar / t_lote:>6.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
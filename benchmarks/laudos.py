@@ -0,0 +1,194 @@
+"""
+Benchmark de velocidade e acurácia do pipeline sobre laudos sintéticos.
+
+Uso:
+    python -m benchmarks.laudos                      # 5 pacientes x (PDF + 5 fotos)
+    python -m benchmarks.laudos -n 20 --saida base.json
+    python -m benchmarks.laudos --comparar base.json # compara com uma execução anterior
+    AIH_OCR_LAYOUT=1 python -m benchmarks.laudos --formulario   # fotos do formulário real
+
+O resultado (latência por etapa, docs/s, pico de RSS e acurácia por campo)
+é gravado em JSON, por padrão em benchmarks/resultados/<commit>.json.
+"""
+import argparse
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import unicodedata
+from collections import defaultdict
+from pathlib import Path
+
+from aih.cache import PIPELINE_VERSION
+from aih.pipeline import CAMPOS_LAYOUT, limpar_texto, so_digitos
+from benchmarks.sinteticos import VARIANTES_FOTO, gerar_corpus, salvar_corpus
+
+PASTA_RESULTADOS = Path(__file__).resolve().parent / "resultados"
+
+CAMPOS_NUMERICOS = {"cartao_sus", "cpf", "cep", "telefone_paciente", "prontuario",
+                    "codigo_procedimento", "cnes"}
+
+
+def commit_atual() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecido"
+
+
+def normalizar(campo: str, valor) -> str:
+    """Normaliza um valor para comparação: só dígitos ou maiúsculas sem acento."""
+    if valor is None:
+        return ""
+    if campo in CAMPOS_NUMERICOS:
+        return so_digitos(str(valor))
+    texto = unicodedata.normalize("NFKD", str(valor)).encode("ascii", "ignore").decode()
+    return limpar_texto(texto).upper()
+
+
+def pico_rss_mb() -> float:
+    # No Linux ru_maxrss é em KB
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def percentil(valores: list, p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p * (len(ordenados) - 1))))]
+
+
+def avaliar(corpus: list, processar=None) -> dict:
+    """
+    Roda o pipeline em todo o corpus e mede latência, vazão e acurácia.
+    `processar(bytes, is_pdf) -> resultado` permite avaliar variantes do pipeline.
+    """
+    if processar is None:
+        from aih.pipeline import processar_documento as processar
+
+    tempos_etapa = defaultdict(list)
+    tempos_doc = defaultdict(list)
+    acertos = defaultdict(lambda: defaultdict(int))
+    totais = defaultdict(int)
+    # Documentos por tipo e campo: o gabarito do formulário não tem todos os campos
+    com_campo = defaultdict(lambda: defaultdict(int))
+    niveis = defaultdict(lambda: defaultdict(int))
+
+    inicio = time.perf_counter()
+    for item in corpus:
+        t0 = time.perf_counter()
+        resultado = processar(item["bytes"], item["is_pdf"])
+        tempos_doc[item["tipo"]].append(time.perf_counter() - t0)
+        for medicao in resultado.get("etapas", []):
+            tempos_etapa[medicao["etapa"]].append(medicao["wall_s"])
+        niveis[item["tipo"]][resultado.get("nivel_ocr")] += 1
+
+        totais[item["tipo"]] += 1
+        for campo in CAMPOS_LAYOUT:
+            com_campo[item["tipo"]][campo] += int(campo in item["verdade"])
+            esperado = normalizar(campo, item["verdade"].get(campo))
+            obtido = normalizar(campo, resultado["dados"].get(campo))
+            acertos[item["tipo"]][campo] += int(bool(esperado) and esperado == obtido)
+    duracao = time.perf_counter() - inicio
+
+    acuracia = {
+        tipo: {campo: round(acertos[tipo][campo] / com_campo[tipo][campo], 3)
+               for campo in CAMPOS_LAYOUT if com_campo[tipo][campo]}
+        for tipo in totais
+    }
+    return {
+        "documentos": len(corpus),
+        "duracao_s": round(duracao, 3),
+        "docs_por_s": round(len(corpus) / duracao, 3),
+        "pico_rss_mb": pico_rss_mb(),
+        "latencia_por_tipo": {
+            tipo: {"media_s": round(statistics.mean(t), 4), "p95_s": round(percentil(t, 0.95), 4)}
+            for tipo, t in tempos_doc.items()
+        },
+        "etapas": {
+            etapa: {
+                "n": len(t),
+                "media_s": round(statistics.mean(t), 5),
+                "p50_s": round(percentil(t, 0.50), 5),
+                "p95_s": round(percentil(t, 0.95), 5),
+                "total_s": round(sum(t), 4),
+            }
+            for etapa, t in sorted(tempos_etapa.items())
+        },
+        "nivel_ocr": {tipo: dict(contagem) for tipo, contagem in niveis.items()},
+        "acuracia": acuracia,
+        "acuracia_por_tipo": {
+            tipo: round(statistics.mean(campos.values()), 3) for tipo, campos in acuracia.items()
+        },
+        "acuracia_geral": round(statistics.mean(
+            v for campos in acuracia.values() for v in campos.values()), 3),
+    }
+
+
+def imprimir_resumo(res: dict, log=sys.stdout) -> None:
+    print(f"📄 {res['documentos']} documentos em {res['duracao_s']}s - "
+          f"{res['docs_por_s']} docs/s - pico RSS {res['pico_rss_mb']} MB", file=log)
+    print("\n⏱️  Etapas (média / p95 / total):", file=log)
+    for etapa, t in sorted(res["etapas"].items(), key=lambda kv: -kv[1]["total_s"]):
+        print(f"  {etapa:<34} {t['media_s']:>9.4f}s {t['p95_s']:>9.4f}s {t['total_s']:>9.2f}s", file=log)
+    print("\n🎯 Acurácia por tipo de documento:", file=log)
+    for tipo, acc in res["acuracia_por_tipo"].items():
+        print(f"  {tipo:<20} {acc:.1%}  (média {res['latencia_por_tipo'][tipo]['media_s']:.2f}s/doc)", file=log)
+    print(f"  {'geral':<20} {res['acuracia_geral']:.1%}", file=log)
+
+
+def comparar(atual: dict, anterior: dict, log=sys.stdout) -> None:
+    """Mostra a variação de vazão, memória, acurácia e etapas em relação a outra execução."""
+    ra, rb = atual["resultado"], anterior["resultado"]
+    print(f"\n📊 Comparação com {anterior.get('commit')} (pipeline {anterior.get('versao_pipeline')}):", file=log)
+    for chave in ("docs_por_s", "pico_rss_mb", "acuracia_geral"):
+        a, b = ra[chave], rb[chave]
+        variacao = f"{(a - b) / b:+.1%}" if b else "n/a"
+        print(f"  {chave:<18} {b} → {a} ({variacao})", file=log)
+    for etapa in sorted(set(ra["etapas"]) & set(rb["etapas"])):
+        a, b = ra["etapas"][etapa]["media_s"], rb["etapas"][etapa]["media_s"]
+        if b:
+            print(f"  {etapa:<34} {b:.4f}s → {a:.4f}s ({(a - b) / b:+.1%})", file=log)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline sobre laudos sintéticos.")
+    parser.add_argument("-n", "--pacientes", type=int, default=5, help="número de pacientes sintéticos")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--variantes", nargs="*", default=VARIANTES_FOTO,
+                        help=f"variantes de foto ({', '.join(VARIANTES_FOTO)}); vazio = só PDF")
+    parser.add_argument("--formulario", action="store_true",
+                        help="só fotos do formulário do modelo preenchido nas próprias células")
+    parser.add_argument("--saida", type=Path, help="arquivo JSON do resultado")
+    parser.add_argument("--comparar", type=Path, help="JSON de uma execução anterior")
+    parser.add_argument("--salvar-corpus", type=Path, help="grava também os laudos gerados nesta pasta")
+    args = parser.parse_args(argv)
+
+    corpus = gerar_corpus(args.pacientes, args.seed, args.variantes, args.formulario)
+    if args.salvar_corpus:
+        salvar_corpus(corpus, args.salvar_corpus)
+
+    resultado = avaliar(corpus)
+    imprimir_resumo(resultado)
+
+    registro = {
+        "commit": commit_atual(),
+        "versao_pipeline": PIPELINE_VERSION,
+        "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"pacientes": args.pacientes, "seed": args.seed, "variantes": args.variantes,
+                   "formulario": args.formulario},
+        "resultado": resultado,
+    }
+    saida = args.saida or PASTA_RESULTADOS / f"{registro['commit']}.json"
+    saida.parent.mkdir(parents=True, exist_ok=True)
+    saida.write_text(json.dumps(registro, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n💾 Resultado gravado em {saida}")
+
+    if args.comparar:
+        comparar(registro, json.loads(args.comparar.read_text(encoding="utf-8")))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Benchmark do reconhecimento em lote entre documentos (aih.lote_ocr).
+
+Uso:
+    python -m benchmarks.lote_ocr                         # 2 fotos, 2 sessões simultâneas
+    python -m benchmarks.lote_ocr -n 2 --concorrencia 4 --janela-ms 50
+
+Várias "sessões" (threads) reconhecem fotos sintéticas ao mesmo tempo, primeiro
+com uma chamada inteira ao RapidOCR por documento e depois com os recortes das
+linhas juntados num lote. Também mede um documento sozinho, nos dois modos, para
+conferir que a latência de um único usuário não piora. Use AIH_OCR_MODELOS e
+AIH_OCR_THREADS para simular a máquina de produção.
+"""
+import argparse
+import difflib
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aih import pipeline
+from benchmarks.sinteticos import gerar_corpus
+
+
+def rodar(imagens: list, concorrencia: int, em_lote: bool) -> tuple:
+    """Reconhece as imagens com `concorrencia` sessões; retorna (textos, latências, segundos)."""
+    pipeline.OCR_LOTE = em_lote
+
+    def reconhecer(imagem):
+        inicio = time.perf_counter()
+        texto = pipeline.extract_text_from_array(imagem, preprocess=pipeline.preprocess_image_fast)
+        return texto, time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        resultados = list(executor.map(reconhecer, imagens))
+    decorrido = time.perf_counter() - inicio
+    textos, latencias = zip(*resultados)
+    return list(textos), list(latencias), decorrido
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Reconhecimento por documento × em lote entre documentos.")
+    parser.add_argument("-n", "--pacientes", type=int, default=1)
+    parser.add_argument("-c", "--concorrencia", type=int, default=2)
+    parser.add_argument("--variantes", nargs="*", default=["limpa", "inclinada"])
+    parser.add_argument("--janela-ms", type=float, help="prazo de espera do lote (AIH_OCR_LOTE_JANELA_MS)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    corpus = gerar_corpus(args.pacientes, args.seed, variantes=args.variantes)
+    imagens = [pipeline.decode_image(item["bytes"]) for item in corpus if item["tipo"] != "pdf"]
+    if args.janela_ms is not None:
+        pipeline.get_lote_reconhecimento().janela_s = args.janela_ms / 1000
+    pool = pipeline.get_ocr_pool()
+    print(f"🖼️ {len(imagens)} fotos, {args.concorrencia} sessões, pool de {pool.modelos} modelo(s) "
+          f"× {pool.threads} thread(s), janela {pipeline.get_lote_reconhecimento().janela_s * 1e3:.0f}ms")
+    # Aquecimento com um documento de verdade: a 1ª inferência com cada formato de entrada é mais lenta
+    rodar(imagens[:1], 1, False)
+
+    print(f"{'modo':<22} {'docs/s':>7} {'p50':>8} {'máx':>8} {'docs/lote':>9}")
+    textos = {}
+    for em_lote in (False, True):
+        nome = "em lote" if em_lote else "por documento"
+        for concorrencia, rotulo in ((1, f"{nome}, 1 sessão"), (args.concorrencia, nome)):
+            amostra = imagens[:1] if concorrencia == 1 else imagens
+            antes = pipeline.get_lote_reconhecimento().estado()
+            obtidos, latencias, decorrido = rodar(amostra, concorrencia, em_lote)
+            depois = pipeline.get_lote_reconhecimento().estado()
+            lotes = depois["lotes"] - antes["lotes"]
+            por_lote = (depois["documentos"] - antes["documentos"]) / lotes if lotes else 0
+            if concorrencia > 1:
+                textos[em_lote] = obtidos
+            print(f"{rotulo:<22} {len(amostra) / decorrido:>7.3f} {statistics.median(latencias):>7.2f}s "
+                  f"{max(latencias):>7.2f}s {(f'{por_lote:.1f}' if lotes else '-'):>8}")
+
+    # O padding do lote muda com os vizinhos, então o texto pode variar numa linha ou outra
+    pares = list(zip(textos[False], textos[True]))
+    iguais = sum(a == b for a, b in pares)
+    semelhanca = statistics.mean(difflib.SequenceMatcher(None, a, b).ratio() for a, b in pares)
+    print(f"📝 texto idêntico nos dois modos em {iguais}/{len(pares)} documentos "
+          f"(semelhança média {semelhanca:.1%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
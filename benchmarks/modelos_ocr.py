@@ -0,0 +1,119 @@
+"""
+Portão de acurácia e latência dos modelos INT8 do OCR (aih.modelos_ocr).
+
+Uso:
+    python -m aih.modelos_ocr quantizar                  # gera os modelos INT8
+    python -m benchmarks.modelos_ocr                     # 3 pacientes x 5 fotos
+    python -m benchmarks.modelos_ocr -n 10 --max-queda 0 --min-speedup 1.2
+
+Roda o pipeline nas fotos do corpus sintético duas vezes, com os modelos FP32
+e com os INT8 (cada um com o pool de OCR recriado e aquecido), e compara a
+acurácia por campo e a latência média por documento. A variante é aprovada se
+a acurácia geral não cair mais que --max-queda e se ficar pelo menos
+--min-speedup vezes mais rápida. O veredito vai para aprovacao.json, na pasta
+dos modelos, com o SHA-256 de cada modelo: só com ele AIH_OCR_VARIANTE=int8
+tem efeito. As PDFs com camada de texto não passam pelo OCR e ficam de fora.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from aih import modelos_ocr, pipeline
+from aih.cache import PIPELINE_VERSION
+from aih.pipeline import CAMPOS_LAUDO
+from benchmarks.laudos import avaliar, commit_atual
+from benchmarks.sinteticos import VARIANTES_FOTO, gerar_corpus
+
+
+def medir_variante(variante: str, corpus: list) -> dict:
+    """Avalia o corpus com um pool de OCR novo, carregado com `variante`."""
+    modelos_ocr.VARIANTE = variante
+    pipeline.get_lote_reconhecimento.cache_clear()
+    pipeline.get_ocr_pool.cache_clear()
+    pipeline.get_indice_duplicatas().clear()
+    # A carga e a primeira inferência não entram na latência
+    pipeline.aquecer_ocr()
+    resultado = avaliar(corpus)
+    return {
+        "acuracia_geral": resultado["acuracia_geral"],
+        "acuracia": resultado["acuracia"],
+        "latencia_media_s": round(resultado["duracao_s"] / resultado["documentos"], 4),
+        "ocr_media_s": resultado["etapas"].get("ocr", {}).get("media_s"),
+        "nivel_ocr": resultado["nivel_ocr"],
+    }
+
+
+def veredito(fp32: dict, int8: dict, max_queda: float, min_speedup: float) -> list:
+    """Motivos de reprovação (lista vazia: aprovada)."""
+    motivos = []
+    queda = fp32["acuracia_geral"] - int8["acuracia_geral"]
+    if queda > max_queda:
+        motivos.append(f"acurácia {fp32['acuracia_geral']:.1%} → {int8['acuracia_geral']:.1%} "
+                       f"(queda de {queda:.1%}, máximo {max_queda:.1%})")
+    speedup = fp32["latencia_media_s"] / int8["latencia_media_s"]
+    if speedup < min_speedup:
+        motivos.append(f"latência {fp32['latencia_media_s']:.2f}s → {int8['latencia_media_s']:.2f}s "
+                       f"por documento ({speedup:.2f}x, mínimo {min_speedup:.2f}x)")
+    return motivos
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Portão INT8 × FP32 do OCR no corpus sintético.")
+    parser.add_argument("-n", "--pacientes", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--variantes", nargs="*", default=VARIANTES_FOTO,
+                        help=f"variantes de foto ({', '.join(VARIANTES_FOTO)})")
+    parser.add_argument("--pasta", type=Path, default=modelos_ocr.PASTA_MODELOS,
+                        help="pasta dos modelos INT8 (AIH_OCR_MODELOS_DIR)")
+    parser.add_argument("--max-queda", type=float, default=0.01,
+                        help="queda máxima da acurácia geral (fração)")
+    parser.add_argument("--min-speedup", type=float, default=1.0,
+                        help="latência FP32 / INT8 mínima por documento")
+    args = parser.parse_args(argv)
+
+    modelos_ocr.PASTA_MODELOS = args.pasta
+    if not modelos_ocr.modelos_int8():
+        print(f"❌ Sem modelos INT8 em {args.pasta} (python -m aih.modelos_ocr quantizar)")
+        return 2
+    modelos_ocr.EXIGIR_APROVACAO = False
+
+    corpus = [item for item in gerar_corpus(args.pacientes, args.seed, args.variantes) if not item["is_pdf"]]
+    print(f"🖼️ {len(corpus)} fotos, {', '.join(modelos_ocr.modelos_int8())} em INT8, "
+          f"pool de OCR com {pipeline.get_ocr_pool().threads} thread(s) por modelo")
+    medidas = {}
+    for variante in ("fp32", "int8"):
+        inicio = time.perf_counter()
+        medidas[variante] = medir_variante(variante, corpus)
+        m = medidas[variante]
+        print(f"  {variante:<5} acurácia {m['acuracia_geral']:.1%}  {m['latencia_media_s']:.2f}s/doc  "
+              f"ocr {m['ocr_media_s']}s/chamada  ({time.perf_counter() - inicio:.0f}s)")
+
+    print("\n🎯 Campos com acurácia diferente (fp32 → int8):")
+    for tipo, campos in medidas["fp32"]["acuracia"].items():
+        for campo in CAMPOS_LAUDO:
+            a, b = campos[campo], medidas["int8"]["acuracia"][tipo][campo]
+            if a != b:
+                print(f"  {tipo:<20} {campo:<24} {a:.0%} → {b:.0%}")
+
+    motivos = veredito(medidas["fp32"], medidas["int8"], args.max_queda, args.min_speedup)
+    metricas = {
+        "commit": commit_atual(),
+        "versao_pipeline": PIPELINE_VERSION,
+        "config": {"pacientes": args.pacientes, "seed": args.seed, "variantes": args.variantes,
+                   "max_queda": args.max_queda, "min_speedup": args.min_speedup},
+        "quantizacao": modelos_ocr.ler_quantizacao(args.pasta),
+        "fp32": medidas["fp32"],
+        "int8": medidas["int8"],
+    }
+    destino = modelos_ocr.registrar_aprovacao(args.pasta, not motivos, motivos, metricas)
+    if motivos:
+        print(f"\n❌ Reprovada: {'; '.join(motivos)}")
+    else:
+        print("\n✅ Aprovada: AIH_OCR_VARIANTE=int8 passa a carregar estes modelos")
+    print(f"💾 Veredito gravado em {destino}")
+    return 1 if motivos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Micro-benchmark dos parsers de texto: uma busca por padrão × scanner de uma passada.
+
+Uso:
+    python -m benchmarks.scanner                 # textos de 1, 10 e 50 páginas
+    python -m benchmarks.scanner --paginas 1 100 --repeticoes 50
+
+As implementações anteriores (um re.search/re.sub por padrão, compilando a cada
+chamada) ficam aqui como referência; o benchmark confere que as duas versões
+produzem o mesmo resultado antes de medir.
+"""
+import argparse
+import random
+import re
+import sys
+import time
+import unicodedata
+
+from aih import pipeline
+from benchmarks.sinteticos import gerar_paciente, linhas_identificacao
+
+PALAVRAS_FILLER = ["paciente", "internacao", "hemocomponente", "transfusao", "CONCENTRADO", "hemacias",
+                   "plaquetas", "volume", "ml", "urgencia", "1/2/25", "assinatura", "carimbo", "medico", "CRM"]
+# Erros típicos de OCR, um de cada por página
+ERROS_OCR = ["Solicltante", "TeI", "Municipiode", "Nomedo", "DOSSA NTOS", "ABORTORETIDODE"]
+
+
+# --- Implementações de referência (uma varredura do texto por padrão) ---
+
+def referencia_post_process(text: str) -> str:
+    if not text:
+        return text
+    ocr_corrections = {
+        r'\baS\b': 'às',
+        r'\bde[Ss]aide\b': 'de Saúde',
+        r'\bTeI\b': 'Tel',
+        r'\bEsiado\b': 'Estado',
+        r'\bGOVERNODOE[Ss]IADO\b': 'GOVERNO DO ESTADO',
+    }
+    corrected_text = text
+    for pattern, replacement in ocr_corrections.items():
+        corrected_text = re.sub(pattern, replacement, corrected_text, flags=re.IGNORECASE)
+    return re.sub(r'\b[A-ZÀÁÂÃÄÅÆÇÈÉÊËÌÍÎÏÐÑÒÓÔÕÖØÙÚÛÜÝÞ]{15,}\b',
+                  lambda m: pipeline.separate_long_uppercase(m.group(0)), corrected_text)
+
+
+def referencia_fix_broken_words(text: str) -> str:
+    if not text:
+        return text
+    word_fixes = {
+        r'DOSSA\s+NTOS': 'DOS SANTOS',
+        r'A\s+NATA\s*LIABA\s*RBOSA': 'ANATALIA BARBOSA',
+        r'A\s+NATA\s*LIA': 'ANATALIA',
+        r'BA\s+RBOSA': 'BARBOSA',
+        r'Nomedo': 'Nome do',
+        r'Solicltante': 'Solicitante',
+        r'CURETAGEMPOS': 'CURETAGEM POS',
+        r'ABORTORETIDO': 'ABORTO RETIDO',
+        r'RETIDODE': 'RETIDO DE',
+        r'SANGRAMENTOVAGINAL': 'SANGRAMENTO VAGINAL',
+        r'Telefonede': 'Telefone de',
+        r'Municipiode': 'Municipio de',
+    }
+    fixed_text = text
+    for pattern, replacement in word_fixes.items():
+        fixed_text = re.sub(pattern, replacement, fixed_text, flags=re.IGNORECASE)
+    return re.sub(r'\b([A-Z])\s+([A-Z]{1,3})\s+([A-Z]{2,})',
+                  lambda m: m.group(1) + m.group(2) + m.group(3) if len(m.group(2)) <= 2 else m.group(0),
+                  fixed_text)
+
+
+def referencia_extract_medical_codes(text: str) -> dict:
+    codes = {}
+    cid_match = re.search(r'CID\s*10\s*Principal[^A-Z0-9]*([A-Z]\d{2,3})', text, re.IGNORECASE)
+    if cid_match:
+        codes['cid10'] = cid_match.group(1)
+    proc_match = re.search(r'Codigo\s*do\s*Procedimento[^\d]*(\d{10})', text, re.IGNORECASE)
+    if proc_match:
+        codes['codigo_procedimento'] = proc_match.group(1)
+    cnes_match = re.search(r'CNES[^\d]*(\d{7})', text, re.IGNORECASE)
+    if cnes_match:
+        codes['cnes'] = cnes_match.group(1)
+    return codes
+
+
+def referencia_formatar_texto_debug(text: str) -> str:
+    if not text:
+        return "Nenhum texto extraído."
+    formatted = text
+    for marker in ['Identificacao do Estabelecimento', 'Identificacao do Paciente', 'Nome do Paciente',
+                   'Data de Nasc', 'Endereco Residencial', 'Justificativa da Internacao',
+                   'Diagnostico Inicial', 'Procedimento Solicitado', 'AUTORIZACAO']:
+        formatted = formatted.replace(marker, f'\n\n{marker}')
+    formatted = re.sub(r'(CNS\s+\d+)', r'\1\n', formatted)
+    formatted = re.sub(r'(CPF\s+[\d.-]+)', r'\1\n', formatted)
+    formatted = re.sub(r'(CEP\s+[\d.-]+)', r'\1\n', formatted)
+    formatted = re.sub(r'(Telefone[^)]+\))', r'\1\n', formatted)
+    formatted = re.sub(r'\n{3,}', '\n\n', formatted)
+    return formatted.strip()
+
+
+def _so_digitos_campos(data: dict) -> dict:
+    for campo in ("cartao_sus", "cep", "cpf", "telefone_paciente"):
+        if data.get(campo):
+            data[campo] = pipeline.so_digitos(data[campo])
+    return data
+
+
+def referencia_parse_pdf_text(full_text: str) -> dict:
+    data = {}
+    for field, pattern in PADROES_PDF.items():
+        match = re.search(pattern, full_text, re.IGNORECASE)
+        if match:
+            data[field] = pipeline.limpar_texto(match.group(1))
+    return _so_digitos_campos(data)
+
+
+def referencia_parse_ocr_text(full_text: str) -> dict:
+    data = {}
+    for field, pattern in PADROES_OCR.items():
+        match = re.search(pattern, full_text, re.IGNORECASE)
+        if match:
+            value = next((g for g in match.groups() if g is not None and not g.lower() in ['feminino', 'endereco']), None)
+            if value:
+                data[field] = pipeline.limpar_texto(value)
+    return _so_digitos_campos(data)
+
+
+# Mesmas expressões completas (rótulo + valor) do pipeline
+PADROES_PDF = {campo: p.pattern for campo, p in pipeline.SCANNER_PDF.padroes.items()}
+PADROES_OCR = {campo: p.pattern for campo, p in pipeline.SCANNER_OCR.padroes.items()}
+
+
+# --- Textos de teste ---
+
+def sem_acentos(texto: str) -> str:
+    return unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode()
+
+
+def gerar_texto(paginas: int, estilo: str, rng: random.Random) -> str:
+    """
+    Texto de várias páginas: identificação na 1ª, o resto é texto corrido.
+    No estilo "vazio" não há identificação (pior caso: nenhum campo é achado).
+    """
+    linhas = linhas_identificacao(gerar_paciente(rng))
+    identificacao = " ".join(linhas) if estilo == "pdf" else sem_acentos(" ".join(linhas))
+    partes = [] if estilo == "vazio" else [identificacao]
+    for _ in range(paginas - 1):
+        pagina = [rng.choice(PALAVRAS_FILLER) for _ in range(400)]
+        for erro in ERROS_OCR:
+            pagina[rng.randrange(len(pagina))] = erro
+        partes.append(" ".join(pagina))
+    return " ".join(partes)
+
+
+CASOS = [
+    ("parse_pdf_text", "pdf", referencia_parse_pdf_text, pipeline.parse_pdf_text.__wrapped__),
+    ("parse_ocr_text", "ocr", referencia_parse_ocr_text, pipeline.parse_ocr_text.__wrapped__),
+    ("parse_ocr_text (vazio)", "vazio", referencia_parse_ocr_text, pipeline.parse_ocr_text.__wrapped__),
+    ("post_process_ocr_text", "ocr", referencia_post_process, pipeline.post_process_ocr_text),
+    ("fix_broken_words", "ocr", referencia_fix_broken_words, pipeline.fix_broken_words),
+    ("extract_medical_codes", "ocr", referencia_extract_medical_codes, pipeline.extract_medical_codes.__wrapped__),
+    ("extract_medical_codes (vazio)", "vazio", referencia_extract_medical_codes,
+     pipeline.extract_medical_codes.__wrapped__),
+    ("formatar_texto_debug", "ocr", referencia_formatar_texto_debug, pipeline.formatar_texto_debug),
+]
+
+
+def medir(func, texto: str, repeticoes: int) -> float:
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        func(texto)
+    return (time.perf_counter() - inicio) / repeticoes
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmark dos parsers de texto.")
+    parser.add_argument("--paginas", type=int, nargs="*", default=[1, 10, 50])
+    parser.add_argument("--repeticoes", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    print(f"{'função':<30} {'páginas':>7} {'anterior':>12} {'scanner':>12} {'ganho':>7}")
+    for paginas in args.paginas:
+        textos = {estilo: gerar_texto(paginas, estilo, rng) for estilo in ("pdf", "ocr", "vazio")}
+        for nome, estilo, referencia, atual in CASOS:
+            texto = textos[estilo]
+            if referencia(texto) != atual(texto):
+                print(f"❌ {nome}: resultado diferente da referência ({paginas} páginas)", file=sys.stderr)
+                return 1
+            t_ref = medir(referencia, texto, args.repeticoes)
+            t_atual = medir(atual, texto, args.repeticoes)
+            print(f"{nome:<30} {paginas:>7} {t_ref * 1e3:>10.3f}ms {t_atual * 1e3:>10.3f}ms {t_ref / t_atual:>6.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
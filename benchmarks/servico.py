@@ -0,0 +1,119 @@
+"""
+Cliente de carga do serviço HTTP (aih.servico) com laudos sintéticos.
+
+Uso:
+    python -m aih.servico --porta 8080 &
+    python -m benchmarks.servico -n 5 --concorrencia 8
+    python -m benchmarks.servico --url http://10.0.0.5:8080 -n 20 --so-pdf
+
+Cada documento é enviado por POST /laudos e acompanhado por /eventos até o
+resultado final. Mede o tempo até o primeiro campo extraído e até o final,
+docs/s e acurácia por tipo. No fim, reenvia um documento para conferir que o
+serviço responde pelo hash sem processar de novo.
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from aih.pipeline import CAMPOS_LAUDO
+from benchmarks.laudos import normalizar
+from benchmarks.sinteticos import gerar_corpus
+
+
+def enviar(url: str, corpo: bytes) -> tuple:
+    requisicao = urllib.request.Request(f"{url}/laudos", data=corpo, method="POST",
+                                        headers={"Content-Type": "application/octet-stream"})
+    try:
+        with urllib.request.urlopen(requisicao) as resposta:
+            return resposta.status, json.load(resposta)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def acompanhar(url: str, doc_id: str) -> list:
+    """Lê o fluxo de eventos do documento; retorna [(segundos desde o início, evento)]."""
+    inicio = time.perf_counter()
+    eventos = []
+    with urllib.request.urlopen(f"{url}/laudos/{doc_id}/eventos") as resposta:
+        for linha in resposta:
+            if linha.strip():
+                eventos.append((time.perf_counter() - inicio, json.loads(linha)))
+    return eventos
+
+
+def processar(url: str, item: dict) -> dict:
+    inicio = time.perf_counter()
+    status, corpo = enviar(url, item["bytes"])
+    linha = {"tipo": item["tipo"], "status_envio": status}
+    if status not in (200, 202):
+        linha["erro"] = corpo.get("erro")
+        return linha
+    envio = time.perf_counter() - inicio
+    eventos = acompanhar(url, corpo["id"])
+    primeiros = [t for t, ev in eventos if ev["evento"] == "campo"]
+    t_final, final = eventos[-1]
+    linha["primeiro_campo_s"] = envio + primeiros[0] if primeiros else None
+    linha["final_s"] = envio + t_final
+    if final["evento"] == "erro":
+        linha["erro"] = final["erro"]
+        return linha
+    dados = final["resultado"]["dados"]
+    linha["acertos"] = sum(
+        bool(esperado) and esperado == normalizar(campo, dados.get(campo))
+        for campo in CAMPOS_LAUDO
+        for esperado in [normalizar(campo, item["verdade"].get(campo))])
+    linha["campos"] = len(CAMPOS_LAUDO)
+    return linha
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Teste de carga do serviço HTTP de extração.")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("-n", "--pacientes", type=int, default=3)
+    parser.add_argument("-c", "--concorrencia", type=int, default=4)
+    parser.add_argument("--so-pdf", action="store_true", help="envia só os PDFs (sem fotos)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    # Com a mesma seed os documentos se repetem: numa 2ª execução o serviço responde pelo cache
+    corpus = gerar_corpus(args.pacientes, args.seed, variantes=[] if args.so_pdf else None)
+    print(f"📤 {len(corpus)} documentos, {args.concorrencia} envios simultâneos → {args.url}")
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+        linhas = list(executor.map(lambda item: processar(args.url, item), corpus))
+    decorrido = time.perf_counter() - inicio
+
+    por_tipo = defaultdict(list)
+    for linha in linhas:
+        por_tipo[linha["tipo"]].append(linha)
+    print(f"{'tipo':<20} {'docs':>5} {'1º campo':>11} {'final p50':>10} {'final máx':>10} {'acurácia':>9}")
+    for tipo, itens in por_tipo.items():
+        ok = [i for i in itens if "erro" not in i]
+        finais = [i["final_s"] for i in ok]
+        primeiros = [i["primeiro_campo_s"] for i in ok if i["primeiro_campo_s"] is not None]
+        acertos = sum(i["acertos"] for i in ok)
+        campos = sum(i["campos"] for i in ok) or 1
+        print(f"{tipo:<20} {len(itens):>5} "
+              f"{(f'{statistics.median(primeiros):.2f}s' if primeiros else '-'):>11} "
+              f"{(f'{statistics.median(finais):.2f}s' if finais else '-'):>10} "
+              f"{(f'{max(finais):.2f}s' if finais else '-'):>10} {acertos / campos:>8.1%}")
+    erros = [linha for linha in linhas if "erro" in linha]
+    for linha in erros:
+        print(f"❌ {linha['tipo']}: HTTP {linha['status_envio']} {linha['erro']}", file=sys.stderr)
+    print(f"⚡ {len(linhas) / decorrido:.2f} docs/s ({decorrido:.1f}s no total)")
+
+    # Reenvio: o mesmo hash deve voltar na hora, já concluído
+    inicio = time.perf_counter()
+    status, corpo = enviar(args.url, corpus[0]["bytes"])
+    print(f"🔁 reenvio: HTTP {status}, status {corpo.get('status')}, {time.perf_counter() - inicio:.3f}s")
+    return 1 if erros or corpo.get("status") != "concluido" else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""
+Gerador de laudos sintéticos a partir do modelo_hemo.pdf.
+
+Cada paciente sintético tem CPF, CNS e CEP válidos. O laudo é gerado como PDF
+com camada de texto (bloco de identificação preenchido sobre o modelo) e como
+"foto de celular" degradada: perspectiva, inclinação, desfoque e pouca luz.
+
+Com formulario=True, o corpus é só de fotos do próprio formulário do
+modelo_hemo.pdf, sem nada coberto nem redesenhado: os valores são escritos nas
+células impressas, a partir de PONTOS_FORMULARIO (lidos a olho na página
+renderizada, independentes de aih.layout). Só os campos que o formulário tem
+entram no gabarito.
+"""
+import json
+import random
+from pathlib import Path
+
+import cv2
+import fitz
+import numpy as np
+
+MODELO_PDF = Path(__file__).resolve().parent.parent / "modelo_hemo.pdf"
+
+# Área do bloco de identificação do modelo (em pontos), coberta e preenchida
+AREA_IDENTIFICACAO = fitz.Rect(20, 50, 592, 195)
+
+# Onde se escreve cada valor no formulário: campo → (x do início, linha base, x da linha
+# que fecha a célula), em pontos. A fonte diminui para o valor caber até a linha
+PONTOS_FORMULARIO = {
+    "data_laudo": (483, 70, 515),
+    "nome_paciente": (115, 94, 460),
+    "nome_genitora": (364, 116, 579),
+    "prontuario": (406, 143.5, 460),
+    "cartao_sus": (496, 138, 579),
+    "endereco_completo": (44, 175.5, 402),
+    "cep": (64, 192, 104),
+    "uf": (172, 192, 212),
+    "municipio_referencia": (288, 192, 350),
+    "data_nascimento": (42, 227, 98),
+    "sexo": (120, 221, 140),
+    "raca": (222, 221, 241),
+    "diagnostico": (462, 227, 579),
+}
+
+VARIANTES_FOTO = ["limpa", "inclinada", "borrada", "perspectiva", "escura"]
+
+PRENOMES = ["MARIA", "ANA", "JULIANA", "FERNANDA", "PATRICIA", "CAMILA", "JOSE", "JOAO",
+            "ANTONIO", "FRANCISCO", "CARLOS", "PAULO", "LUCAS", "RAFAEL", "GABRIEL"]
+SOBRENOMES = ["SILVA", "SANTOS", "OLIVEIRA", "SOUZA", "RODRIGUES", "FERREIRA", "ALVES",
+              "PEREIRA", "LIMA", "GOMES", "COSTA", "RIBEIRO", "MARTINS", "CARVALHO", "BARBOSA"]
+LOGRADOUROS = ["RUA DAS FLORES", "RUA SAO JOSE", "AVENIDA BRASIL", "RUA SANTA LUZIA",
+               "TRAVESSA DO COMERCIO", "RUA NOSSA SENHORA DE FATIMA"]
+MUNICIPIOS = [("RECIFE", "PE", "2611606"), ("SALVADOR", "BA", "2927408"),
+              ("FORTALEZA", "CE", "2304400"), ("CAMPINAS", "SP", "3509502"),
+              ("BELO HORIZONTE", "MG", "3106200"), ("CURITIBA", "PR", "4106902")]
+DIAGNOSTICOS = [("ABORTO RETIDO", "O021"), ("SANGRAMENTO VAGINAL", "N939"),
+                ("ANEMIA FERROPRIVA", "D509"), ("HEMORRAGIA POS PARTO", "O720"),
+                ("PNEUMONIA", "J189")]
+RACAS = ["BRANCA", "PRETA", "PARDA", "AMARELA", "INDIGENA"]
+
+
+def gerar_cpf(rng: random.Random) -> str:
+    """Gera um CPF válido (11 dígitos)."""
+    base = [rng.randint(0, 9) for _ in range(9)]
+    while len(set(base)) == 1:
+        base = [rng.randint(0, 9) for _ in range(9)]
+    for peso_inicial in (10, 11):
+        soma = sum(d * (peso_inicial - i) for i, d in enumerate(base))
+        digito = 11 - soma % 11
+        base.append(0 if digito > 9 else digito)
+    return "".join(map(str, base))
+
+
+def gerar_cns(rng: random.Random) -> str:
+    """Gera um CNS provisório válido (15 dígitos, começando com 7, 8 ou 9)."""
+    while True:
+        base = [rng.choice([7, 8, 9])] + [rng.randint(0, 9) for _ in range(13)]
+        soma = sum(d * (15 - i) for i, d in enumerate(base))
+        digito = (11 - soma % 11) % 11
+        if digito < 10:
+            return "".join(map(str, base + [digito]))
+
+
+def gerar_paciente(rng: random.Random) -> dict:
+    """Gera os dados verdadeiros de um paciente sintético."""
+    feminino = rng.random() < 0.7
+    prenome = rng.choice(PRENOMES[:6] if feminino else PRENOMES[6:])
+    municipio, uf, ibge = rng.choice(MUNICIPIOS)
+    diagnostico, cid = rng.choice(DIAGNOSTICOS)
+    ddd = rng.randint(11, 99)
+    return {
+        "nome_paciente": f"{prenome} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}",
+        "cartao_sus": gerar_cns(rng),
+        "nome_genitora": f"{rng.choice(PRENOMES[:6])} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}",
+        "data_nascimento": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1940, 2020)}",
+        "sexo": "Feminino" if feminino else "Masculino",
+        "raca": rng.choice(RACAS),
+        "telefone_paciente": f"{ddd}9{rng.randint(10000000, 99999999)}",
+        "prontuario": str(rng.randint(10000, 999999)),
+        "endereco_completo": f"{rng.choice(LOGRADOUROS)}, {rng.randint(1, 2000)}",
+        "municipio_referencia": municipio,
+        "uf": uf,
+        "cep": f"{rng.randint(10000000, 99999999)}",
+        "cpf": gerar_cpf(rng),
+        "diagnostico": diagnostico,
+        "cid10": cid,
+        "codigo_procedimento": f"04{rng.randint(10000000, 99999999)}",
+        "cnes": f"{rng.randint(1000000, 9999999)}",
+        "_ibge": ibge,
+    }
+
+
+def linhas_identificacao(p: dict) -> list:
+    """Linhas do bloco de identificação, com os rótulos do laudo AIH."""
+    cpf = f"{p['cpf'][:3]}.{p['cpf'][3:6]}.{p['cpf'][6:9]}-{p['cpf'][9:]}"
+    cep = f"{p['cep'][:5]}-{p['cep'][5:]}"
+    tel = f"({p['telefone_paciente'][:2]}) {p['telefone_paciente'][2:7]}-{p['telefone_paciente'][7:]}"
+    return [
+        f"Nome do Paciente {p['nome_paciente']}    CNS {p['cartao_sus']}",
+        f"Data de Nasc {p['data_nascimento']}    Sexo {p['sexo']}    Raça/cor {p['raca']}    Nome do Responsável",
+        f"Nome da Mãe {p['nome_genitora']}",
+        f"Endereço Residencial (Rua, Av etc) {p['endereco_completo']}",
+        f"CPF {cpf}    Municipio de Referência {p['municipio_referencia']}    Cód. IBGE {p['_ibge']}",
+        f"UF {p['uf']}    CEP {cep}    Diretor Clinico",
+        f"Núm. Prontuário {p['prontuario']}    Telefone de Contato {tel}    Telefone Celular",
+        f"Diagnóstico Inicial {p['diagnostico']}    CID 10 Principal {p['cid10']}",
+        f"Codigo do Procedimento {p['codigo_procedimento']}    CNES {p['cnes']}",
+    ]
+
+
+def renderizar_pdf(paciente: dict) -> bytes:
+    """Preenche o modelo com os dados do paciente e devolve um PDF com camada de texto."""
+    doc = fitz.open(MODELO_PDF)
+    page = doc[0]
+    page.draw_rect(AREA_IDENTIFICACAO, color=None, fill=(1, 1, 1))
+    y = AREA_IDENTIFICACAO.y0 + 12
+    for linha in linhas_identificacao(paciente):
+        page.insert_text((AREA_IDENTIFICACAO.x0 + 6, y), linha, fontsize=8, fontname="helv")
+        y += 15
+    pdf_bytes = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    return pdf_bytes
+
+
+def preencher_formulario(paciente: dict, data_laudo: str) -> bytes:
+    """
+    Escreve os valores do paciente nas células do formulário do modelo, sem cobrir
+    nem redesenhar nada do que está impresso, e devolve o PDF.
+    """
+    valores = {**paciente, "sexo": "FEM" if paciente["sexo"] == "Feminino" else "MASC",
+               "cep": f"{paciente['cep'][:5]}-{paciente['cep'][5:]}", "data_laudo": data_laudo}
+    with fitz.open(MODELO_PDF) as doc:
+        page = doc[0]
+        for campo, (x, y, limite) in PONTOS_FORMULARIO.items():
+            texto = valores[campo]
+            largura = fitz.get_text_length(texto, fontname="helv", fontsize=8)
+            tamanho = min(8.0, 8.0 * (limite - x - 2) / largura)
+            page.insert_text((x, y), texto, fontsize=tamanho, fontname="helv")
+        return doc.tobytes(garbage=3, deflate=True)
+
+
+def renderizar_foto(pdf_bytes: bytes, variante: str, rng: random.Random, dpi: int = 150) -> bytes:
+    """Simula uma foto de celular do laudo impresso e devolve um JPEG."""
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    pix = doc[0].get_pixmap(dpi=dpi)
+    pagina = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)[:, :, :3]
+    pagina = cv2.cvtColor(pagina, cv2.COLOR_RGB2BGR)
+    doc.close()
+
+    h, w = pagina.shape[:2]
+    margem = int(0.08 * max(h, w))
+    # Fundo de mesa, com a folha no meio
+    fundo = np.full((h + 2 * margem, w + 2 * margem, 3), (70, 90, 110), dtype=np.uint8)
+    origem = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+    destino = origem + margem
+    if variante == "perspectiva":
+        destino += np.float32([[rng.uniform(-1, 1) * margem * 0.7 for _ in range(2)] for _ in range(4)])
+    M = cv2.getPerspectiveTransform(origem, destino)
+    foto = cv2.warpPerspective(pagina, M, (fundo.shape[1], fundo.shape[0]), dst=fundo,
+                               borderMode=cv2.BORDER_TRANSPARENT)
+
+    if variante == "inclinada":
+        angulo = rng.uniform(2, 6) * rng.choice([-1, 1])
+        R = cv2.getRotationMatrix2D((foto.shape[1] / 2, foto.shape[0] / 2), angulo, 1.0)
+        foto = cv2.warpAffine(foto, R, (foto.shape[1], foto.shape[0]), borderValue=(70, 90, 110))
+    if variante == "borrada":
+        foto = cv2.GaussianBlur(foto, (7, 7), 0)
+    if variante == "escura":
+        foto = np.clip((foto.astype(np.float32) / 255.0) ** 1.8 * 255 * 0.55, 0, 255).astype(np.uint8)
+
+    # Ruído de sensor leve em todas as fotos
+    ruido = np.random.default_rng(rng.randint(0, 2**31)).normal(0, 4, foto.shape)
+    foto = np.clip(foto.astype(np.float32) + ruido, 0, 255).astype(np.uint8)
+    _, buffer = cv2.imencode(".jpg", foto, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return buffer.tobytes()
+
+
+def gerar_corpus(n_pacientes: int, seed: int = 42, variantes: list = None,
+                 formulario: bool = False) -> list:
+    """
+    Gera o corpus sintético de forma determinística.
+    Retorna uma lista de dicts: nome, tipo ("pdf" ou "foto_<variante>"), bytes,
+    is_pdf e verdade (campos esperados). Com formulario=True, só fotos do
+    formulário preenchido (veja preencher_formulario).
+    """
+    rng = random.Random(seed)
+    variantes = VARIANTES_FOTO if variantes is None else variantes
+    corpus = []
+    for i in range(n_pacientes):
+        paciente = gerar_paciente(rng)
+        verdade = {k: v for k, v in paciente.items() if not k.startswith("_")}
+        if formulario:
+            data_laudo = f"{(i % 28) + 1:02d}/{(i % 12) + 1:02d}/2025"
+            pdf_bytes = preencher_formulario(paciente, data_laudo)
+            verdade = {k: v for k, v in verdade.items() if k in PONTOS_FORMULARIO}
+            verdade["data_laudo"] = data_laudo
+            for variante in variantes:
+                corpus.append({"nome": f"formulario_{i:03d}_{variante}.jpg", "tipo": f"foto_{variante}",
+                               "bytes": renderizar_foto(pdf_bytes, variante, rng),
+                               "is_pdf": False, "verdade": verdade})
+            continue
+        pdf_bytes = renderizar_pdf(paciente)
+        corpus.append({"nome": f"laudo_{i:03d}.pdf", "tipo": "pdf", "bytes": pdf_bytes,
+                       "is_pdf": True, "verdade": verdade})
+        for variante in variantes:
+            corpus.append({"nome": f"laudo_{i:03d}_{variante}.jpg", "tipo": f"foto_{variante}",
+                           "bytes": renderizar_foto(pdf_bytes, variante, rng),
+                           "is_pdf": False, "verdade": verdade})
+    return corpus
+
+
+def salvar_corpus(corpus: list, pasta: Path) -> None:
+    """Grava os arquivos do corpus e um gabarito.jsonl com os campos esperados."""
+    pasta.mkdir(parents=True, exist_ok=True)
+    with open(pasta / "gabarito.jsonl", "w", encoding="utf-8") as f:
+        for item in corpus:
+            (pasta / item["nome"]).write_bytes(item["bytes"])
+            f.write(json.dumps({"arquivo": item["nome"], "tipo": item["tipo"],
+                                "verdade": item["verdade"]}, ensure_ascii=False) + "\n")